@@ -0,0 +1,51 @@
+"""Benchmarks the parallel decoding modes of `read_stems`
+"""
+import argparse
+import timeit
+
+import stempeg
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'input',
+        nargs='?',
+        default=stempeg.example_stem_path()
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=10
+    )
+    args = parser.parse_args()
+
+    info = stempeg.Info(args.input)
+    modes = {
+        'sequential': {},
+        'multiprocess': {'multiprocess': True},
+        'multithread': {'multithread': True},
+        'merge_streams': {'merge_streams': True},
+    }
+
+    for name, kwargs in modes.items():
+        seconds = timeit.timeit(
+            lambda: stempeg.read_stems(args.input, info=info, **kwargs),
+            number=args.repeat
+        ) / args.repeat
+        print("%-15s %8.2f ms" % (name, seconds * 1000))
+
+    with stempeg.StemReader(executor='process') as reader:
+        reader.read(args.input, info=info)
+        seconds = timeit.timeit(
+            lambda: reader.read(args.input, info=info),
+            number=args.repeat
+        ) / args.repeat
+        print("%-15s %8.2f ms" % ('process pool', seconds * 1000))
+
+    with stempeg.StemReader(executor='thread') as reader:
+        seconds = timeit.timeit(
+            lambda: reader.read(args.input, info=info),
+            number=args.repeat
+        ) / args.repeat
+        print("%-15s %8.2f ms" % ('thread pool', seconds * 1000))
@@ -7,30 +7,88 @@ Under the hood, _stempeg_ uses [ffmpeg](https://www.ffmpeg.org/) for reading and
 
 - `stempeg.read`: reading audio tensors and metadata.
 - `stempeg.write`: writing audio tensors.
+- `stempeg.cache`: caching metadata and decoded audio across runs.
+- `stempeg.store`: chunked stem store for fast random access reading.
+- `stempeg.mp4`: writing Native Instruments stem metadata without MP4Box.
+- `stempeg.wav`: memory-mapped reading of uncompressed WAV files.
+- `stempeg.backends`: backends for probing, decoding and encoding.
 
 ![stempeg_scheme](https://user-images.githubusercontent.com/72940/102477776-16960a00-405d-11eb-9389-1ea9263cf99d.png)
 
 Please checkout [the Github repository](https://github.com/faroit/stempeg) for more information.
 """
 
-from .read import read_stems
-from .read import Info
-from .read import StreamsReader, ChannelsReader
-from .write import write_stems
-from .write import write_audio
-from .write import FilesWriter, StreamsWriter, ChannelsWriter, NIStemsWriter
+import importlib
 
+from . import cmds
 from .cmds import check_available_aac_encoders
 
-import re
-import os
-import subprocess as sp
-from os import path as op
-import argparse
-from importlib.resources import files, as_file  # Python 3.9+
-
 __version__ = "0.2.6"
 
+# public names and the submodule that provides them. The submodules, and
+# thereby numpy and ffmpeg-python, are imported on first access, so that
+# `import stempeg` stays fast and has no side effects.
+_lazy_attributes = {
+    'read_stems': 'read',
+    'stream_stems': 'read',
+    'read_stems_batch': 'read',
+    'read_stems_async': 'read',
+    'Info': 'read',
+    'StreamsReader': 'read',
+    'ChannelsReader': 'read',
+    'StemReader': 'read',
+    'write_stems': 'write',
+    'write_audio': 'write',
+    'write_stems_async': 'write',
+    'write_audio_async': 'write',
+    'transcode': 'write',
+    'StemsStreamWriter': 'write',
+    'FilesWriter': 'write',
+    'StreamsWriter': 'write',
+    'ChannelsWriter': 'write',
+    'NIStemsWriter': 'write',
+    'InfoCache': 'cache',
+    'PCMCache': 'cache',
+    'TrackCache': 'cache',
+    'StemStore': 'store',
+    'read_store': 'store',
+    'write_store': 'store',
+    'convert_to_store': 'store',
+    'export_store': 'store',
+    'set_backend': 'backends',
+    'get_backend': 'backends',
+}
+
+__all__ = [
+    'example_stem_path',
+    'default_metadata',
+    'ffmpeg_version',
+    'check_available_aac_encoders',
+    'cmds',
+] + list(_lazy_attributes)
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        module = importlib.import_module(
+            '.' + _lazy_attributes[name], __name__
+        )
+        value = getattr(module, name)
+        # cache the attribute, so that `__getattr__` is bypassed next time
+        globals()[name] = value
+        return value
+    if name in (
+        'read', 'write', 'cache', 'store', 'mp4', 'wav', 'cli', 'backends'
+    ):
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
+
 
 def example_stem_path():
     """Get the path to an included stem file.
@@ -40,6 +98,8 @@ def example_stem_path():
     filename : str
         Filesystem path to the stem file (temp path if package is zipped)
     """
+    from importlib.resources import files, as_file  # Python 3.9+
+
     rel_path = "data/The Easton Ellises - Falcon 69.stem.mp4"
     ref = files("stempeg").joinpath(rel_path)
     try:
@@ -58,6 +118,8 @@ def default_metadata():
     filename : str
         Filesystem path to the json file (temp path if package is zipped)
     """
+    from importlib.resources import files, as_file  # Python 3.9+
+
     rel_path = "data/default_metadata.json"
     ref = files("stempeg").joinpath(rel_path)
     try:
@@ -70,27 +132,13 @@ def default_metadata():
 def ffmpeg_version():
     """Returns the available ffmpeg version
 
+    The version is detected once, see `stempeg.cmds.capabilities()`.
+
     Returns
     ----------
     version : str
         version number as string
     """
-
-    cmd = [
-        'ffmpeg',
-        '-version'
-    ]
-
-    output = sp.check_output(cmd)
-    aac_codecs = [
-        x for x in
-        output.splitlines() if "ffmpeg version " in str(x)
-    ][0]
-    hay = aac_codecs.decode('ascii')
-    match = re.findall(r'ffmpeg version \w?(\d+\.)?(\d+\.)?(\*|\d+)', hay)
-    if match:
-        return "".join(match[0])
-    else:
-        return None
+    return cmds.capabilities().ffmpeg_version
 
 
@@ -0,0 +1,584 @@
+"""
+Backends for probing, decoding and encoding audio.
+
+A backend implements the I/O of `read_stems`, `write_audio` and the
+writers. Two backends are included:
+
+- `"cli"` (default): runs the ffmpeg and ffprobe command line tools in
+  subprocesses, see `stempeg.cmds`.
+- `"pyav"`: decodes and encodes in-process with the libav bindings of
+  [PyAV](https://github.com/PyAV-Org/PyAV), straight into numpy arrays.
+  Requires `pip install av`.
+
+The backend is selected per call, e.g. `read_stems(..., backend="pyav")`,
+or globally with `set_backend("pyav")` or the `STEMPEG_BACKEND`
+environment variable.
+
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class Backend(object):
+    """Base class of backends
+
+    Attributes:
+        name (str): name of the backend in the registry
+        in_process (bool): `True` if the backend decodes in the calling
+            process. Then, the substreams are not decoded by process
+            executors of `read_stems`.
+    """
+    name = None
+    in_process = False
+
+    def probe(self, filename):
+        """Probes a file
+
+        Args:
+            filename (str): filename of the audio file.
+
+        Returns:
+            dict: description of the streams and the container in the
+                format of `ffprobe -show_format -show_streams -of json`
+        """
+        raise NotImplementedError
+
+    def read_into(
+        self,
+        out,
+        filename,
+        sample_rate,
+        channels,
+        start,
+        duration,
+        ffmpeg_format,
+        stem_idx,
+        input_rate=None,
+        fast_seek=False,
+        time_unit="seconds",
+        grow=True
+    ):
+        """Decodes substreams into a preallocated array
+
+        Args:
+            out (array_like): view of shape `(samples, stems, channels)`
+            filename (str): filename path
+            sample_rate (int): output sample rate
+            channels (int): total number of decoded channels
+            start (float): start position in `time_unit`
+            duration (float): duration in `time_unit`
+            ffmpeg_format (str): intermediate pcm format, e.g. `"f32le"`
+            stem_idx (int or list): stream id or list of stream ids, which
+                are merged into the `stems` dimension of `out`.
+            input_rate (int): sample rate of the file
+            fast_seek (bool): seek on the input side, see `read_stems`
+            time_unit (str): either "seconds" or "samples"
+            grow (bool): keep the samples that do not fit into `out`.
+                Otherwise decoding may stop once `out` is full.
+
+        Returns:
+            nb_frames (int): number of samples written to `out`
+            rest (array_like): decoded samples that did not fit into `out`
+        """
+        raise NotImplementedError
+
+    def write_audio(
+        self,
+        path,
+        data,
+        sample_rate,
+        output_sample_rate=None,
+        codec=None,
+        bitrate=None
+    ):
+        """Encodes multichannel audio, see `stempeg.write_audio`"""
+        raise NotImplementedError
+
+    def write_streams(
+        self,
+        path,
+        data,
+        sample_rate,
+        output_sample_rate=None,
+        codec=None,
+        bitrate=None,
+        stem_names=None
+    ):
+        """Encodes each stem of `data` to a substream of `path`
+
+        Args:
+            path (str): path with extension
+            data (array): stems tensor of shape `(stems, samples, channel)`
+            sample_rate (float): audio sample rate
+            output_sample_rate (float): resamples, if different to
+                `sample_rate`. Defaults to `None`, which uses
+                `sample_rate`.
+            codec (str): ffmpeg codec name. Defaults to `None`,
+                which uses the default codec of the container.
+            bitrate (int): bitrate in bits per second.
+            stem_names (list): titles of the substreams.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "%s()" % self.__class__.__name__
+
+
+class CLIBackend(Backend):
+    """Runs the ffmpeg and ffprobe command line tools"""
+    name = "cli"
+
+    def probe(self, filename):
+        from . import cmds
+
+        return cmds.probe(filename)
+
+    def read_into(self, out, filename, *args, **kwargs):
+        from . import read
+
+        return read._read_ffmpeg_into(out, filename, *args, **kwargs)
+
+    def write_audio(self, path, data, sample_rate, **kwargs):
+        from . import write
+
+        write.write_audio(path, data, sample_rate, backend=self, **kwargs)
+
+    def write_streams(
+        self,
+        path,
+        data,
+        sample_rate,
+        output_sample_rate=None,
+        codec=None,
+        bitrate=None,
+        stem_names=None
+    ):
+        from . import write
+
+        write.StreamsWriter(
+            codec=codec,
+            bitrate=bitrate,
+            output_sample_rate=output_sample_rate,
+            stem_names=stem_names,
+            backend=self
+        )(data, path, sample_rate)
+
+
+# sample formats of PyAV matching the intermediate pcm formats
+_PYAV_FORMATS = {'f32le': 'flt', 'f64le': 'dbl', 's16le': 's16'}
+
+# default codecs of the containers, if not reported by PyAV
+_PYAV_CODECS = {
+    '.wav': 'pcm_s16le',
+    '.flac': 'flac',
+    '.mp4': 'aac',
+    '.m4a': 'aac',
+    '.mp3': 'libmp3lame',
+    '.ogg': 'libvorbis',
+    '.opus': 'libopus',
+}
+
+
+def _frames(frames):
+    """Returns the output of `AudioResampler.resample` as list"""
+    if frames is None:
+        return []
+    if not isinstance(frames, list):
+        return [frames]
+    return frames
+
+
+def _layout(nb_channels):
+    return {1: 'mono', 2: 'stereo'}.get(nb_channels, nb_channels)
+
+
+class _FrameSink(object):
+    """Copies decoded frames of substreams into a preallocated array
+
+    The frames of each substream are written to their stem of `out`
+    as they are decoded, skipping the samples outside of the excerpt
+    `[begin, end)`. Samples that do not fit into `out` are kept, so
+    that the tensor can be grown by `read_stems`, unless `grow`
+    is `False`.
+
+    Args:
+        out (array_like): view of shape `(samples, stems, channels)`
+        nb_streams (int): number of decoded substreams. A single
+            substream fills all stems of `out`, e.g. for `ChannelsReader`,
+            otherwise substream `k` fills stem `k`.
+        begin (int): first sample of the excerpt
+        end (int): end of the excerpt or `None`
+        grow (bool): keep the samples that do not fit into `out`
+    """
+
+    def __init__(self, out, nb_streams, begin=0, end=None, grow=True):
+        self.out = out
+        self.begin = begin
+        self.end = end
+        self.grow = grow
+        if nb_streams == 1:
+            self.views = [out]
+        else:
+            self.views = [out[:, k] for k in range(nb_streams)]
+        # position in the file of the next decoded sample
+        self.positions = [None] * nb_streams
+        # number of samples of the excerpt decoded so far
+        self.counts = [0] * nb_streams
+        self.rests = [[] for _ in range(nb_streams)]
+
+    def add(self, k, block, position=None):
+        """Adds decoded samples of substream `k`
+
+        Args:
+            k (int): index of the substream
+            block (array_like): raw pcm samples of shape
+                `(samples, channels)`
+            position (int, optional): position of the first sample in the
+                file. Defaults to `None`, which continues the previous
+                block or starts at the beginning of the file.
+        """
+        if position is None:
+            position = self.positions[k] or 0
+        self.positions[k] = position + len(block)
+
+        view = self.views[k]
+        block = block.reshape((len(block),) + view.shape[1:])
+        stop = len(block)
+        if self.end is not None:
+            stop = min(stop, self.end - position)
+        block = block[max(self.begin - position, 0):max(stop, 0)]
+        if not len(block):
+            return
+
+        from . import read
+
+        count = self.counts[k]
+        nb_fit = max(min(len(block), view.shape[0] - count), 0)
+        read._assign_pcm(view[count:count + nb_fit], block[:nb_fit])
+        if nb_fit < len(block) and self.grow:
+            self.rests[k].append(block[nb_fit:])
+        self.counts[k] = count + len(block)
+
+    def finished(self):
+        """Returns `True` if all substreams reached the end of the excerpt
+        or filled `out`, if it cannot be grown"""
+        if not self.grow and all(
+            count >= self.out.shape[0] for count in self.counts
+        ):
+            return True
+        return self.end is not None and all(
+            position is not None and position >= self.end
+            for position in self.positions
+        )
+
+    def result(self, numpy_dtype):
+        """Returns `(nb_frames, rest)` like `read._read_ffmpeg_into`"""
+        from . import read
+
+        # like the amerge filter, stop at the shortest substream
+        nb_samples = min(self.counts)
+        nb_frames = min(nb_samples, self.out.shape[0])
+        rests = []
+        for rest in self.rests:
+            rest = np.concatenate(rest) if rest else np.empty(
+                (0,) + self.views[0].shape[1:], dtype=numpy_dtype
+            )
+            rests.append(rest[:nb_samples - nb_frames])
+        if len(rests) == 1:
+            rest = rests[0]
+        else:
+            rest = np.stack(rests, axis=1)
+        return nb_frames, read._cast(rest, self.out.dtype, numpy_dtype)
+
+
+class PyAVBackend(Backend):
+    """Decodes and encodes in-process using PyAV
+
+    Decoded frames are converted to the intermediate pcm format by the
+    libav resampler and copied into the output tensor of `read_stems`,
+    thus no subprocess is spawned and no pipe is used.
+    """
+    name = "pyav"
+    in_process = True
+
+    def __init__(self):
+        try:
+            import av  # noqa: F401
+        except ImportError:
+            raise RuntimeError(
+                'PyAV could not be found! '
+                'Please install it before using the pyav backend: '
+                'pip install av'
+            ) from None
+
+    def probe(self, filename):
+        import av
+
+        with av.open(filename) as container:
+            streams = []
+            for stream in container.streams:
+                entry = {
+                    'index': stream.index,
+                    'codec_type': stream.type,
+                    'tags': dict(stream.metadata)
+                }
+                if stream.type == 'audio':
+                    context = stream.codec_context
+                    entry.update({
+                        'codec_name': context.name,
+                        'sample_rate': str(context.sample_rate),
+                        'channels': context.channels,
+                    })
+                    if stream.duration is not None:
+                        entry['duration_ts'] = stream.duration
+                        entry['time_base'] = str(stream.time_base)
+                        entry['duration'] = "%f" % float(
+                            stream.duration * stream.time_base
+                        )
+                streams.append(entry)
+
+            description = {
+                'filename': filename,
+                'nb_streams': len(streams),
+                'format_name': container.format.name,
+                'tags': dict(container.metadata)
+            }
+            if container.duration is not None:
+                description['duration'] = "%f" % (
+                    container.duration / av.time_base
+                )
+        return {'streams': streams, 'format': description}
+
+    def read_into(
+        self,
+        out,
+        filename,
+        sample_rate,
+        channels,
+        start,
+        duration,
+        ffmpeg_format,
+        stem_idx,
+        input_rate=None,
+        fast_seek=False,
+        time_unit="seconds",
+        grow=True
+    ):
+        import av
+        from . import read
+
+        numpy_dtype = np.dtype(read._pcm_dtype(ffmpeg_format))
+        stem_ids = stem_idx if isinstance(stem_idx, list) else [stem_idx]
+        begin = read._to_samples(start or 0, sample_rate, time_unit)
+        end = None if duration is None else (
+            begin + read._to_samples(duration, sample_rate, time_unit)
+        )
+        sink = _FrameSink(out, len(stem_ids), begin, end, grow)
+
+        with av.open(filename) as container:
+            streams = [container.streams[idx] for idx in stem_ids]
+            positions = {idx: k for k, idx in enumerate(stem_ids)}
+            resamplers = [
+                av.AudioResampler(
+                    format=_PYAV_FORMATS[ffmpeg_format],
+                    rate=int(sample_rate)
+                )
+                for _ in stem_ids
+            ]
+            # like the `fast_seek` path of the cli backend, seek to
+            # `SEEK_PREROLL` seconds before `begin`, so that the decoder
+            # state has settled at `begin`. The decoded samples in front
+            # of `begin` are skipped by the sink.
+            preroll = max(begin - int(read.SEEK_PREROLL * sample_rate), 0)
+            seeked = preroll > 0
+            if seeked:
+                stream = streams[0]
+                container.seek(
+                    int(preroll / sample_rate / stream.time_base),
+                    stream=stream,
+                    backward=True
+                )
+
+            def _push(k, frames, frame=None):
+                for resampled in _frames(frames):
+                    position = None
+                    if seeked and sink.positions[k] is None and (
+                        frame is not None and frame.time is not None
+                    ):
+                        position = int(round(frame.time * sample_rate))
+                    # packed formats have the shape (1, samples * channels)
+                    sink.add(
+                        k,
+                        resampled.to_ndarray().reshape(resampled.samples, -1),
+                        position
+                    )
+
+            for packet in container.demux(*streams):
+                k = positions[packet.stream.index]
+                for frame in packet.decode():
+                    _push(k, resamplers[k].resample(frame), frame)
+                if sink.finished():
+                    # the rest of the file is not needed
+                    break
+            for k, resampler in enumerate(resamplers):
+                _push(k, resampler.resample(None))
+
+        return sink.result(numpy_dtype)
+
+    def write_audio(
+        self,
+        path,
+        data,
+        sample_rate,
+        output_sample_rate=None,
+        codec=None,
+        bitrate=None
+    ):
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, None]
+        self.write_streams(
+            path,
+            data[None],
+            sample_rate,
+            output_sample_rate=output_sample_rate,
+            codec=codec,
+            bitrate=bitrate
+        )
+
+    def write_streams(
+        self,
+        path,
+        data,
+        sample_rate,
+        output_sample_rate=None,
+        codec=None,
+        bitrate=None,
+        stem_names=None,
+        block_size=4096
+    ):
+        import av
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        if output_sample_rate is None:
+            output_sample_rate = sample_rate
+        nb_stems, nb_samples, nb_channels = data.shape
+        layout = _layout(nb_channels)
+
+        with av.open(str(path), 'w') as container:
+            if codec is None:
+                codec = getattr(container, 'default_audio_codec', None) or (
+                    _PYAV_CODECS.get(Path(path).suffix.lower(), 'aac')
+                )
+            streams = []
+            for k in range(nb_stems):
+                stream = container.add_stream(
+                    codec, rate=int(output_sample_rate)
+                )
+                stream.codec_context.layout = layout
+                if bitrate:
+                    stream.codec_context.bit_rate = int(bitrate)
+                if stem_names is not None:
+                    stream.metadata['title'] = stem_names[k]
+                    stream.metadata['handler_name'] = stem_names[k]
+                streams.append(stream)
+
+            for pos in range(0, nb_samples, block_size):
+                for stream, stem in zip(streams, data):
+                    block = np.ascontiguousarray(
+                        stem[pos:pos + block_size], dtype='<f4'
+                    )
+                    frame = av.AudioFrame.from_ndarray(
+                        block.reshape(1, -1), format='flt', layout=layout
+                    )
+                    frame.sample_rate = int(sample_rate)
+                    container.mux(stream.encode(frame))
+            for stream in streams:
+                # flush the encoders
+                container.mux(stream.encode(None))
+
+
+_registry = {
+    CLIBackend.name: CLIBackend,
+    PyAVBackend.name: PyAVBackend,
+}
+_instances = {}
+_default = None
+
+
+def register_backend(name, backend_class):
+    """Registers a backend class under `name`
+
+    Args:
+        name (str): name used to select the backend
+        backend_class (type): subclass of `Backend`
+    """
+    _registry[name] = backend_class
+
+
+def available_backends():
+    """Returns the names of the backends that can be used
+
+    Returns:
+        list(str): e.g. `["cli", "pyav"]`
+    """
+    names = []
+    for name in _registry:
+        try:
+            get_backend(name)
+        except RuntimeError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(backend=None):
+    """Returns a backend
+
+    Args:
+        backend (str or Backend, optional): name of a registered backend
+            or backend instance. Defaults to `None`, which returns the
+            global backend, see `set_backend`.
+
+    Returns:
+        backend (Backend): the backend
+
+    Raises:
+        ValueError: if no backend is registered under the name
+        RuntimeError: if the backend is not installed
+    """
+    if backend is None:
+        backend = _default
+    if backend is None:
+        backend = os.environ.get('STEMPEG_BACKEND', CLIBackend.name)
+    if isinstance(backend, Backend):
+        return backend
+    if backend not in _registry:
+        raise ValueError(
+            "Unknown backend %r, use one of %s" % (
+                backend, ", ".join(sorted(_registry))
+            )
+        )
+    if backend not in _instances:
+        _instances[backend] = _registry[backend]()
+    return _instances[backend]
+
+
+def set_backend(backend):
+    """Sets the global backend
+
+    Args:
+        backend (str or Backend): name of a registered backend or
+            backend instance. `None` restores the default, which is
+            taken from the `STEMPEG_BACKEND` environment variable or
+            `"cli"`.
+
+    >>> stempeg.backends.set_backend("pyav")
+    """
+    global _default
+    if backend is not None:
+        # fail early if the backend is not available
+        get_backend(backend)
+    _default = backend
@@ -0,0 +1,504 @@
+"""
+Caching module to avoid repeated work on the same files.
+
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from . import read
+from .read import Info
+
+
+class InfoCache(object):
+    """Persistent cache of `Info` objects backed by SQLite
+
+    Probing a file with ffprobe spawns a process. For large datasets this
+    adds up at every startup. `InfoCache` stores the ffprobe output of each
+    file on disk, keyed by its absolute path, size and modification time.
+    Entries of files that were modified are detected and probed again.
+
+    The cache can be passed to `stempeg.read_stems(info=...)` and
+    `stempeg.cli.stem2files(info=...)`, so that a warm start does not run
+    ffprobe at all.
+
+    Args:
+        path (str): Filename of the SQLite database. It is created if it
+            does not exist. Use `":memory:"` for a non-persistent cache.
+
+    >>> cache = stempeg.InfoCache("stems_info.sqlite")
+    >>> info = cache.get("test.stem.mp4")
+    >>> S, rate = stempeg.read_stems("test.stem.mp4", info=cache)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=60, check_same_thread=False
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS info ('
+                'path TEXT PRIMARY KEY, '
+                'size INTEGER NOT NULL, '
+                'mtime INTEGER NOT NULL, '
+                'probe TEXT NOT NULL)'
+            )
+
+    def get(self, filename):
+        """Returns the `Info` object for a file
+
+        The file is probed if it is not in the cache or if it
+        changed since it was cached.
+
+        Args:
+            filename (str): filename of the audio file.
+
+        Returns:
+            info (Info): info object of the file
+        """
+        key = os.path.abspath(filename)
+        stat = os.stat(key)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, mtime, probe FROM info WHERE path = ?', (key,)
+            ).fetchone()
+
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return Info(filename, probe=json.loads(row[2]))
+
+        info = Info(filename)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?)',
+                (key, stat.st_size, stat.st_mtime_ns, json.dumps(info.info))
+            )
+        return info
+
+    __getitem__ = get
+
+    def __contains__(self, filename):
+        """Checks if an up-to-date entry of the file exists"""
+        key = os.path.abspath(filename)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return False
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, mtime FROM info WHERE path = ?', (key,)
+            ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM info').fetchone()[0]
+
+    def clear(self):
+        """Removes all entries"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM info')
+
+    def close(self):
+        """Closes the database connection"""
+        self._db.close()
+
+    def __reduce__(self):
+        # reopen the database, e.g. within worker processes
+        return (InfoCache, (self.path,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _track_key(filename, sample_rate, dtype, ffmpeg_format, reader):
+    """Returns the identity of a decoded track"""
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    return (
+        path,
+        stat.st_size,
+        stat.st_mtime_ns,
+        sample_rate,
+        np.dtype(dtype).str,
+        ffmpeg_format,
+        type(reader).__name__,
+        getattr(reader, 'nb_channels', None)
+    )
+
+
+def _decode_track(filename, info, dtype, ffmpeg_format, sample_rate, reader,
+                  **kwargs):
+    """Decodes all stems of a track
+
+    Returns:
+        stems (array_like): stems tensor of the full track
+        meta (dict): sample rate and stream ids of the stems
+    """
+    metadata = read._get_info(filename, info, kwargs.get('backend'))
+    stems, rate = read.read_stems(
+        filename,
+        always_3d=True,
+        dtype=dtype,
+        ffmpeg_format=ffmpeg_format,
+        info=metadata,
+        sample_rate=sample_rate,
+        reader=reader,
+        **kwargs
+    )
+    if isinstance(reader, read.ChannelsReader):
+        stream_idx = None
+    else:
+        stream_idx = metadata.audio_stream_idx()
+    return stems, {'sample_rate': rate, 'stream_idx': stream_idx}
+
+
+def _slice_track(stems, meta, start, duration, stem_id, always_3d,
+                 time_unit, out):
+    """Serves an excerpt of a decoded track like `stempeg.read_stems`"""
+    rate = meta['sample_rate']
+
+    start = read._to_samples(start or 0, rate, time_unit)
+    if duration is None:
+        stop = stems.shape[1]
+    else:
+        stop = start + read._to_samples(duration, rate, time_unit)
+    stems = stems[:, start:stop].view(np.ndarray)
+
+    if stem_id is not None and meta['stream_idx'] is not None:
+        stem_ids = stem_id if isinstance(stem_id, list) else [stem_id]
+        positions = [meta['stream_idx'].index(idx) for idx in stem_ids]
+        if positions != list(range(stems.shape[0])):
+            # copies the selected stems of the excerpt
+            stems = stems[positions]
+
+    if out is not None:
+        if out.ndim != 3 or out.shape[0] != stems.shape[0] or (
+            out.shape[2] != stems.shape[2]
+        ):
+            raise ValueError(
+                "`out` should have shape (%d, samples, %d)" % (
+                    stems.shape[0], stems.shape[2]
+                )
+            )
+        nb_samples = min(stems.shape[1], out.shape[1])
+        out[:, :nb_samples] = stems[:, :nb_samples]
+        stems = out[:, :nb_samples]
+
+    if not always_3d:
+        stems = np.squeeze(stems)
+    return stems, rate
+
+
+class PCMCache(object):
+    """Persistent cache of decoded audio backed by memory-mapped files
+
+    Decoding a compressed stem file is expensive. When a dataset is read
+    repeatedly, e.g. over several training epochs, `PCMCache` decodes each
+    track only once and stores all of its stems as `.npy` file in
+    `cache_dir`. Subsequent reads of the track, or of any excerpt of it,
+    are served as slices of the memory-mapped file without spawning
+    ffmpeg or ffprobe.
+
+    Entries are keyed by the absolute path, size and modification time
+    of the file as well as the output sample rate, dtype, ffmpeg format
+    and reader. When the total size of the cache exceeds `max_bytes`,
+    the least recently used entries are removed. Entries are written to
+    a temporary file first and renamed, so that several processes can
+    share a cache directory.
+
+    The returned stems are read-only views of the cache, unless a subset
+    of the stems is selected with `stem_id` or `out` is passed.
+
+    Args:
+        cache_dir (str): Directory of the cache. It is created if it
+            does not exist.
+        max_bytes (int, optional): Maximum size of the cache in bytes.
+            Defaults to `None` (unlimited).
+
+    >>> cache = stempeg.PCMCache("stems_cache", max_bytes=10 * 2**30)
+    >>> S, rate = stempeg.read_stems("test.stem.mp4", cache_dir=cache)
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, filename, sample_rate, dtype, ffmpeg_format, reader):
+        key = json.dumps(_track_key(
+            filename, sample_rate, dtype, ffmpeg_format, reader
+        ))
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(key.encode()).hexdigest()
+        )
+
+    def _write(self, path, write):
+        """Writes a file atomically"""
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _load(self, key):
+        """Returns the memory-mapped stems and entry metadata or `None`"""
+        try:
+            with open(key + '.json') as f:
+                meta = json.load(f)
+            stems = np.load(key + '.npy', mmap_mode='r')
+            # mark entry as recently used
+            os.utime(key + '.npy')
+        except (OSError, ValueError):
+            # e.g. the entry was evicted by another process
+            return None
+        return stems, meta
+
+    def _evict(self, keep):
+        """Removes least recently used entries exceeding `max_bytes`"""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            key = os.path.join(self.cache_dir, name)
+            if key == keep:
+                continue
+            for ext in ('.npy', '.json'):
+                try:
+                    os.remove(key + ext)
+                except OSError:
+                    pass
+            total -= size
+
+    def read_stems(
+        self,
+        filename,
+        start=None,
+        duration=None,
+        stem_id=None,
+        always_3d=False,
+        dtype=np.float64,
+        ffmpeg_format="f32le",
+        info=None,
+        sample_rate=None,
+        reader=read.StreamsReader(),
+        time_unit="seconds",
+        out=None,
+        **kwargs
+    ):
+        """Reads stems from the cache, decoding the track on a miss
+
+        Takes the same arguments as `stempeg.read_stems`. Additional
+        keyword arguments, e.g. `multithread`, are passed to
+        `stempeg.read_stems` when the track is decoded.
+
+        Returns:
+            stems (array_like):
+                stems tensor of `shape=(stem x samples x channels)`
+            rate (float):
+                sample rate
+        """
+        key = self._key(filename, sample_rate, dtype, ffmpeg_format, reader)
+        entry = self._load(key)
+        if entry is None:
+            # decode and store all stems of the full track
+            stems, meta = _decode_track(
+                filename, info, dtype, ffmpeg_format, sample_rate, reader,
+                **kwargs
+            )
+            self._write(key + '.json', lambda f: f.write(
+                json.dumps(meta).encode()
+            ))
+            self._write(key + '.npy', lambda f: np.save(f, stems))
+            del stems
+            self._evict(keep=key)
+            entry = self._load(key)
+            if entry is None:
+                raise RuntimeError("Could not load the cached stems.")
+
+        stems, meta = entry
+        return _slice_track(
+            stems, meta, start, duration, stem_id, always_3d, time_unit, out
+        )
+
+    def clear(self):
+        """Removes all entries"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.npy', '.json', '.tmp')):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+class TrackCache(object):
+    """In-memory LRU cache of decoded tracks
+
+    Augmentation pipelines often read several excerpts of the same tracks.
+    `TrackCache` holds the fully decoded stems of the most recently used
+    tracks in memory, so that excerpts are served as views of the cached
+    tensors instead of running ffmpeg again. The cache is bounded by the
+    total number of bytes of the cached tensors, the least recently used
+    tracks are evicted first.
+
+    Entries are keyed like `PCMCache` by the file identity, output sample
+    rate, dtype, ffmpeg format and reader. Cached tensors are read-only,
+    thus the returned stems are read-only views, unless a subset of the
+    stems is selected with `stem_id` or `out` is passed.
+
+    The cache is thread-safe and can be shared by the threads of a
+    `StemReader(executor="thread")`. Concurrent reads of a track that is
+    being decoded wait for the decode instead of running ffmpeg again.
+    Such reads are counted as hits.
+
+    Args:
+        max_bytes (int): Maximum size of the cached tensors in bytes.
+            Tracks larger than `max_bytes` are not cached.
+
+    >>> cache = stempeg.TrackCache(max_bytes=2 * 2**30)
+    >>> S, rate = stempeg.read_stems("test.stem.mp4", memory_cache=cache)
+    >>> cache.hits, cache.misses
+    (0, 1)
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        """Returns the entry, a future of a pending entry or `None`
+
+        On a miss, a future is registered for the key, so that concurrent
+        reads of the same track wait for a single decode.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry, None
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.hits += 1
+                return None, pending
+            self.misses += 1
+            self._pending[key] = Future()
+            return None, None
+
+    def _put(self, key, stems, meta):
+        if stems.nbytes > self.max_bytes:
+            return stems
+        # do not hold on to the overallocated tensor of `read_stems`
+        stems = np.ascontiguousarray(stems)
+        stems.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                # decoded concurrently by another thread
+                return self._entries[key][0]
+            self._entries[key] = (stems, meta)
+            self.nbytes += stems.nbytes
+            while self.nbytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return stems
+
+    def read_stems(
+        self,
+        filename,
+        start=None,
+        duration=None,
+        stem_id=None,
+        always_3d=False,
+        dtype=np.float64,
+        ffmpeg_format="f32le",
+        info=None,
+        sample_rate=None,
+        reader=read.StreamsReader(),
+        time_unit="seconds",
+        out=None,
+        **kwargs
+    ):
+        """Reads stems from the cache, decoding the track on a miss
+
+        Takes the same arguments as `stempeg.read_stems`. Additional
+        keyword arguments, e.g. `multithread` or `cache_dir`, are passed
+        to `stempeg.read_stems` when the track is decoded.
+
+        Returns:
+            stems (array_like):
+                stems tensor of `shape=(stem x samples x channels)`
+            rate (float):
+                sample rate
+        """
+        key = _track_key(filename, sample_rate, dtype, ffmpeg_format, reader)
+        entry, pending = self._get(key)
+        if pending is not None:
+            entry = pending.result()
+        if entry is None:
+            future = self._pending[key]
+            try:
+                stems, meta = _decode_track(
+                    filename, info, dtype, ffmpeg_format, sample_rate, reader,
+                    **kwargs
+                )
+                stems = self._put(key, stems, meta)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result((stems, meta))
+            finally:
+                with self._lock:
+                    del self._pending[key]
+        else:
+            stems, meta = entry
+        return _slice_track(
+            stems, meta, start, duration, stem_id, always_3d, time_unit, out
+        )
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Removes all entries and resets the statistics"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __repr__(self):
+        return "TrackCache(tracks=%d, nbytes=%d, max_bytes=%d, " \
+            "hits=%d, misses=%d)" % (
+                len(self), self.nbytes, self.max_bytes, self.hits,
+                self.misses
+            )
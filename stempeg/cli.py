@@ -1,13 +1,42 @@
 import argparse
+import glob
+import subprocess as sp
+import sys
+import warnings
 from . import __version__
+from . import cmds
 
 from .read import Info, read_stems
+from .cache import InfoCache
 from .write import write_stems
 from .write import FilesWriter
 
 from os import path as op
 import os
 
+# extensions of the files that are collected from input directories
+STEM_EXTENSIONS = ('.stem.mp4', '.stem.m4a')
+
+# codecs that are stream copied into the containers of the extensions,
+# other codecs are transcoded to the default codec of the container
+COPY_CODECS = {
+    '.m4a': {'aac', 'alac', 'mp3', 'ac3', 'eac3'},
+    '.mp4': {'aac', 'alac', 'mp3', 'ac3', 'eac3', 'opus'},
+    '.mov': {'aac', 'alac', 'mp3', 'ac3', 'eac3'},
+    '.aac': {'aac'},
+    '.mp3': {'mp3'},
+    '.flac': {'flac'},
+    '.ogg': {'vorbis', 'opus', 'flac'},
+    '.opus': {'opus'},
+    '.wav': {
+        'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_f64le',
+        'pcm_u8'
+    },
+}
+
+# info caches of the worker processes, keyed by the database path
+_info_caches = {}
+
 
 def cli(inargs=None):
     """
@@ -25,7 +54,11 @@ def cli(inargs=None):
     parser.add_argument(
         'filename',
         metavar="filename",
-        help="Input STEM file"
+        nargs='+',
+        help="Input STEM files, directories or glob patterns. "
+             "Deprecated: if exactly two arguments are given without "
+             "--outdir and the second one is neither a file, a pattern "
+             "nor a directory of STEM files, it is used as output folder"
     )
 
     parser.add_argument(
@@ -59,21 +92,110 @@ def cli(inargs=None):
     )
 
     parser.add_argument(
-        'outdir',
+        '--info-cache',
+        metavar='info_cache',
+        type=str,
+        help="Path to a metadata cache database, "
+             "see `stempeg.InfoCache`"
+    )
+
+    parser.add_argument(
+        '-o', '--outdir',
         metavar='outdir',
-        nargs='?',
+        type=str,
         help="Output folder"
     )
 
+    parser.add_argument(
+        '-j', '--jobs',
+        metavar='jobs',
+        type=int,
+        default=1,
+        help="Number of files that are converted in parallel, "
+             "0 uses all cpus"
+    )
+
+    parser.add_argument(
+        '-c', '--copy',
+        action='store_true',
+        help="Remux the streams without re-encoding, if the output format "
+             "supports the codec (e.g. `--extension .m4a` for AAC stems)"
+    )
+
+    parser.add_argument(
+        '-f', '--force',
+        action='store_true',
+        help="Convert files with up-to-date outputs"
+    )
+
     args = parser.parse_args(inargs)
-    stem2files(
-        args.filename,
-        args.outdir,
+    inputs = args.filename
+    outdir = args.outdir
+    if outdir is None and len(inputs) == 2 and op.isfile(inputs[0]) and (
+        not op.isfile(inputs[1]) and not glob.has_magic(inputs[1])
+    ) and not (op.isdir(inputs[1]) and expand_inputs(inputs[1:])):
+        # `stem2files filename outdir`
+        warnings.warn(
+            "Passing the output folder %r as positional argument is "
+            "deprecated, use --outdir instead" % inputs[1],
+            FutureWarning
+        )
+        inputs, outdir = inputs[:1], inputs[1]
+
+    results = stem2files_batch(
+        expand_inputs(inputs),
+        outdir,
         args.extension,
         args.id,
         args.s,
-        args.t
+        args.t,
+        info_cache=args.info_cache,
+        jobs=args.jobs,
+        force=args.force,
+        copy=args.copy,
+        verbose=True
+    )
+    print(
+        "%d converted, %d up to date, %d failed" % (
+            len(results['converted']),
+            len(results['skipped']),
+            len(results['failed'])
+        )
     )
+    return 1 if results['failed'] else 0
+
+
+def expand_inputs(inputs):
+    """Expands directories and glob patterns to a list of files
+
+    Args:
+        inputs (list(str)): filenames, directories or glob patterns.
+            Directories are searched recursively for files ending with
+            one of `STEM_EXTENSIONS`.
+
+    Returns:
+        list(str): the files in the order of `inputs`, without duplicates.
+            Filenames are returned as given, even if they do not exist.
+    """
+    files = []
+    for pattern in inputs:
+        if op.isdir(pattern):
+            matches = sorted(
+                match for match in glob.glob(
+                    op.join(glob.escape(pattern), '**', '*'),
+                    recursive=True
+                )
+                if match.endswith(STEM_EXTENSIONS) and op.isfile(match)
+            )
+        elif glob.has_magic(pattern):
+            matches = sorted(
+                match for match in glob.glob(pattern, recursive=True)
+                if op.isfile(match)
+            )
+        else:
+            matches = [pattern]
+        files.extend(match for match in matches if match not in files)
+    return files
 
 
 def stem2files(
@@ -83,10 +205,158 @@ def stem2files(
     idx=None,
     start=None,
     duration=None,
+    info=None,
+    multiprocess=True,
+    copy=False
+):
+    """Writes the stems of a stem file to individual files
+
+    The files are written to `outdir/<basename>/<stem name><extension>`,
+    where `outdir` defaults to the folder of `stems_file`.
+
+    With `copy=True` the streams are remuxed by a single ffmpeg process
+    without decoding, e.g. AAC stems to `.m4a` files. Streams whose codec
+    is not supported by the output container (see `COPY_CODECS`) are
+    transcoded by the same process.
+
+    Args:
+        stems_file (str): filename of the stem file.
+        outdir (str, optional): output folder.
+        extension (str): extension of the output files, sets the format.
+        idx (int or list(int), optional): ids of the stems to write.
+            Defaults to `None`, which writes all stems.
+        start (float, optional): start offset in seconds.
+        duration (float, optional): duration in seconds.
+        info (Info or InfoCache, optional): metadata of `stems_file`.
+        multiprocess (bool): encodes the stems in a pool of processes,
+            which is closed when the stems are written. Defaults to `True`.
+        copy (bool): remux the streams without re-encoding. Excerpts
+            (`start`, `duration`) are always transcoded, as stream copy
+            can only cut at packet boundaries. Defaults to `False`.
+
+    Returns:
+        list(str): the filenames of the written stems
+    """
+    info = _get_info(stems_file, info)
+    if copy and start is None and duration is None:
+        return extract_streams(stems_file, outdir, extension, idx, info)
+
+    S, sr = read_stems(
+        stems_file,
+        stem_id=idx,
+        start=start,
+        duration=duration,
+        always_3d=True,
+        info=info
+    )
+
+    stem_names = _stem_names(info, idx)
+    paths = output_paths(stems_file, info, outdir, extension, idx)
+    folder = op.dirname(paths[0])
+    if not op.exists(folder):
+        os.makedirs(folder)
+
+    writer = FilesWriter(
+        multiprocess=multiprocess,
+        output_sample_rate=sr,
+        stem_names=stem_names
+    )
+    try:
+        write_stems(
+            (folder, _extension(extension)),
+            S,
+            sample_rate=sr,
+            writer=writer
+        )
+    finally:
+        if writer._pool is not None:
+            # do not keep the worker processes alive until exit
+            writer._pool.close()
+            writer._pool.join()
+    return paths
+
+
+def extract_streams(
+    stems_file,
+    outdir=None,
+    extension=".m4a",
+    idx=None,
+    info=None
 ):
-    info = Info(stems_file)
-    S, sr = read_stems(stems_file, stem_id=idx, start=start, duration=duration)
+    """Writes each stream of a stem file to its own file by stream copy
+
+    All outputs are written by one ffmpeg process, which copies the
+    packets of the streams whose codec is supported by the output
+    container and transcodes the others. The streams are named after
+    `Info.title_streams`.
+
+    Args:
+        stems_file (str): filename of the stem file.
+        outdir (str, optional): output folder, see `stem2files`.
+        extension (str): extension of the output files.
+            Defaults to `".m4a"`.
+        idx (int or list(int), optional): ids of the stems to write.
+            Defaults to `None`, which writes all stems.
+        info (Info or InfoCache, optional): metadata of `stems_file`.
 
+    Returns:
+        list(str): the filenames of the written stems
+
+    >>> stempeg.cli.extract_streams("track.stem.mp4", outdir="stems")
+    """
+    info = _get_info(stems_file, info)
+    paths = output_paths(stems_file, info, outdir, extension, idx)
+    folder = op.dirname(paths[0])
+    if not op.exists(folder):
+        os.makedirs(folder)
+
+    streams = {stream['index']: stream for stream in info.audio_streams}
+    stem_names = _stem_names(info, idx)
+    args = [cmds.ffmpeg_path(), '-y', '-nostdin', '-i', stems_file]
+    for stem_id, stem_name, path in zip(
+        _stem_ids(info, idx), stem_names, paths
+    ):
+        codec = streams[stem_id].get('codec_name')
+        if codec in COPY_CODECS.get(_extension(extension).lower(), ()):
+            codec_args = ['-c:a', 'copy']
+        else:
+            codec_args = ['-strict', '-2']
+        args += ['-map', '0:%d' % stem_id] + codec_args + [
+            '-metadata:s:a:0', 'title=%s' % stem_name,
+            '-metadata:s:a:0', 'handler=%s' % stem_name,
+            '-metadata:s:a:0', 'handler_name=%s' % stem_name,
+            path
+        ]
+
+    process = cmds.popen(args, stdout=sp.DEVNULL, stderr=sp.PIPE)
+    _, err = process.communicate()
+    if process.returncode:
+        raise RuntimeError(
+            'FFMPEG error: %s' % err.decode(errors='replace')
+        )
+    return paths
+
+
+def output_paths(
+    stems_file,
+    info=None,
+    outdir=None,
+    extension="wav",
+    idx=None
+):
+    """Returns the filenames written by `stem2files`
+
+    Args:
+        stems_file (str): filename of the stem file.
+        info (Info or InfoCache, optional): metadata of `stems_file`.
+        outdir (str, optional): output folder.
+        extension (str): extension of the output files.
+        idx (int or list(int), optional): ids of the stems.
+
+    Returns:
+        list(str): the output filename of each stem
+    """
+    info = _get_info(stems_file, info)
     rootpath, filename = op.split(stems_file)
 
     basename = op.splitext(filename)[0]
@@ -94,25 +364,166 @@ def stem2files(
         basename = basename.split(".stem")[0]
 
     if outdir is not None:
-        if not op.exists(outdir):
-            os.makedirs(outdir)
-
         rootpath = outdir
 
-    if len(set(info.title_streams)) == len(info.title_streams):
-        # titles contain duplicates
-        # lets not use the metadata
-        stem_names = info.title_streams
-    else:
-        stem_names = None
-
-    write_stems(
-        (op.join(rootpath, basename), extension),
-        S,
-        sample_rate=sr,
-        writer=FilesWriter(
-            multiprocess=True,
-            output_sample_rate=sr,
-            stem_names=stem_names
-        )
+    return [
+        op.join(rootpath, basename, name + _extension(extension))
+        for name in _stem_names(info, idx)
+    ]
+
+
+def is_up_to_date(stems_file, paths):
+    """Checks if all outputs exist and are newer than the stem file"""
+    mtime = os.stat(stems_file).st_mtime
+    return all(
+        op.isfile(path) and os.stat(path).st_mtime >= mtime
+        for path in paths
     )
+
+
+def stem2files_batch(
+    stems_files,
+    outdir=None,
+    extension="wav",
+    idx=None,
+    start=None,
+    duration=None,
+    info_cache=None,
+    jobs=1,
+    force=False,
+    copy=False,
+    verbose=False
+):
+    """Runs `stem2files` on many stem files in parallel
+
+    Files whose outputs are newer than the stem file are skipped. A
+    failing file does not stop the batch.
+
+    Args:
+        stems_files (list(str)): filenames of the stem files,
+            see `expand_inputs`.
+        outdir, extension, idx, start, duration: see `stem2files`.
+        info_cache (str, optional): path to a `stempeg.InfoCache`
+            database that is shared by the workers.
+        jobs (int): number of files that are converted in parallel
+            worker processes. `0` uses all cpus. Defaults to `1`, which
+            converts the files in the calling process.
+        force (bool): converts files with up-to-date outputs.
+        copy (bool): remux the streams without re-encoding,
+            see `stem2files`.
+        verbose (bool): prints the status of each file.
+
+    Returns:
+        dict: the filenames of the `converted`, `skipped` and `failed`
+            stem files. `failed` contains `(filename, error)` tuples.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    kwargs = dict(
+        outdir=outdir,
+        extension=extension,
+        idx=idx,
+        start=start,
+        duration=duration,
+        info_cache=info_cache,
+        force=force,
+        copy=copy,
+        # the stems are only encoded in parallel for a single file,
+        # otherwise a pool of processes would be started for each file
+        multiprocess=jobs == 1 and len(stems_files) == 1
+    )
+    results = {'converted': [], 'skipped': [], 'failed': []}
+
+    def _collect(stems_file, status, error):
+        if status == 'failed':
+            results['failed'].append((stems_file, error))
+            if verbose:
+                print(
+                    "failed: %s: %s" % (stems_file, error), file=sys.stderr
+                )
+            return
+        results[status].append(stems_file)
+        if verbose:
+            print("%s: %s" % (status, stems_file))
+
+    if jobs == 1 or len(stems_files) < 2:
+        for stems_file in stems_files:
+            _collect(stems_file, *_convert(stems_file, **kwargs))
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_convert, stems_file, **kwargs)
+            for stems_file in stems_files
+        ]
+        for stems_file, future in zip(stems_files, futures):
+            _collect(stems_file, *future.result())
+    return results
+
+
+def _convert(stems_file, info_cache=None, force=False, **kwargs):
+    """Converts a file of a batch, returns `(status, error)`"""
+    try:
+        if info_cache is not None:
+            if info_cache not in _info_caches:
+                _info_caches[info_cache] = InfoCache(info_cache)
+            info = _info_caches[info_cache].get(stems_file)
+        else:
+            info = Info(stems_file)
+        if not force and is_up_to_date(
+            stems_file,
+            output_paths(
+                stems_file,
+                info,
+                kwargs['outdir'],
+                kwargs['extension'],
+                kwargs['idx']
+            )
+        ):
+            return 'skipped', None
+        stem2files(stems_file, info=info, **kwargs)
+    except Exception as error:
+        return 'failed', str(error) or type(error).__name__
+    return 'converted', None
+
+
+def _get_info(stems_file, info):
+    if info is None:
+        return Info(stems_file)
+    if not isinstance(info, Info):
+        # e.g. `stempeg.InfoCache`
+        return info.get(stems_file)
+    return info
+
+
+def _extension(extension):
+    if not extension.startswith('.'):
+        return '.' + extension
+    return extension
+
+
+def _stem_ids(info, idx):
+    """Returns the stream ids of the selected stems, see `read_stems`"""
+    audio_idx = info.audio_stream_idx()
+    if idx is None:
+        return audio_idx
+    stem_ids = [idx] if isinstance(idx, int) else list(idx)
+    for stem_id in stem_ids:
+        if stem_id not in audio_idx:
+            raise ValueError("Stream %d is not an audio stream" % stem_id)
+    return stem_ids
+
+
+def _stem_names(info, idx):
+    """Returns the output names of the selected streams"""
+    # positions of the streams among the audio streams
+    audio_idx = info.audio_stream_idx()
+    positions = [audio_idx.index(k) for k in _stem_ids(info, idx)]
+    titles = info.title_streams
+    if None in titles or len(set(titles)) != len(titles):
+        # titles are missing or contain duplicates
+        # lets not use the metadata
+        return ["Stem_" + str(k) for k in positions]
+    return [titles[k] for k in positions]
@@ -1,11 +1,18 @@
 import re
+import os
+import json
 import subprocess as sp
 import logging
+import threading
 
 FFMPEG_PATH = None
 FFPROBE_PATH = None
 MP4BOX_PATH = None
 
+# callables that are invoked with the command of every spawned subprocess
+_spawn_hooks = []
+_spawn_hooks_lock = threading.Lock()
+
 
 def find_cmd(cmd):
     try:
@@ -39,28 +46,249 @@ def mp4box_exists():
     return MP4BOX_PATH is not None
 
 
-if not ffmpeg_and_ffprobe_exists():
-    raise RuntimeError(
-        'ffmpeg or ffprobe could not be found! '
-        'Please install them before using stempeg. '
-        'See: https://github.com/faroit/stempeg'
-    )
+def ffmpeg_path():
+    """Returns the path of ffmpeg
 
+    The binaries are looked up on first use rather than when stempeg is
+    imported, so that importing stempeg has no side effects. Set
+    `FFMPEG_PATH` before the first use to select a specific binary.
 
-def check_available_aac_encoders():
-    """Returns the available AAC encoders
+    Returns:
+        str: path of the ffmpeg binary
+
+    Raises:
+        RuntimeError: if ffmpeg or ffprobe could not be found
+    """
+    if not ffmpeg_and_ffprobe_exists():
+        raise RuntimeError(
+            'ffmpeg or ffprobe could not be found! '
+            'Please install them before using stempeg. '
+            'See: https://github.com/faroit/stempeg'
+        )
+    return FFMPEG_PATH
+
+
+def ffprobe_path():
+    """Returns the path of ffprobe, see `ffmpeg_path`"""
+    ffmpeg_path()
+    return FFPROBE_PATH
+
+
+def add_spawn_hook(hook):
+    """Registers a hook that is called for every spawned subprocess
+
+    All ffmpeg, ffprobe and MP4Box processes of stempeg are started
+    through `popen`, which calls `hook(args)` before the process is
+    spawned. Note, that subprocesses spawned within worker processes
+    (e.g. `multiprocess=True`) are not reported to the parent process.
+
+    Args:
+        hook (callable): function that takes the list of command arguments
+    """
+    with _spawn_hooks_lock:
+        _spawn_hooks.append(hook)
+
+
+def remove_spawn_hook(hook):
+    """Removes a hook registered with `add_spawn_hook`"""
+    with _spawn_hooks_lock:
+        _spawn_hooks.remove(hook)
+
+
+class count_subprocesses(object):
+    """Context manager that counts the spawned subprocesses
+
+    Can be used to test the number of ffmpeg/ffprobe calls of stempeg
+    functions.
+
+    >>> with stempeg.cmds.count_subprocesses() as counter:
+    >>>     stempeg.read_stems(stempeg.example_stem_path())
+    >>> counter.count
+    6
+
+    Attributes:
+        count (int): number of spawned subprocesses
+        commands (list): command arguments of the spawned subprocesses
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    @property
+    def count(self):
+        return len(self.commands)
+
+    def __call__(self, args):
+        self.commands.append(list(args))
+
+    def __enter__(self):
+        add_spawn_hook(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_spawn_hook(self)
+
+
+def popen(args, **kwargs):
+    """Spawns a subprocess and reports it to the registered hooks
+
+    Args:
+        args (list): command arguments
+        **kwargs: passed to `subprocess.Popen`
 
     Returns:
-        list(str): List of available encoder codecs from ffmpeg
+        process (subprocess.Popen): the process
+    """
+    with _spawn_hooks_lock:
+        hooks = list(_spawn_hooks)
+    for hook in hooks:
+        hook(args)
+    return sp.Popen(args, **kwargs)
+
+
+async def create_subprocess_exec(args, **kwargs):
+    """Like `popen` but spawns the subprocess with asyncio
+
+    Args:
+        args (list): command arguments
+        **kwargs: passed to `asyncio.create_subprocess_exec`
+
+    Returns:
+        process (asyncio.subprocess.Process): the process
+    """
+    with _spawn_hooks_lock:
+        hooks = list(_spawn_hooks)
+    for hook in hooks:
+        hook(args)
+    import asyncio
+
+    return await asyncio.create_subprocess_exec(*args, **kwargs)
+
+
+async def kill_on_cancel(process, coro):
+    """Awaits `coro`, killing `process` if it is cancelled or fails
+
+    Args:
+        process (asyncio.subprocess.Process): the process
+        coro (coroutine): coroutine that communicates with the process
+
+    Returns:
+        the result of `coro`
+    """
+    try:
+        return await coro
+    except BaseException:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            # reap the child, even if the task is cancelled again
+            import asyncio
 
+            await asyncio.shield(process.wait())
+        raise
+
+
+async def communicate_async(args, input=None):
+    """Runs a command with asyncio and returns its output
+
+    The process is killed if the calling task is cancelled.
+
+    Args:
+        args (list): command arguments
+        input (bytes-like, optional): data sent to stdin
+
+    Returns:
+        returncode (int): exit code of the process
+        stdout (bytes): output of the process
+        stderr (bytes): error output of the process
     """
-    cmd = [
-        FFMPEG_PATH,
-        '-v', 'error',
-        '-codecs'
+    process = await create_subprocess_exec(
+        args,
+        stdin=sp.DEVNULL if input is None else sp.PIPE,
+        stdout=sp.PIPE,
+        stderr=sp.PIPE
+    )
+    out, err = await kill_on_cancel(process, process.communicate(input))
+    return process.returncode, out, err
+
+
+def check_call(args):
+    """Like `subprocess.check_call` but spawned through `popen`"""
+    retcode = popen(args).wait()
+    if retcode:
+        raise sp.CalledProcessError(retcode, args)
+
+
+def check_output(args):
+    """Like `subprocess.check_output` but spawned through `popen`"""
+    process = popen(args, stdout=sp.PIPE)
+    output, _ = process.communicate()
+    if process.returncode:
+        raise sp.CalledProcessError(
+            process.returncode, args, output=output
+        )
+    return output
+
+
+def _probe_args(filename):
+    return [
+        ffprobe_path(),
+        '-show_format',
+        '-show_streams',
+        '-of', 'json',
+        filename
     ]
 
-    output = sp.check_output(cmd)
+
+def probe(filename):
+    """Runs ffprobe on a file
+
+    Args:
+        filename (str): filename of the file to probe
+
+    Returns:
+        dict: parsed json output of ffprobe
+
+    Raises:
+        ffmpeg.Error: if ffprobe returns a non-zero exit code
+    """
+    import ffmpeg
+
+    process = popen(_probe_args(filename), stdout=sp.PIPE, stderr=sp.PIPE)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffprobe', out, err)
+    return json.loads(out.decode('utf-8'))
+
+
+async def probe_async(filename):
+    """Like `probe` but runs ffprobe with asyncio"""
+    import ffmpeg
+
+    returncode, out, err = await communicate_async(_probe_args(filename))
+    if returncode != 0:
+        raise ffmpeg.Error('ffprobe', out, err)
+    return json.loads(out.decode('utf-8'))
+
+
+def _detect_ffmpeg_version():
+    output = check_output([ffmpeg_path(), '-version'])
+    line = [
+        x for x in
+        output.splitlines() if "ffmpeg version " in str(x)
+    ][0]
+    hay = line.decode('ascii', errors='replace')
+    match = re.findall(r'ffmpeg version \w?(\d+\.)?(\d+\.)?(\*|\d+)', hay)
+    if match:
+        return "".join(match[0])
+    else:
+        return None
+
+
+def _detect_aac_encoders():
+    output = check_output([ffmpeg_path(), '-v', 'error', '-codecs'])
     aac_codecs = [
         x for x in
         output.splitlines() if "AAC (Advanced Audio Coding)" in str(x)
@@ -73,6 +301,167 @@ def check_available_aac_encoders():
         return None
 
 
+def _detect_names(option):
+    """Parses the names listed by `ffmpeg -encoders` or `ffmpeg -muxers`"""
+    output = check_output([ffmpeg_path(), '-v', 'error', option])
+    lines = output.decode('utf-8', errors='replace').splitlines()
+    # the legend is separated from the list by a line of dashes
+    for k, line in enumerate(lines):
+        if line.strip().startswith('--'):
+            lines = lines[k + 1:]
+            break
+    names = set()
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 2:
+            # e.g. "matroska,webm" for muxers with multiple names
+            names.update(fields[1].split(','))
+    return sorted(names)
+
+
+class Capabilities(object):
+    """Registry of the capabilities of the ffmpeg installation
+
+    Detecting the ffmpeg version or the available encoders spawns an
+    ffmpeg process. The registry runs each detection at most once and
+    stores the result, so that writing many files does not spawn a
+    probe for every file. Use `capabilities()` to get the process-wide
+    registry.
+
+    Optionally, the results are persisted to a JSON file, so that they
+    are shared across processes. Entries are keyed by the path and
+    modification time of the ffmpeg and MP4Box binaries, thus they are
+    detected again when ffmpeg is updated.
+
+    Args:
+        cache_file (str, optional): Filename of the persistent cache.
+            Defaults to `None` (not persisted).
+
+    >>> stempeg.cmds.capabilities().ffmpeg_version
+    '4.3.1'
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self._lock = threading.RLock()
+        self._values = None
+
+    def _key(self):
+        key = []
+        for path in (ffmpeg_path(), find_cmd("MP4Box")):
+            try:
+                key.append([path, os.stat(path).st_mtime_ns])
+            except (OSError, TypeError):
+                key.append([path, None])
+        return json.dumps(key)
+
+    def _load(self):
+        self._values = {}
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._values = dict(entries.get(self._key(), {}))
+
+    def _save(self):
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        entries[self._key()] = self._values
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.cache_file)
+
+    def _get(self, name, detect):
+        with self._lock:
+            if self._values is None:
+                self._load()
+            if name not in self._values:
+                self._values[name] = detect()
+                if self.cache_file is not None:
+                    self._save()
+            return self._values[name]
+
+    @property
+    def ffmpeg_version(self):
+        """str: version of ffmpeg, e.g. `"4.3.1"`"""
+        return self._get('ffmpeg_version', _detect_ffmpeg_version)
+
+    @property
+    def aac_encoders(self):
+        """list(str): available AAC encoders, e.g. `["aac", "libfdk_aac"]`"""
+        return self._get('aac_encoders', _detect_aac_encoders)
+
+    @property
+    def encoders(self):
+        """list(str): names of all available encoders"""
+        return self._get('encoders', lambda: _detect_names('-encoders'))
+
+    @property
+    def muxers(self):
+        """list(str): names of all available muxers"""
+        return self._get('muxers', lambda: _detect_names('-muxers'))
+
+    @property
+    def mp4box_path(self):
+        """str: path of MP4Box or `None` if it is not installed"""
+        return self._get('mp4box_path', lambda: find_cmd("MP4Box"))
+
+    def clear(self):
+        """Forgets the detected capabilities"""
+        with self._lock:
+            self._values = {}
+            if self.cache_file is not None:
+                self._save()
+
+
+_capabilities = Capabilities(os.environ.get('STEMPEG_CAPABILITIES_CACHE'))
+
+
+def capabilities():
+    """Returns the process-wide `Capabilities` registry
+
+    The registry is persisted to the file set by `set_capabilities_cache`
+    or by the `STEMPEG_CAPABILITIES_CACHE` environment variable.
+
+    Returns:
+        Capabilities: the registry
+    """
+    return _capabilities
+
+
+def set_capabilities_cache(cache_file):
+    """Persists the process-wide registry to `cache_file`
+
+    Args:
+        cache_file (str): Filename of the persistent cache, or `None`
+            to keep the capabilities in memory only.
+    """
+    global _capabilities
+    _capabilities = Capabilities(cache_file)
+
+
+def check_available_aac_encoders():
+    """Returns the available AAC encoders
+
+    The result is detected once, see `capabilities()`.
+
+    Returns:
+        list(str): List of available encoder codecs from ffmpeg
+
+    """
+    return capabilities().aac_encoders
+
+
 def get_aac_codec():
     """Checks codec and warns if `libfdk_aac` codec
      is not available.
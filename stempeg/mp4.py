@@ -0,0 +1,311 @@
+"""
+Editing the MP4 boxes of Native Instruments stem files.
+
+NI stem files are MP4 files with the major brand `M4A ` and the stem
+metadata stored as JSON in the `moov/udta/stem` box. This module inserts
+or replaces that box without MP4Box, so that a multistream file written
+by ffmpeg (e.g. with `stempeg.StreamsWriter`) can be turned into a NI
+stem file without remuxing the audio.
+
+Whenever possible the file is edited in place: the `ftyp` and `moov`
+boxes are rewritten within the space of the old boxes and adjacent
+`free` boxes, or at the end of the file. Otherwise, the file is
+rewritten and the chunk offsets (`stco`/`co64`) are patched to the new
+position of the media data.
+
+"""
+import json
+import os
+import struct
+import tempfile
+
+# boxes that only contain other boxes
+CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'udta', b'edts'}
+
+# boxes that can be overwritten to make room for other boxes
+FREE = {b'free', b'skip'}
+
+NI_BRAND = b'M4A '
+
+
+def _boxes(f, start, end):
+    """Iterates over the boxes of a file between `start` and `end`
+
+    Yields:
+        (type, offset, size, header_size) of each box
+    """
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack('>Q', f.read(8))
+            header_size = 16
+        elif size == 0:
+            # the last box extends to the end of the file
+            size = end - position
+        if size < header_size or position + size > end:
+            raise ValueError("Invalid MP4 box at offset %d" % position)
+        yield box_type, position, size, header_size
+        position += size
+
+
+def _children(data):
+    """Splits the payload of a container box into `(type, box)` pairs"""
+    children = []
+    position = 0
+    while position + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        if size == 1:
+            size, = struct.unpack_from('>Q', data, position + 8)
+        elif size == 0:
+            size = len(data) - position
+        children.append((box_type, data[position:position + size]))
+        position += size
+    return children
+
+
+def _header_size(box):
+    return 16 if struct.unpack_from('>I', box)[0] == 1 else 8
+
+
+def _box(box_type, payload):
+    """Returns a box of `box_type` with `payload`"""
+    size = len(payload) + 8
+    if size > 0xFFFFFFFF:
+        return struct.pack('>I4sQ', 1, box_type, size + 8) + bytes(payload)
+    return struct.pack('>I4s', size, box_type) + bytes(payload)
+
+
+def _free(size):
+    """Returns a `free` box of `size` bytes"""
+    return _box(b'free', bytes(size - 8))
+
+
+def _ftyp(box):
+    """Sets the NI brand of an `ftyp` box, like
+    `MP4Box -brand M4A:0 -rb isom -rb iso2`"""
+    payload = box[_header_size(box):]
+    compatible = [
+        payload[k:k + 4] for k in range(8, len(payload) - 3, 4)
+    ]
+    compatible = [
+        brand for brand in compatible if brand not in (b'isom', b'iso2')
+    ]
+    if NI_BRAND not in compatible:
+        compatible.append(NI_BRAND)
+    return _box(b'ftyp', NI_BRAND + bytes(4) + b''.join(compatible))
+
+
+def _find(box, path):
+    """Returns the box at `path` within a container box or `None`"""
+    for box_type, child in _children(box[_header_size(box):]):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return child
+            return _find(child, path[1:])
+    return None
+
+
+def _set_stem(moov, payload):
+    """Returns `moov` with the `udta/stem` box set to `payload`"""
+    stem = _box(b'stem', payload)
+    children = _children(moov[_header_size(moov):])
+    for k, (box_type, child) in enumerate(children):
+        if box_type == b'udta':
+            udta = [
+                grandchild
+                for grandchild_type, grandchild
+                in _children(child[_header_size(child):])
+                if grandchild_type != b'stem'
+            ] + [stem]
+            children[k] = (box_type, _box(b'udta', b''.join(udta)))
+            break
+    else:
+        children.append((b'udta', _box(b'udta', stem)))
+    return _box(b'moov', b''.join(child for _, child in children))
+
+
+def _patch(moov, shift):
+    """Patches the chunk offsets and alternate groups of the tracks
+
+    Args:
+        moov (bytearray): the `moov` box, modified in place
+        shift (callable): maps an old file offset to the new offset
+    """
+    def _walk(start, end):
+        position = start
+        while position + 8 <= end:
+            size, box_type = struct.unpack_from('>I4s', moov, position)
+            header_size = 8
+            if size == 1:
+                size, = struct.unpack_from('>Q', moov, position + 8)
+                header_size = 16
+            elif size == 0:
+                size = end - position
+            payload = position + header_size
+            if box_type in CONTAINERS:
+                _walk(payload, position + size)
+            elif box_type in (b'stco', b'co64'):
+                entry = '>I' if box_type == b'stco' else '>Q'
+                width = struct.calcsize(entry)
+                nb_entries, = struct.unpack_from('>I', moov, payload + 4)
+                for k in range(nb_entries):
+                    offset = payload + 8 + k * width
+                    value = shift(struct.unpack_from(entry, moov, offset)[0])
+                    if box_type == b'stco' and value > 0xFFFFFFFF:
+                        raise ValueError(
+                            "Chunk offsets exceed the 32 bit range of stco"
+                        )
+                    struct.pack_into(entry, moov, offset, value)
+            elif box_type == b'tkhd':
+                # MP4Box muxes the stems without alternate group, whereas
+                # ffmpeg puts all audio tracks into one group
+                version = moov[payload]
+                offset = payload + (46 if version == 1 else 34)
+                struct.pack_into('>H', moov, offset, 0)
+            position += size
+
+    _walk(_header_size(moov), len(moov))
+
+
+def read_stem_metadata(path):
+    """Reads the NI stem metadata of an MP4 file
+
+    Args:
+        path (str): filename of the stem file, e.g. `track.stem.mp4`.
+
+    Returns:
+        metadata (dict): the decoded `moov/udta/stem` box or `None`
+            if the file has no stem metadata.
+    """
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        try:
+            for box_type, offset, size, header_size in _boxes(f, 0, end):
+                if box_type == b'moov':
+                    f.seek(offset)
+                    stem = _find(f.read(size), [b'udta', b'stem'])
+                    if stem is None:
+                        return None
+                    return json.loads(
+                        stem[_header_size(stem):].decode('utf-8')
+                    )
+        except (ValueError, struct.error):
+            pass
+    return None
+
+
+def _slot(boxes, k, end):
+    """Returns the number of bytes that box `k` can occupy in place"""
+    if k == len(boxes) - 1 or all(
+        box[0] in FREE for box in boxes[k + 1:]
+    ):
+        # the box can be extended at the end of the file
+        return None
+    size = boxes[k][2]
+    for box_type, offset, box_size, header_size in boxes[k + 1:]:
+        if box_type not in FREE:
+            break
+        size += box_size
+    return size
+
+
+def _fits(box, slot):
+    # the remainder of the slot has to hold a `free` box
+    return slot is None or len(box) == slot or len(box) + 8 <= slot
+
+
+def write_stem_metadata(path, metadata):
+    """Writes the NI stem metadata into an MP4 file
+
+    The `stem` box is inserted into `moov/udta` or replaced, and the
+    brands are set to `M4A `, as done by
+    `MP4Box -brand M4A:0 -rb isom -rb iso2 -udta 0:type=stem:src=...`.
+    The file is edited in place, if the new boxes fit into the space of
+    the old ones, otherwise it is rewritten with patched chunk offsets.
+
+    Args:
+        path (str): filename of the MP4 file, e.g. `track.stem.mp4`.
+        metadata (dict): stem metadata, see `stempeg.default_metadata()`.
+
+    >>> stempeg.mp4.write_stem_metadata("track.stem.mp4", metadata)
+    """
+    payload = json.dumps(metadata).encode()
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        boxes = list(_boxes(f, 0, end))
+        types = [box[0] for box in boxes]
+        if types.count(b'ftyp') != 1 or types.count(b'moov') != 1:
+            raise ValueError("%s is not an MP4 file" % path)
+        ftyp_idx = types.index(b'ftyp')
+        moov_idx = types.index(b'moov')
+        f.seek(boxes[ftyp_idx][1])
+        ftyp = _ftyp(f.read(boxes[ftyp_idx][2]))
+        f.seek(boxes[moov_idx][1])
+        moov = bytearray(_set_stem(f.read(boxes[moov_idx][2]), payload))
+
+    ftyp_slot = _slot(boxes, ftyp_idx, end)
+    moov_slot = _slot(boxes, moov_idx, end)
+    if ftyp_idx < moov_idx and _fits(ftyp, ftyp_slot) and (
+        _fits(moov, moov_slot)
+    ):
+        # the media data keeps its position
+        _patch(moov, lambda offset: offset)
+        with open(path, 'r+b') as f:
+            for k, box, slot in (
+                (ftyp_idx, ftyp, ftyp_slot), (moov_idx, moov, moov_slot)
+            ):
+                f.seek(boxes[k][1])
+                f.write(box)
+                if slot is None:
+                    f.truncate()
+                elif slot > len(box):
+                    f.write(_free(slot - len(box)))
+        return
+
+    # rewrite the file, skipping the old padding
+    layout = []
+    position = 0
+    for k, (box_type, offset, size, header_size) in enumerate(boxes):
+        if box_type in FREE:
+            continue
+        new_size = {ftyp_idx: len(ftyp), moov_idx: len(moov)}.get(k, size)
+        layout.append((k, position))
+        position += new_size
+
+    def shift(offset):
+        for k, new_offset in layout:
+            old_offset, size = boxes[k][1], boxes[k][2]
+            if old_offset <= offset < old_offset + size:
+                return offset - old_offset + new_offset
+        raise ValueError("Chunk offset %d is outside of the file" % offset)
+
+    _patch(moov, shift)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out, open(path, 'rb') as f:
+            for k, new_offset in layout:
+                if k == ftyp_idx:
+                    out.write(ftyp)
+                elif k == moov_idx:
+                    out.write(moov)
+                else:
+                    _copy(f, out, boxes[k][1], boxes[k][2])
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _copy(src, dst, offset, size, block_size=1 << 20):
+    """Copies `size` bytes at `offset` of `src` to `dst`"""
+    src.seek(offset)
+    while size > 0:
+        block = src.read(min(block_size, size))
+        if not block:
+            raise ValueError("Unexpected end of file")
+        dst.write(block)
+        size -= len(block)
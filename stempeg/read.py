@@ -4,15 +4,26 @@ Writing module to load stems into numpy tensors.
 
 
 """
-from stempeg.write import FilesWriter
 import numpy as np
 import warnings
-import ffmpeg
 import pprint
-from multiprocessing import Pool
-import atexit
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 import datetime as dt
+import math
+from fractions import Fraction
+import subprocess as sp
+import threading
+
+from . import backends
+from . import cmds
+from . import mp4
+from . import wav
+
+# Seconds of audio that are decoded before the start position when seeking
+# on the input side (`fast_seek=True`), so that the decoder state is
+# identical to decoding the file from the beginning.
+SEEK_PREROLL = 0.5
 
 class Reader(object):
     """Base class for reader
@@ -58,7 +69,10 @@ def _read_ffmpeg(
     duration,
     dtype,
     ffmpeg_format,
-    stem_idx
+    stem_idx,
+    input_rate=None,
+    fast_seek=False,
+    time_unit="seconds"
 ):
     """Loading data using ffmpeg and numpy
 
@@ -70,42 +84,456 @@ def _read_ffmpeg(
         start (float): start position in seconds
         duration (float): duration in seconds
         dtype (numpy.dtype): Type of audio array to be casted into
-        stem_idx (int): stream id
+        stem_idx (int or list): stream id. If a list of stream ids is
+            passed, all streams are decoded within a single ffmpeg
+            process and returned merged into the channel dimension
         ffmpeg_format (str): ffmpeg intermediate format encoding.
             Choose "f32le" for best compatibility
+        input_rate (int): sample rate of the file, needed for `fast_seek`
+        fast_seek (bool): seek on the input side, see `read_stems`
+        time_unit (str): unit of `start` and `duration`,
+            either "seconds" or "samples"
 
     Returns:
-        (array_like): numpy audio array
+        (array_like): numpy audio array of shape `(samples, channels)`.
+            When `stem_idx` is a list the shape is
+            `(samples, len(stem_idx) * channels)`.
     """
-    output_kwargs = {'format': ffmpeg_format, 'ar': sample_rate}
-    if duration is not None:
-        output_kwargs['t'] = str(dt.timedelta(seconds=duration))
-    if start is not None:
-        output_kwargs['ss'] = str(dt.timedelta(seconds=start))
-
-    output_kwargs['map'] = '0:' + str(stem_idx)
-    process = (
-        ffmpeg
-        .input(filename)
-        .output('pipe:', **output_kwargs)
-        .run_async(pipe_stdout=True, pipe_stderr=True))
+    stream = _ffmpeg_stream(
+        filename,
+        sample_rate,
+        start,
+        duration,
+        ffmpeg_format,
+        stem_idx,
+        input_rate=input_rate,
+        fast_seek=fast_seek,
+        time_unit=time_unit
+    )
+    if isinstance(stem_idx, list):
+        channels = channels * len(stem_idx)
+
+    process = cmds.popen(
+        stream.compile(cmd=cmds.ffmpeg_path()), stdout=sp.PIPE, stderr=sp.PIPE
+    )
     buffer, _ = process.communicate()
 
-    # decode to raw pcm format
+    numpy_dtype = _pcm_dtype(ffmpeg_format)
+    waveform = np.frombuffer(buffer, dtype=numpy_dtype).reshape(-1, channels)
+    return _cast(waveform, dtype, numpy_dtype)
+
+
+def _read_ffmpeg_into(
+    out,
+    filename,
+    sample_rate,
+    channels,
+    start,
+    duration,
+    ffmpeg_format,
+    stem_idx,
+    input_rate=None,
+    fast_seek=False,
+    time_unit="seconds",
+    grow=True
+):
+    """Loading data using ffmpeg directly into a preallocated array
+
+    Args:
+        out (array_like): view of shape `(samples, stems, channels)`, where
+            `stems * channels` matches the number of channels decoded by
+            ffmpeg.
+        filename (str): filename path
+        sample_rate (int): sample rate
+        channels (int): total number of channels decoded by ffmpeg
+        start (float): start position in seconds
+        duration (float): duration in seconds
+        ffmpeg_format (str): ffmpeg intermediate format encoding.
+        stem_idx (int or list): stream id or list of stream ids.
+        input_rate (int): sample rate of the file, needed for `fast_seek`
+        fast_seek (bool): seek on the input side, see `read_stems`
+        time_unit (str): unit of `start` and `duration`,
+            either "seconds" or "samples"
+        grow (bool): keep the samples that do not fit into `out`.
+            Otherwise ffmpeg is stopped once `out` is full.
+
+    Returns:
+        nb_frames (int): number of samples written to `out`
+        rest (array_like): decoded samples that did not fit into `out`
+    """
+    stream = _ffmpeg_stream(
+        filename,
+        sample_rate,
+        start,
+        duration,
+        ffmpeg_format,
+        stem_idx,
+        input_rate=input_rate,
+        fast_seek=fast_seek,
+        time_unit=time_unit
+    )
+    # stderr is not read, so it must not be piped to prevent blocking
+    process = cmds.popen(
+        stream.compile(cmd=cmds.ffmpeg_path()),
+        stdout=sp.PIPE,
+        stderr=sp.DEVNULL
+    )
+    try:
+        numpy_dtype = np.dtype(_pcm_dtype(ffmpeg_format))
+        nb_frames = _read_pcm_into(process.stdout, out, numpy_dtype)
+        if grow or nb_frames < out.shape[0]:
+            rest = _pcm_rest(process.stdout.read(), out, numpy_dtype)
+        else:
+            # `out` is full and cannot be grown, skip the rest of the file
+            process.kill()
+            rest = _pcm_rest(b'', out, numpy_dtype)
+    finally:
+        process.stdout.close()
+        process.wait()
+    return nb_frames, rest
+
+
+async def _read_ffmpeg_into_async(
+    out,
+    filename,
+    sample_rate,
+    start,
+    duration,
+    ffmpeg_format,
+    stem_idx,
+    input_rate=None,
+    fast_seek=False,
+    time_unit="seconds",
+    grow=True
+):
+    """Like `_read_ffmpeg_into` but runs ffmpeg with asyncio
+
+    The ffmpeg process is killed if the task is cancelled.
+
+    Returns:
+        nb_frames (int): number of samples written to `out`
+        rest (array_like): decoded samples that did not fit into `out`
+    """
+    stream = _ffmpeg_stream(
+        filename,
+        sample_rate,
+        start,
+        duration,
+        ffmpeg_format,
+        stem_idx,
+        input_rate=input_rate,
+        fast_seek=fast_seek,
+        time_unit=time_unit
+    )
+    process = await cmds.create_subprocess_exec(
+        stream.compile(cmd=cmds.ffmpeg_path()),
+        stdout=sp.PIPE,
+        stderr=sp.DEVNULL
+    )
+
+    async def _communicate():
+        numpy_dtype = np.dtype(_pcm_dtype(ffmpeg_format))
+        nb_frames, buffer = await _read_pcm_into_async(
+            process.stdout, out, numpy_dtype
+        )
+        if grow or nb_frames < out.shape[0]:
+            buffer += await process.stdout.read()
+        else:
+            # `out` is full and cannot be grown, skip the rest of the file
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            buffer = b''
+        await process.wait()
+        return nb_frames, _pcm_rest(buffer, out, numpy_dtype)
+
+    return await cmds.kill_on_cancel(process, _communicate())
+
+
+def _pcm_rest(buffer, out, numpy_dtype):
+    """Converts the raw pcm samples that did not fit into `out`"""
+    frame_size = numpy_dtype.itemsize * int(np.prod(out.shape[1:]))
+    rest = np.frombuffer(
+        buffer,
+        dtype=numpy_dtype,
+        count=len(buffer) // frame_size * frame_size // numpy_dtype.itemsize
+    ).reshape(-1, *out.shape[1:])
+    return _cast(rest, out.dtype, numpy_dtype)
+
+
+def _read_pcm_into(stream, out, numpy_dtype, block_size=65536):
+    """Reads raw pcm samples from a binary stream into an array
+
+    If `out` is contiguous and matches the pcm format, samples are read
+    without any intermediate copy. Otherwise, blocks of `block_size` samples
+    are read and casted into `out` in place.
+
+    Args:
+        stream (io.BufferedReader): binary stream, e.g. ffmpeg stdout
+        out (array_like): array of shape `(samples, ...)`
+        numpy_dtype (np.dtype): dtype of the raw pcm samples
+        block_size (int): number of samples per block
+
+    Returns:
+        int: number of samples written to `out`
+    """
+    frame_size = numpy_dtype.itemsize * int(np.prod(out.shape[1:]))
+
+    def _readinto(buffer):
+        # fill the buffer until the end of the stream is reached
+        pos = 0
+        while pos < len(buffer):
+            nb_bytes = stream.readinto(buffer[pos:])
+            if not nb_bytes:
+                break
+            pos += nb_bytes
+        return pos // frame_size
+
+    if out.dtype == numpy_dtype and out.flags.c_contiguous:
+        return _readinto(memoryview(out.reshape(-1).view(np.uint8)))
+
+    block = np.empty((block_size,) + out.shape[1:], dtype=numpy_dtype)
+    buffer = memoryview(block.reshape(-1).view(np.uint8))
+    pos = 0
+    while pos < out.shape[0]:
+        nb_block = min(block_size, out.shape[0] - pos)
+        nb_frames = _readinto(buffer[:nb_block * frame_size])
+        _assign_pcm(out[pos:pos + nb_frames], block[:nb_frames])
+        pos += nb_frames
+        if nb_frames < nb_block:
+            break
+    return pos
+
+
+def _assign_pcm(target, block):
+    """Casts raw pcm samples into `target`, normalizing integer formats"""
+    target[...] = block
+    if np.issubdtype(block.dtype, np.integer) and np.issubdtype(
+        target.dtype, np.inexact
+    ):
+        # normalize to [-1.0, 1.0] in place
+        target /= np.iinfo(block.dtype).max + 1.0
+
+
+async def _read_pcm_into_async(stream, out, numpy_dtype, block_size=65536):
+    """Reads raw pcm samples from an asyncio stream into an array
+
+    Args:
+        stream (asyncio.StreamReader): binary stream, e.g. ffmpeg stdout
+        out (array_like): array of shape `(samples, ...)`
+        numpy_dtype (np.dtype): dtype of the raw pcm samples
+        block_size (int): number of samples per block
+
+    Returns:
+        nb_frames (int): number of samples written to `out`
+        rest (bytes): bytes that were read but did not fit into `out`
+    """
+    frame_size = numpy_dtype.itemsize * int(np.prod(out.shape[1:]))
+    pending = b''
+    pos = 0
+    while pos < out.shape[0]:
+        data = await stream.read(block_size * frame_size)
+        if not data:
+            break
+        pending += data
+        nb_frames = min(len(pending) // frame_size, out.shape[0] - pos)
+        block = np.frombuffer(
+            pending,
+            dtype=numpy_dtype,
+            count=nb_frames * frame_size // numpy_dtype.itemsize
+        ).reshape(nb_frames, *out.shape[1:])
+        _assign_pcm(out[pos:pos + nb_frames], block)
+        pending = pending[nb_frames * frame_size:]
+        pos += nb_frames
+    return pos, pending
+
+
+def _seek_kwargs(
+    start,
+    duration,
+    sample_rate,
+    input_rate=None,
+    fast_seek=False,
+    time_unit="seconds"
+):
+    """Computes the ffmpeg options to read an excerpt
+
+    By default the excerpt is trimmed on the output side, i.e. ffmpeg
+    decodes the file from the beginning and discards everything before
+    `start`. With `fast_seek`, ffmpeg seeks on the input side to a position
+    `SEEK_PREROLL` seconds before `start`, which is aligned to a full sample
+    and a full microsecond. The remaining offset is then trimmed on the
+    output side relative to that position. Since the decoder state has
+    settled within the preroll, the result is identical to the slow path.
+    This does not hold for decoders with a state that depends on the whole
+    history, e.g. the noise generator of AAC perceptual noise substitution.
+    Fast seeking is only applied when no resampling is required.
+
+    Args:
+        start (float or int): start position
+        duration (float or int): duration
+        sample_rate (int): output sample rate
+        input_rate (int): sample rate of the file
+        fast_seek (bool): seek on the input side
+        time_unit (str): unit of `start` and `duration`,
+            either "seconds" or "samples"
+
+    Returns:
+        input_kwargs (dict): ffmpeg input options
+        output_kwargs (dict): ffmpeg output options
+        trim_kwargs (dict): `atrim` filter options, `None` if not needed
+    """
+    if time_unit not in ("seconds", "samples"):
+        raise ValueError("time_unit has to be 'seconds' or 'samples'")
+
+    input_kwargs, output_kwargs, trim_kwargs = {}, {}, None
+    if time_unit == "seconds" and start is not None:
+        # ffmpeg handles positions in microseconds
+        start_us = dt.timedelta(seconds=start) // dt.timedelta(
+            microseconds=1
+        )
+        start_sample = start_us * sample_rate / 10**6
+    else:
+        start_sample = start
+
+    # position of the input seek in samples
+    offset = 0
+    if (
+        fast_seek and start and input_rate is not None and
+        int(sample_rate) == sample_rate and sample_rate == input_rate
+    ):
+        sample_rate = int(sample_rate)
+        # smallest number of samples that are a multiple of a microsecond
+        align = sample_rate // math.gcd(sample_rate, 10**6)
+        preroll = start_sample - SEEK_PREROLL * sample_rate
+        offset = max(0, int(preroll // align) * align)
+        if offset > 0:
+            offset_us = offset * 10**6 // sample_rate
+            input_kwargs['ss'] = str(dt.timedelta(microseconds=offset_us))
+
+    if time_unit == "seconds":
+        if duration is not None:
+            output_kwargs['t'] = str(dt.timedelta(seconds=duration))
+        if start is not None:
+            if offset > 0:
+                output_kwargs['ss'] = str(
+                    dt.timedelta(microseconds=start_us - offset_us)
+                )
+            else:
+                output_kwargs['ss'] = str(dt.timedelta(seconds=start))
+    elif start is not None or duration is not None:
+        # trim sample exact, relative to the input seek position
+        trim_kwargs = {}
+        if start is not None:
+            trim_kwargs['start_sample'] = int(start) - offset
+        if duration is not None:
+            trim_kwargs['end_sample'] = (
+                int(start or 0) - offset + int(duration)
+            )
+
+    return input_kwargs, output_kwargs, trim_kwargs
+
+
+def _to_samples(position, sample_rate, time_unit="seconds"):
+    """Converts a position to samples, rounded the same way as ffmpeg
+
+    Args:
+        position (float): position or duration in `time_unit`
+        sample_rate (int): sample rate
+        time_unit (str): either "seconds" or "samples"
+
+    Returns:
+        (int): number of samples
+    """
+    if time_unit == "samples":
+        return int(position)
+    elif time_unit == "seconds":
+        us = dt.timedelta(seconds=position) // dt.timedelta(microseconds=1)
+        return (us * int(sample_rate) + 5 * 10**5) // 10**6
+    else:
+        raise ValueError("`time_unit` should be seconds or samples")
+
+
+def _ffmpeg_stream(
+    filename,
+    sample_rate,
+    start,
+    duration,
+    ffmpeg_format,
+    stem_idx,
+    input_rate=None,
+    fast_seek=False,
+    time_unit="seconds"
+):
+    """Builds the ffmpeg graph that decodes substreams to raw pcm on stdout
+
+    Args:
+        filename (str): filename path
+        sample_rate (int): sample rate
+        start (float): start position in seconds
+        duration (float): duration in seconds
+        ffmpeg_format (str): ffmpeg intermediate format encoding.
+        stem_idx (int or list): stream id or list of stream ids.
+            Multiple streams are merged into the channel dimension.
+        input_rate (int): sample rate of the file, needed for `fast_seek`
+        fast_seek (bool): seek on the input side, see `read_stems`
+        time_unit (str): unit of `start` and `duration`,
+            either "seconds" or "samples"
+
+    Returns:
+        (ffmpeg.nodes.OutputStream): ffmpeg-python output node
+    """
+    import ffmpeg
+
+    input_kwargs, output_kwargs, trim_kwargs = _seek_kwargs(
+        start,
+        duration,
+        sample_rate,
+        input_rate=input_rate,
+        fast_seek=fast_seek,
+        time_unit=time_unit
+    )
+    output_kwargs.update({'format': ffmpeg_format, 'ar': sample_rate})
+
+    stream = ffmpeg.input(filename, **input_kwargs)
+    if isinstance(stem_idx, list):
+        # merge all substreams into a single interleaved output, so that
+        # the file is opened and demuxed only once
+        stream = ffmpeg.filter(
+            [stream[str(idx)] for idx in stem_idx],
+            'amerge',
+            inputs=len(stem_idx)
+        )
+    else:
+        stream = stream[str(stem_idx)]
+
+    if trim_kwargs is not None:
+        # sample positions refer to the output sample rate
+        if sample_rate != input_rate:
+            stream = stream.filter('aresample', sample_rate)
+        stream = stream.filter('atrim', **trim_kwargs)
+
+    return stream.output('pipe:', **output_kwargs)
+
+
+def _pcm_dtype(ffmpeg_format):
+    """Returns the numpy dtype matching an ffmpeg raw pcm format"""
     if ffmpeg_format == "f64le":
         # PCM 64 bit float
-        numpy_dtype = '<f8'
+        return '<f8'
     elif ffmpeg_format == "f32le":
         # PCM 32 bit float
-        numpy_dtype = '<f4'
+        return '<f4'
     elif ffmpeg_format == "s16le":
         # PCM 16 bit signed int
-        numpy_dtype = '<i2'
+        return '<i2'
     else:
         raise NotImplementedError("ffmpeg format is not supported")
 
-    waveform = np.frombuffer(buffer, dtype=numpy_dtype).reshape(-1, channels)
 
+def _cast(waveform, dtype, numpy_dtype):
+    """Casts raw pcm to the output dtype, normalizing integer formats"""
     if not waveform.dtype == np.dtype(dtype):
         # cast to target/output dtype
         waveform = waveform.astype(dtype, order='C')
@@ -114,6 +542,294 @@ def _read_ffmpeg(
             waveform = waveform / (np.iinfo(numpy_dtype).max + 1.0)
     return waveform
 
+
+def _get_info(filename, info=None, backend=None):
+    """Returns the `Info` object of a file, probing it if necessary"""
+    import ffmpeg
+
+    try:
+        if info is None:
+            metadata = Info(filename, backend=backend)
+        elif isinstance(info, Info):
+            metadata = info
+        else:
+            # e.g. `stempeg.InfoCache`
+            metadata = info.get(filename)
+    except ffmpeg._run.Error as e:
+        raise Warning(
+            'An error occurs with ffprobe (see ffprobe output below)\n\n{}'
+            .format(e.stderr.decode()))
+    return metadata
+
+
+async def _get_info_async(filename, info=None):
+    """Like `_get_info` but runs ffprobe with asyncio"""
+    import asyncio
+    import ffmpeg
+
+    try:
+        if info is None:
+            metadata = await Info.probe_async(filename)
+        elif isinstance(info, Info):
+            metadata = info
+        else:
+            # caches may block, e.g. `stempeg.InfoCache`
+            metadata = await asyncio.get_running_loop().run_in_executor(
+                None, info.get, filename
+            )
+    except ffmpeg._run.Error as e:
+        raise Warning(
+            'An error occurs with ffprobe (see ffprobe output below)\n\n{}'
+            .format(e.stderr.decode()))
+    return metadata
+
+
+def _select_substreams(metadata, stem_id, reader):
+    """Selects the substreams to be decoded
+
+    Args:
+        metadata (Info): info object of the file
+        stem_id (int or list): substream id(s) or `None` for all substreams
+        reader (Reader): reader configuration
+
+    Returns:
+        substreams (list): list of stream ids
+        channels (int): number of channels per substream
+    """
+    # check number of audio streams in file
+    if 'streams' not in metadata.info or metadata.nb_audio_streams == 0:
+        raise Warning('No audio stream found.')
+
+    # using ChannelReader would ignore substreams
+    if isinstance(reader, ChannelsReader):
+        if metadata.nb_audio_streams != 1:
+            raise Warning(
+                'stempeg.ChannelsReader() only processes the first substream.'
+            )
+        else:
+            if metadata.audio_streams[0][
+                'channels'
+            ] % reader.nb_channels != 0:
+                raise Warning('Stems should be encoded as multi-channel.')
+            else:
+                substreams = 0
+    else:
+        if stem_id is not None:
+            substreams = stem_id
+        else:
+            substreams = metadata.audio_stream_idx()
+
+    if not isinstance(substreams, list):
+        substreams = [substreams]
+
+    _chans = metadata.channels_streams
+    # check if all substreams have the same number of channels
+    if len(set(_chans)) == 1:
+        channels = min(_chans)
+    else:
+        raise RuntimeError("Stems do not have the same number of channels per substream")
+
+    return substreams, channels
+
+
+def _demux_channels(stems, reader):
+    """Demultiplexes stems from channels when `ChannelsReader` is used
+
+    Args:
+        stems (array_like): tensor of shape `(1, samples, channels)`
+        reader (Reader): reader configuration
+
+    Returns:
+        stems (array_like): tensor of shape `(stems, samples, channels)`
+    """
+    if isinstance(reader, (ChannelsReader)) and stems.shape[-1] > 1:
+        stems = stems.transpose(1, 0, 2)
+        stems = stems.reshape(
+            stems.shape[0], stems.shape[1], -1, reader.nb_channels
+        )
+        stems = stems.transpose(2, 0, 3, 1)[..., 0]
+    return stems
+
+
+def _allocate_out(
+    out,
+    metadata,
+    substreams,
+    channels,
+    reader,
+    sample_rate,
+    start,
+    duration,
+    time_unit,
+    dtype
+):
+    """Allocates or validates the output tensor of `read_stems`
+
+    Returns:
+        out (array_like): tensor of shape `(stems, samples, channels)`
+        grow (bool): if the tensor can be grown when the estimated
+            number of samples is too short
+    """
+    # number of stems and channels of the output tensor
+    if isinstance(reader, ChannelsReader):
+        nb_stems = channels // reader.nb_channels
+        nb_channels = reader.nb_channels
+    else:
+        nb_stems = len(substreams)
+        nb_channels = channels
+
+    if out is None:
+        nb_samples = _nb_samples(
+            metadata, substreams, sample_rate, start, duration, time_unit
+        )
+        out = np.empty((nb_stems, nb_samples, nb_channels), dtype=dtype)
+        # allow to grow the tensor if the estimate was too short
+        return out, True
+
+    if out.ndim != 3 or out.shape[0] != nb_stems or (
+        out.shape[2] != nb_channels
+    ):
+        raise ValueError(
+            "`out` should have shape (%d, samples, %d)" % (
+                nb_stems, nb_channels
+            )
+        )
+    return out, False
+
+
+def _decode_jobs(substreams, reader, merge_streams):
+    """Returns the stream id(s) decoded by each ffmpeg process"""
+    if isinstance(reader, ChannelsReader):
+        # demultiplex stems from interleaved channels
+        return [substreams[0]]
+    elif merge_streams and len(substreams) > 1:
+        # the amerge filter stops at the shortest substream
+        return [substreams]
+    else:
+        return substreams
+
+
+def _job_views(out, stem_ids):
+    """Returns the views of shape `(samples, stems, channels)` of `out`
+    that each ffmpeg process decodes into"""
+    if len(stem_ids) == 1:
+        return [out.transpose(1, 0, 2)]
+    else:
+        return [out[k][:, None, :] for k in range(len(stem_ids))]
+
+
+def _gather_stems(out, results, stem_ids, grow):
+    """Trims the output tensor to the decoded length
+
+    Args:
+        out (array_like): output tensor
+        results (list): `(nb_frames, rest)` of each ffmpeg process
+        stem_ids (list): stream id(s) of each ffmpeg process
+        grow (bool): append decoded samples that did not fit into `out`
+
+    Returns:
+        stems (array_like): tensor of `shape=(stems, samples, channels)`
+    """
+    stem_durations = np.array([nb_frames for nb_frames, _ in results])
+    if grow and any(len(rest) for _, rest in results):
+        # the decoded audio is longer than estimated
+        stem_durations += np.array([len(rest) for _, rest in results])
+        grown = np.empty(
+            (out.shape[0], stem_durations.max(), out.shape[2]),
+            dtype=out.dtype
+        )
+        grown[:, :out.shape[1]] = out
+        for (nb_frames, rest), view in zip(
+            results, _job_views(grown, stem_ids)
+        ):
+            view[nb_frames:nb_frames + len(rest)] = rest
+        out = grown
+
+    if not (stem_durations == stem_durations[0]).all():
+        warnings.warn("Stems differ in length and were shortend")
+    nb_samples = np.min(stem_durations)
+    if grow and nb_samples < out.shape[1] // 2:
+        # do not keep a much larger buffer alive through the view
+        return out[:, :nb_samples].copy()
+    return out[:, :nb_samples]
+
+
+def _read_wav(
+    filename,
+    header,
+    start,
+    duration,
+    always_3d,
+    dtype,
+    ffmpeg_format,
+    reader,
+    time_unit,
+    out,
+    mmap
+):
+    """Reads stems from the memory-mapped samples of a WAV file
+
+    The samples are converted like ffmpeg converts them to
+    `ffmpeg_format`, thus the result is identical to decoding the file
+    with ffmpeg.
+
+    Args:
+        filename (str): filename of the WAV file
+        header (wav.Header): header of `filename`
+        mmap (bool): return read-only views of the file, if no
+            conversion is needed
+
+    Returns:
+        stems (array_like): tensor of `shape=(stems, samples, channels)`
+        rate (int): sample rate
+    """
+    rate = header.sample_rate
+    start = _to_samples(start or 0, rate, time_unit)
+    start = min(max(start, 0), header.nb_samples)
+    if duration is None:
+        stop = header.nb_samples
+    else:
+        stop = start + _to_samples(duration, rate, time_unit)
+        stop = min(max(stop, start), header.nb_samples)
+    samples = wav.memmap(filename, header)[start:stop]
+
+    numpy_dtype = np.dtype(_pcm_dtype(ffmpeg_format))
+    if samples.dtype != numpy_dtype:
+        # like ffmpeg's sample format conversion to float
+        waveform = samples.astype(numpy_dtype)
+        if np.issubdtype(samples.dtype, np.integer):
+            waveform *= numpy_dtype.type(
+                1.0 / (np.iinfo(samples.dtype).max + 1.0)
+            )
+        samples = waveform
+
+    # `ChannelsReader` demultiplexes the stems as strided view
+    view = _demux_channels(samples[None], reader)
+
+    if out is None:
+        if mmap and view.dtype == np.dtype(dtype):
+            stems = view
+        else:
+            stems = np.empty(view.shape, dtype=dtype)
+            _assign_pcm(stems, view)
+    elif out.ndim != 3 or out.shape[0] != view.shape[0] or (
+        out.shape[2] != view.shape[2]
+    ):
+        raise ValueError(
+            "`out` should have shape (%d, samples, %d)" % (
+                view.shape[0], view.shape[2]
+            )
+        )
+    else:
+        # samples that do not fit into `out` are discarded
+        stems = out[:, :view.shape[1]]
+        _assign_pcm(stems, view[:, :stems.shape[1]])
+
+    if not always_3d:
+        stems = np.squeeze(stems)
+    return stems, rate
+
+
 def read_stems(
     filename,
     start=None,
@@ -125,7 +841,17 @@ def read_stems(
     info=None,
     sample_rate=None,
     reader=StreamsReader(),
-    multiprocess=False
+    multiprocess=False,
+    merge_streams=False,
+    fast_seek=False,
+    time_unit="seconds",
+    out=None,
+    executor=None,
+    multithread=False,
+    cache_dir=None,
+    memory_cache=None,
+    mmap=False,
+    backend=None
 ):
     """Read stems into numpy tensor
 
@@ -148,7 +874,9 @@ def read_stems(
     Args:
         filename (str): filename of the audio file to load data from.
         start (float): Start offset to load from in seconds.
+            Alternatively, in samples if `time_unit="samples"`.
         duration (float): Duration to load in seconds.
+            Alternatively, in samples if `time_unit="samples"`.
         stem_id (int, optional): substream id,
             defauls to `None` (all substreams are loaded).
         always_3d (bool, optional): By default, reading a
@@ -162,7 +890,8 @@ def read_stems(
             This can be used e.g. the sample rate and length of a track is
             already known in advance. Useful for ML training where the
             info objects can be pre-processed, thus audio loading can
-            be speed up.
+            be speed up. Alternatively, a `stempeg.InfoCache` can be passed
+            to look up the `Info` object from a persistent cache.
         sample_rate (float, optional): Sample rate of returned audio.
             Defaults to `None` which results in
             the sample rate returned from the mixture.
@@ -173,7 +902,63 @@ def read_stems(
                 `ChannelsReader(...)`
                     Read/demultiplexed from multiple channels.
         multiprocess (bool): Applys multi-processing for reading
-            substreams in parallel to speed up reading. Defaults to `True`
+            substreams in parallel to speed up reading. The worker pool is
+            created for each call, use `StemReader` to reuse the workers.
+            Defaults to `False`.
+        merge_streams (bool): Decode all requested substreams within
+            a single ffmpeg process instead of spawning one process
+            per substream. The file is then only opened and demuxed once,
+            which reduces the reading time roughly by the number of stems.
+            Defaults to `False`.
+        fast_seek (bool): Seek to `start` on the input side instead of
+            decoding and discarding everything before `start`. Thereby the
+            reading time of an excerpt does not depend on its position.
+            The result is identical to the default (slow) seeking.
+            Fast seeking is only applied if no resampling is required.
+            Defaults to `False`.
+        time_unit (str): Unit of `start` and `duration`. Either `"seconds"`
+            (default) or `"samples"` of the output sample rate. Sample
+            positions are trimmed sample exact.
+        out (array_like, optional): Preallocated output tensor of
+            `shape=(stems, samples, channels)`, e.g. sized from
+            `Info.nb_samples_streams`. The decoded audio is read from
+            ffmpeg directly into `out` and casted to `out.dtype` in place,
+            which avoids intermediate copies. Audio that does not fit into
+            `out` is discarded. The returned tensor is a view of `out`
+            trimmed to the decoded length. Defaults to `None`, which
+            allocates the output tensor of `dtype`.
+        executor (concurrent.futures.Executor, optional): Executor that
+            decodes the substreams in parallel, e.g. owned by a
+            `StemReader`. With a `ThreadPoolExecutor`, each thread reads
+            its ffmpeg output directly into the output tensor. With a
+            `ProcessPoolExecutor`, the decoded substreams are copied back
+            from the worker processes. Defaults to `None`.
+        multithread (bool): Decodes the substreams in parallel threads.
+            Since the decoding runs in ffmpeg subprocesses, this is as fast
+            as `multiprocess` but avoids copying the decoded audio between
+            processes. Defaults to `False`.
+        cache_dir (str or PCMCache, optional): Directory of a
+            `stempeg.PCMCache`. The full track is decoded once and stored
+            as memory-mapped file, later reads are served from the cache
+            without running ffmpeg. The stems are returned as read-only
+            views of the cache. Defaults to `None` (no caching).
+        memory_cache (TrackCache, optional): In-memory cache of decoded
+            tracks, see `stempeg.TrackCache`. Excerpts of cached tracks are
+            served as read-only views without running ffmpeg. On a miss,
+            the full track is decoded, e.g. from `cache_dir`.
+            Defaults to `None` (no caching).
+        mmap (bool): Uncompressed WAV files (16/32 bit integer and
+            32/64 bit float PCM) are read from a memory map of the file
+            without running ffmpeg, if no resampling is needed. With
+            `mmap=True`, the stems are returned as read-only views of the
+            memory map, if they do not need to be converted to `dtype`,
+            e.g. for `dtype=np.float32` and 32 bit float WAV files.
+            Defaults to `False`, which returns a copy.
+        backend (str or Backend, optional): Backend that probes and
+            decodes the file, e.g. `"cli"` or `"pyav"`, see
+            `stempeg.backends`. Defaults to `None`, which uses the
+            global backend. Process executors are only used by
+            backends that decode in subprocesses.
 
     Returns:
         stems (array_like):
@@ -192,136 +977,852 @@ def read_stems(
     >>> sample_rate
     44100
     """
-    if multiprocess:
-        _pool = Pool()
-        atexit.register(_pool.close)
-    else:
-        _pool = None
-
     if not isinstance(filename, str):
         filename = filename.decode()
 
-    # use ffprobe to get info object (samplerate, lengths)
-    try:
-        if info is None:
-            metadata = Info(filename)
-        else:
-            metadata = info
+    if memory_cache is not None:
+        return memory_cache.read_stems(
+            filename,
+            start=start,
+            duration=duration,
+            stem_id=stem_id,
+            always_3d=always_3d,
+            dtype=dtype,
+            ffmpeg_format=ffmpeg_format,
+            info=info,
+            sample_rate=sample_rate,
+            reader=reader,
+            time_unit=time_unit,
+            out=out,
+            multiprocess=multiprocess,
+            merge_streams=merge_streams,
+            executor=executor,
+            multithread=multithread,
+            cache_dir=cache_dir,
+            backend=backend
+        )
 
-        ffmpeg.probe(filename)
-    except ffmpeg._run.Error as e:
-        raise Warning(
-            'An error occurs with ffprobe (see ffprobe output below)\n\n{}'
-            .format(e.stderr.decode()))
+    if cache_dir is not None:
+        # the cache module depends on this module
+        from .cache import PCMCache
+        if not isinstance(cache_dir, PCMCache):
+            cache_dir = PCMCache(cache_dir)
+        return cache_dir.read_stems(
+            filename,
+            start=start,
+            duration=duration,
+            stem_id=stem_id,
+            always_3d=always_3d,
+            dtype=dtype,
+            ffmpeg_format=ffmpeg_format,
+            info=info,
+            sample_rate=sample_rate,
+            reader=reader,
+            time_unit=time_unit,
+            out=out,
+            multiprocess=multiprocess,
+            merge_streams=merge_streams,
+            executor=executor,
+            multithread=multithread,
+            backend=backend
+        )
 
-    # check number of audio streams in file
-    if 'streams' not in metadata.info or metadata.nb_audio_streams == 0:
-        raise Warning('No audio stream found.')
+    backend = backends.get_backend(backend)
 
-    # using ChannelReader would ignore substreams
-    if isinstance(reader, ChannelsReader):
-        if metadata.nb_audio_streams != 1:
-            raise Warning(
-                'stempeg.ChannelsReader() only processes the first substream.'
-            )
-        else:
-            if metadata.audio_streams[0][
-                'channels'
-            ] % reader.nb_channels != 0:
-                raise Warning('Stems should be encoded as multi-channel.')
-            else:
-                substreams = 0
+    # uncompressed WAV files are memory-mapped instead of decoded
+    header = wav.read_header(filename)
+    if header is not None and info is None:
+        metadata = Info(filename, probe=wav.probe(filename, header))
     else:
-        if stem_id is not None:
-            substreams = stem_id
-        else:
-            substreams = metadata.audio_stream_idx()
+        # use ffprobe to get info object (samplerate, lengths)
+        metadata = _get_info(filename, info, backend)
 
-    if not isinstance(substreams, list):
-        substreams = [substreams]
+    if header is not None and (
+        sample_rate is None or sample_rate == header.sample_rate
+    ) and (
+        # ffmpeg's conversion to integer formats is not reproduced
+        header.dtype == np.dtype(_pcm_dtype(ffmpeg_format)) or
+        ffmpeg_format != "s16le"
+    ) and _select_substreams(metadata, stem_id, reader)[0] == [0]:
+        return _read_wav(
+            filename,
+            header,
+            start,
+            duration,
+            always_3d,
+            dtype,
+            ffmpeg_format,
+            reader,
+            time_unit,
+            out,
+            mmap
+        )
+
+    if multiprocess and executor is None and not backend.in_process:
+        # temporary pool, use `StemReader` to reuse workers across calls
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor() as pool:
+            return read_stems(
+                filename,
+                start=start,
+                duration=duration,
+                stem_id=stem_id,
+                always_3d=always_3d,
+                dtype=dtype,
+                ffmpeg_format=ffmpeg_format,
+                info=metadata,
+                sample_rate=sample_rate,
+                reader=reader,
+                merge_streams=merge_streams,
+                fast_seek=fast_seek,
+                time_unit=time_unit,
+                out=out,
+                executor=pool,
+                backend=backend
+            )
+
+    substreams, channels = _select_substreams(metadata, stem_id, reader)
 
     # if not, get sample rate from mixture
     if sample_rate is None:
         sample_rate = metadata.sample_rate(0)
 
-    _chans = metadata.channels_streams
-    # check if all substreams have the same number of channels
-    if len(set(_chans)) == 1:
-        channels = min(_chans)
+    out, grow = _allocate_out(
+        out,
+        metadata,
+        substreams,
+        channels,
+        reader,
+        sample_rate,
+        start,
+        duration,
+        time_unit,
+        dtype
+    )
+    stem_ids = _decode_jobs(substreams, reader, merge_streams)
+
+    seek_kwargs = dict(
+        input_rate=metadata.sample_rate(0),
+        fast_seek=fast_seek,
+        time_unit=time_unit
+    )
+    if multithread and executor is None and len(stem_ids) > 1:
+        executor = _thread_pool = ThreadPoolExecutor(
+            max_workers=len(stem_ids)
+        )
     else:
-        raise RuntimeError("Stems do not have the same number of channels per substream")
+        _thread_pool = None
 
-    # set channels to minimum channel per stream
-    stems = []
+    try:
+        if isinstance(executor, ThreadPoolExecutor) and len(stem_ids) > 1:
+            # ffmpeg decodes in subprocesses, so that threads are not blocked
+            # by the GIL. Each thread reads its pipe directly into `out`.
+            results = list(
+                executor.map(
+                    lambda job: backend.read_into(
+                        job[1],
+                        filename,
+                        sample_rate,
+                        channels,
+                        start,
+                        duration,
+                        ffmpeg_format,
+                        job[0],
+                        grow=grow,
+                        **seek_kwargs
+                    ),
+                    zip(stem_ids, _job_views(out, stem_ids))
+                )
+            )
+        elif executor is not None and len(stem_ids) > 1 and (
+            not backend.in_process
+        ):
+            # results of worker processes are pickled to the parent process
+            waveforms = executor.map(
+                partial(
+                    _read_ffmpeg,
+                    filename,
+                    sample_rate,
+                    channels,
+                    start,
+                    duration,
+                    out.dtype,
+                    ffmpeg_format,
+                    **seek_kwargs
+                ),
+                stem_ids
+            )
+            results = []
+            for waveform, view in zip(waveforms, _job_views(out, stem_ids)):
+                waveform = waveform.reshape(waveform.shape[0], *view.shape[1:])
+                nb_frames = min(waveform.shape[0], view.shape[0])
+                view[:nb_frames] = waveform[:nb_frames]
+                results.append((nb_frames, waveform[nb_frames:]))
+        else:
+            results = [
+                backend.read_into(
+                    view,
+                    filename,
+                    sample_rate,
+                    channels if isinstance(idx, int) else channels * len(idx),
+                    start,
+                    duration,
+                    ffmpeg_format,
+                    idx,
+                    grow=grow,
+                    **seek_kwargs
+                )
+                for idx, view in zip(stem_ids, _job_views(out, stem_ids))
+            ]
+    finally:
+        if _thread_pool is not None:
+            _thread_pool.shutdown()
 
-    if _pool:
-        results = _pool.map_async(
-            partial(
-                _read_ffmpeg,
-                filename,
+    stems = _gather_stems(out, results, stem_ids, grow)
+    if not always_3d:
+        stems = np.squeeze(stems)
+    return stems, sample_rate
+
+
+def read_stems_batch(
+    requests,
+    sample_rate=None,
+    dtype=np.float32,
+    ffmpeg_format="f32le",
+    info=None,
+    reader=StreamsReader(),
+    nb_samples=None,
+    pad=True,
+    return_mask=False,
+    executor=None,
+    max_workers=None,
+    merge_streams=True,
+    fast_seek=False,
+    time_unit="seconds",
+    memory_cache=None,
+    backend=None
+):
+    """Read a batch of excerpts into a single tensor
+
+    Reads many excerpts with bounded concurrency and stacks them into one
+    tensor of `shape=(batch, stems, samples, channels)`, e.g. to feed
+    the excerpts to a machine learning model. Each excerpt is decoded
+    directly into its slice of the batch tensor.
+
+    Args:
+        requests (list): list of `(filename, start, duration, stem_id)`
+            tuples. Trailing items can be omitted, then they default to
+            `None`, see `read_stems`.
+        sample_rate (float, optional): Sample rate of all excerpts.
+            Defaults to `None`, which uses the sample rate of the first file.
+        dtype (np.dtype, optional): Numpy data type of the batch tensor.
+            Defaults to `np.float32`.
+        ffmpeg_format (str): ffmpeg intermediate format encoding.
+        info (dict or InfoCache, optional): `Info` objects of the files,
+            either as `{filename: Info}` or as `stempeg.InfoCache`.
+            Files that are not available are probed once per call.
+        reader (Reader): Holds parameters for the reading method.
+        nb_samples (int, optional): Number of samples of the batch tensor.
+            Longer excerpts are truncated. Defaults to `None`, which uses
+            the length of the longest excerpt. Excerpts that are longer
+            than estimated from the metadata are then read again.
+        pad (bool): Zero-pads excerpts that are shorter than the batch
+            tensor. If `False`, the batch tensor is cut to the length of the
+            shortest excerpt. Defaults to `True`.
+        return_mask (bool): Additionally returns a boolean mask of
+            `shape=(batch, samples)` that marks the valid samples of each
+            excerpt. Defaults to `False`.
+        executor (concurrent.futures.ThreadPoolExecutor, optional): Shared
+            pool of threads, e.g. owned by a `StemReader`. Defaults to
+            `None`, which creates a temporary pool of `max_workers` threads.
+        max_workers (int, optional): Number of threads of the temporary
+            pool. Defaults to `None`, which uses the number of processors.
+        merge_streams (bool): Decode all substreams of an excerpt within a
+            single ffmpeg process. Defaults to `True`.
+        fast_seek (bool): Seek on the input side, see `read_stems`.
+            Defaults to `False`.
+        time_unit (str): Unit of `start` and `duration`. Either `"seconds"`
+            (default) or `"samples"`.
+        memory_cache (TrackCache, optional): In-memory cache of decoded
+            tracks, so that excerpts of the same track are decoded only
+            once, see `read_stems`. Defaults to `None`.
+        backend (str or Backend, optional): Backend that probes and
+            decodes the files, see `read_stems`. Defaults to `None`.
+
+    Returns:
+        stems (array_like):
+            batch tensor of `shape=(batch, stems, samples, channels)`
+        rate (float):
+            sample rate
+        mask (array_like):
+            boolean tensor of `shape=(batch, samples)`,
+            only returned if `return_mask=True`.
+
+    >>> requests = [("a.stem.mp4", 10.0, 5.0), ("b.stem.mp4", 30.0, 5.0)]
+    >>> S, rate = stempeg.read_stems_batch(requests)
+    >>> S.shape
+    (2, 5, 220500, 2)
+    """
+    requests = [
+        tuple(request) + (None,) * (4 - len(request)) for request in requests
+    ]
+    if not requests:
+        raise ValueError("Please provide at least one request")
+
+    # probe every file at most once
+    infos = {}
+    for filename, _, _, _ in requests:
+        if filename in infos:
+            continue
+        if isinstance(info, dict):
+            infos[filename] = _get_info(
+                filename, info.get(filename), backend
+            )
+        else:
+            infos[filename] = _get_info(filename, info, backend)
+
+    if sample_rate is None:
+        sample_rate = infos[requests[0][0]].sample_rate(0)
+
+    shapes = set()
+    estimates = []
+    for filename, start, duration, stem_id in requests:
+        substreams, channels = _select_substreams(
+            infos[filename], stem_id, reader
+        )
+        if isinstance(reader, ChannelsReader):
+            shapes.add((channels // reader.nb_channels, reader.nb_channels))
+        else:
+            shapes.add((len(substreams), channels))
+        estimates.append(
+            _nb_samples(
+                infos[filename],
+                substreams,
                 sample_rate,
-                channels,
                 start,
                 duration,
-                dtype,
-                ffmpeg_format
-            ),
-            substreams,
-            callback=stems.extend
+                time_unit
+            )
+        )
+
+    if len(shapes) != 1:
+        raise ValueError(
+            "All excerpts need the same number of stems and channels"
+        )
+    nb_stems, nb_channels = shapes.pop()
+
+    # with an estimated length, truncated excerpts are read again
+    truncate = nb_samples is not None
+    if nb_samples is None:
+        nb_samples = max(estimates)
+    batch = np.zeros(
+        (len(requests), nb_stems, nb_samples, nb_channels), dtype=dtype
+    )
+
+    def _read_stems(k, out=None):
+        filename, start, duration, stem_id = requests[k]
+        stems, _ = read_stems(
+            filename,
+            start=start,
+            duration=duration,
+            stem_id=stem_id,
+            always_3d=True,
+            dtype=dtype,
+            ffmpeg_format=ffmpeg_format,
+            info=infos[filename],
+            sample_rate=sample_rate,
+            reader=reader,
+            merge_streams=merge_streams,
+            fast_seek=fast_seek,
+            time_unit=time_unit,
+            out=out,
+            memory_cache=memory_cache,
+            backend=backend
+        )
+        return stems
+
+    def _read(k):
+        length = _read_stems(k, out=batch[k]).shape[1]
+        if truncate or length < batch.shape[2]:
+            return length, None
+        # the excerpt fills the batch tensor, so the estimated length
+        # might have been too short
+        stems = _read_stems(k)
+        return stems.shape[1], stems
+
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_read, range(len(requests))))
+    else:
+        results = list(executor.map(_read, range(len(requests))))
+    lengths = np.array([length for length, _ in results])
+
+    if lengths.max() > batch.shape[2]:
+        grown = np.zeros(
+            batch.shape[:2] + (lengths.max(),) + batch.shape[3:],
+            dtype=dtype
         )
-        results.wait()
-        _pool.terminate()
+        grown[:, :, :batch.shape[2]] = batch
+        for k, (length, stems) in enumerate(results):
+            if stems is not None:
+                grown[k, :, :length] = stems
+        batch = grown
+
+    if pad:
+        batch = batch[:, :, :lengths.max()]
     else:
-        stems = [
-            _read_ffmpeg(
+        batch = batch[:, :, :lengths.min()]
+
+    if return_mask:
+        mask = np.arange(batch.shape[2])[None, :] < lengths[:, None]
+        return batch, sample_rate, mask
+    else:
+        return batch, sample_rate
+
+
+async def read_stems_async(
+    filename,
+    start=None,
+    duration=None,
+    stem_id=None,
+    always_3d=False,
+    dtype=np.float64,
+    ffmpeg_format="f32le",
+    info=None,
+    sample_rate=None,
+    reader=StreamsReader(),
+    merge_streams=False,
+    fast_seek=False,
+    time_unit="seconds",
+    out=None
+):
+    """Read stems into numpy tensor within an asyncio event loop
+
+    Coroutine version of `read_stems`. ffprobe and ffmpeg are run with
+    `asyncio.create_subprocess_exec` and their pipes are read without
+    blocking the event loop, so that a single event loop can drive many
+    concurrent reads. The substreams of a file are decoded concurrently.
+    If the task is cancelled, the ffmpeg processes are killed.
+
+    Takes the same arguments as `read_stems`, except for the
+    multiprocessing and caching options.
+
+    Returns:
+        stems (array_like):
+            stems tensor of `shape=(stem x samples x channels)`
+        rate (float):
+            sample rate
+
+    >>> audio, sample_rate = await stempeg.read_stems_async("test.stem.mp4")
+    """
+    import asyncio
+
+    if not isinstance(filename, str):
+        filename = filename.decode()
+
+    metadata = await _get_info_async(filename, info)
+    substreams, channels = _select_substreams(metadata, stem_id, reader)
+
+    if sample_rate is None:
+        sample_rate = metadata.sample_rate(0)
+
+    out, grow = _allocate_out(
+        out,
+        metadata,
+        substreams,
+        channels,
+        reader,
+        sample_rate,
+        start,
+        duration,
+        time_unit,
+        dtype
+    )
+    stem_ids = _decode_jobs(substreams, reader, merge_streams)
+
+    tasks = [
+        asyncio.ensure_future(
+            _read_ffmpeg_into_async(
+                view,
                 filename,
                 sample_rate,
-                channels,
                 start,
                 duration,
-                dtype,
                 ffmpeg_format,
-                stem_idx
+                idx,
+                input_rate=metadata.sample_rate(0),
+                fast_seek=fast_seek,
+                time_unit=time_unit,
+                grow=grow
             )
-            for stem_idx in substreams
-        ]
-    stem_durations = np.array([t.shape[0] for t in stems])
-    if not (stem_durations == stem_durations[0]).all():
-        warnings.warning("Stems differ in length and were shortend")
-        min_length = np.min(stem_durations)
-        stems = [t[:min_length, :] for t in stems]
-
-    # aggregate list of stems to numpy tensor
-    stems = np.array(stems)
-
-    # If ChannelsReader is used, demultiplex from channels
-    if isinstance(reader, (ChannelsReader)) and stems.shape[-1] > 1:
-        stems = stems.transpose(1, 0, 2)
-        stems = stems.reshape(
-            stems.shape[0], stems.shape[1], -1, reader.nb_channels
         )
-        stems = stems.transpose(2, 0, 3, 1)[..., 0]
+        for idx, view in zip(stem_ids, _job_views(out, stem_ids))
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # stop the remaining ffmpeg processes
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
+    stems = _gather_stems(out, results, stem_ids, grow)
     if not always_3d:
         stems = np.squeeze(stems)
     return stems, sample_rate
 
 
+class StemReader(object):
+    """Reusable stems reader with a persistent pool of workers
+
+    `read_stems(multiprocess=True)` creates a new worker pool on every call.
+    When many files are read, e.g. in a data loader, `StemReader` keeps a
+    bounded pool of workers alive, so that repeated reads do not pay the
+    startup cost of the pool.
+
+    Args:
+        executor (str): Type of workers, either `"thread"` (default) or
+            `"process"`. Decoding runs in ffmpeg subprocesses, therefore
+            threads are sufficient in most cases.
+        max_workers (int, optional): Maximum number of workers.
+            Defaults to `None`, which uses the number of processors.
+        **kwargs: Default keyword arguments passed to `read_stems`,
+            e.g. `dtype` or `sample_rate`. A `memory_cache` is shared
+            by the threads and requires `executor="thread"`.
+
+    >>> with stempeg.StemReader(max_workers=4, dtype=np.float32) as reader:
+    >>>     S, rate = reader.read("test.stem.mp4")
+    >>>     batch = reader.read_many(["a.stem.mp4", "b.stem.mp4"])
+    """
+
+    def __init__(self, executor="thread", max_workers=None, **kwargs):
+        if executor == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        elif executor == "process":
+            if kwargs.get('memory_cache') is not None:
+                raise ValueError(
+                    "memory_cache requires a thread based reader"
+                )
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError("executor has to be 'thread' or 'process'")
+        self.kwargs = kwargs
+
+    def read(self, filename, **kwargs):
+        """Reads a single file, decoding its substreams in parallel
+
+        Args:
+            filename (str): filename of the audio file to load data from.
+            **kwargs: keyword arguments passed to `read_stems`, overriding
+                the defaults of the reader.
+
+        Returns:
+            stems (array_like): stems tensor
+            rate (float): sample rate
+        """
+        return read_stems(
+            filename, executor=self._executor, **dict(self.kwargs, **kwargs)
+        )
+
+    def read_many(self, filenames, **kwargs):
+        """Reads multiple files in parallel, one file per worker
+
+        Args:
+            filenames (list): filenames of the audio files.
+            **kwargs: keyword arguments passed to `read_stems`, overriding
+                the defaults of the reader.
+
+        Returns:
+            list: list of `(stems, rate)` tuples in the order of `filenames`
+        """
+        return list(
+            self._executor.map(
+                partial(read_stems, **dict(self.kwargs, **kwargs)),
+                filenames
+            )
+        )
+
+    def read_batch(self, requests, **kwargs):
+        """Reads a batch of excerpts using the workers of the reader
+
+        See `read_stems_batch`. Requires `executor="thread"`.
+
+        Args:
+            requests (list): list of `(filename, start, duration, stem_id)`
+            **kwargs: keyword arguments passed to `read_stems_batch`.
+
+        Returns:
+            stems (array_like): batch tensor
+            rate (float): sample rate
+        """
+        if not isinstance(self._executor, ThreadPoolExecutor):
+            raise RuntimeError("read_batch requires a thread based reader")
+
+        # only pass defaults that are supported by `read_stems_batch`
+        defaults = {
+            key: value for key, value in self.kwargs.items()
+            if key in (
+                'sample_rate', 'dtype', 'ffmpeg_format', 'info', 'reader',
+                'merge_streams', 'fast_seek', 'time_unit', 'memory_cache',
+                'backend'
+            )
+        }
+        return read_stems_batch(
+            requests, executor=self._executor, **dict(defaults, **kwargs)
+        )
+
+    def close(self):
+        """Shuts down the workers"""
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _nb_samples(metadata, substreams, sample_rate, start, duration, time_unit):
+    """Estimates an upper bound of the number of samples to be decoded
+
+    Args:
+        metadata (Info): info object of the file
+        substreams (list): list of stream ids to be decoded
+        sample_rate (int): output sample rate
+        start (float or int): start position
+        duration (float or int): duration
+        time_unit (str): unit of `start` and `duration`
+
+    Returns:
+        int: number of samples
+    """
+    # headroom for resampling and inaccurate container metadata
+    margin = 2048
+
+    if time_unit == "samples":
+        start_sample = start or 0
+        nb_duration = duration
+    else:
+        start_sample = int((start or 0) * sample_rate)
+        nb_duration = None if duration is None else int(
+            math.ceil(duration * sample_rate)
+        )
+
+    audio_idx = metadata.audio_stream_idx()
+    try:
+        nb_samples = max(
+            int(math.ceil(
+                metadata.samples(audio_idx.index(idx)) * sample_rate /
+                metadata.sample_rate(audio_idx.index(idx))
+            ))
+            for idx in substreams
+        )
+    except (KeyError, ValueError):
+        nb_samples = None
+    try:
+        # the container duration bounds inaccurate stream metadata
+        nb_container = int(math.ceil(
+            float(metadata.info['format']['duration']) * sample_rate
+        ))
+    except (KeyError, ValueError, TypeError):
+        nb_container = None
+    if nb_samples is None:
+        # the duration is not available for all containers, the output
+        # tensor is then grown while decoding
+        nb_samples = nb_container
+    elif nb_container is not None:
+        nb_samples = min(nb_samples, nb_container)
+    if nb_samples is not None:
+        nb_samples -= start_sample
+
+    if nb_duration is not None:
+        if nb_samples is None:
+            nb_samples = nb_duration
+        else:
+            nb_samples = min(nb_samples, nb_duration)
+    elif nb_samples is None:
+        nb_samples = 10 * int(sample_rate)
+
+    return max(nb_samples, 0) + margin
+
+
+def stream_stems(
+    filename,
+    block_size=4096,
+    start=None,
+    duration=None,
+    stem_id=None,
+    always_3d=False,
+    dtype=np.float64,
+    ffmpeg_format="f32le",
+    info=None,
+    sample_rate=None,
+    reader=StreamsReader(),
+    fast_seek=False,
+    time_unit="seconds"
+):
+    """Read stems block-wise into numpy tensors
+
+    Generator version of `read_stems`. Instead of decoding the whole file
+    into memory, blocks of `block_size` samples are read from the ffmpeg
+    output pipe as soon as they arrive. Thereby the memory usage is
+    bounded by the block size, which makes it suitable to process long
+    recordings. All substreams are decoded within a single ffmpeg process.
+
+    Args:
+        filename (str): filename of the audio file to load data from.
+        block_size (int): Number of samples per block. Defaults to `4096`.
+            The last block can be shorter.
+        start (float): Start offset to load from in seconds.
+        duration (float): Duration to load in seconds.
+        stem_id (int, optional): substream id,
+            defauls to `None` (all substreams are loaded).
+        always_3d (bool, optional): By default, blocks of single-stream
+            audio files are returned as two-dimensional arrays.
+            With ``always_3d=True``, blocks are always returned as
+            three-dimensional arrays.
+        dtype (np.dtype, optional): Numpy data type to use.
+        ffmpeg_format (str): ffmpeg intermediate format encoding.
+        info (Info, Optional): Pass ffmpeg `Info` object to reduce number
+            of os calls on file.
+        sample_rate (float, optional): Sample rate of returned audio.
+            Defaults to `None` which results in
+            the sample rate returned from the mixture.
+        reader (Reader): Holds parameters for the reading method.
+            See `read_stems`.
+        fast_seek (bool): Seek to `start` on the input side.
+            See `read_stems`.
+        time_unit (str): Unit of `start` and `duration`. Either `"seconds"`
+            (default) or `"samples"`.
+
+    Yields:
+        stems (array_like):
+            stems tensor of `shape=(stem x block_size x channels)`
+
+    >>> for block in stempeg.stream_stems("test.stem.mp4", block_size=1024):
+    >>>     block.shape
+    (5, 1024, 2)
+    """
+    if not isinstance(filename, str):
+        filename = filename.decode()
+
+    metadata = _get_info(filename, info)
+    substreams, channels = _select_substreams(metadata, stem_id, reader)
+
+    if sample_rate is None:
+        sample_rate = metadata.sample_rate(0)
+
+    stream = _ffmpeg_stream(
+        filename,
+        sample_rate,
+        start,
+        duration,
+        ffmpeg_format,
+        substreams if len(substreams) > 1 else substreams[0],
+        input_rate=metadata.sample_rate(0),
+        fast_seek=fast_seek,
+        time_unit=time_unit
+    )
+    nb_stems = len(substreams)
+    numpy_dtype = np.dtype(_pcm_dtype(ffmpeg_format))
+    frame_size = nb_stems * channels * numpy_dtype.itemsize
+
+    process = cmds.popen(
+        stream.global_args('-loglevel', 'error').compile(
+            cmd=cmds.ffmpeg_path()
+        ),
+        stdout=sp.PIPE,
+        stderr=sp.PIPE
+    )
+    # drain stderr, so that ffmpeg does not block on a full pipe
+    stderr = []
+    drain = threading.Thread(
+        target=lambda: stderr.append(process.stderr.read()), daemon=True
+    )
+    drain.start()
+    try:
+        while True:
+            buffer = process.stdout.read(block_size * frame_size)
+            # drop incomplete trailing frames
+            nb_frames = len(buffer) // frame_size
+            if nb_frames == 0:
+                break
+
+            # (samples, stems * channels) -> (stems, samples, channels)
+            block = np.frombuffer(
+                buffer, dtype=numpy_dtype, count=nb_frames * nb_stems * channels
+            ).reshape(nb_frames, nb_stems, channels).transpose(1, 0, 2)
+            block = _cast(block, dtype, numpy_dtype)
+            block = _demux_channels(block, reader)
+
+            if not always_3d:
+                # never squeeze the samples dimension
+                if block.shape[0] == 1:
+                    block = block[0]
+                if block.shape[-1] == 1:
+                    block = block[..., 0]
+            yield block
+
+        process.stdout.close()
+        returncode = process.wait()
+        drain.join()
+        if returncode != 0:
+            raise Warning(
+                'FFMPEG error: {}'.format(b''.join(stderr).decode())
+            )
+    finally:
+        # stop decoding if the generator was closed early
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        drain.join()
+
+
 class Info(object):
     """Audio properties that hold a number of metadata.
 
     The object is created when can be used when `read_stems` is called.
     This is can be passed, to `read_stems` to reduce loading time.
+
+    Args:
+        filename (str): filename of the audio file.
+        probe (dict, optional): Previously obtained ffprobe output of
+            `filename`, e.g. from `stempeg.InfoCache`. Defaults to `None`,
+            which runs ffprobe on `filename`.
+        backend (str or Backend, optional): Backend that probes
+            `filename`, see `stempeg.backends`. Defaults to `None`,
+            which uses the global backend.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, probe=None, backend=None):
         super(Info, self).__init__()
-        self.info = ffmpeg.probe(filename)
+        self.filename = filename
+        if probe is None:
+            probe = backends.get_backend(backend).probe(filename)
+        self.info = probe
         self.audio_streams = [
             stream for stream in self.info['streams']
             if stream['codec_type'] == 'audio'
         ]
 
+    @classmethod
+    async def probe_async(cls, filename):
+        """Creates the `Info` object of a file, running ffprobe with asyncio
+
+        Args:
+            filename (str): filename of the audio file.
+
+        Returns:
+            info (Info): info object of the file
+
+        >>> info = await stempeg.Info.probe_async("test.stem.mp4")
+        """
+        return cls(filename, probe=await cmds.probe_async(filename))
+
     @property
     def nb_audio_streams(self):
         """Returns the number of audio substreams"""
@@ -354,13 +1855,37 @@ class Info(object):
             for stream in self.audio_streams
         ]
 
+    @property
+    def stem_metadata(self):
+        """Returns the Native Instruments stem metadata
+
+        The metadata is read from the `stem` box of mp4 files, see
+        `stempeg.mp4`. `None` if the file has no stem metadata.
+        """
+        if 'mp4' not in self.info['format']['format_name'].split(','):
+            return None
+        return mp4.read_stem_metadata(self.filename)
+
     def audio_stream_idx(self):
         """Returns audio substream indices"""
         return [s['index'] for s in self.audio_streams]
 
     def samples(self, idx):
-        """Returns the number of samples for a stream index"""
-        return int(self.audio_streams[idx]['duration_ts'])
+        """Returns the number of samples for a stream index
+
+        `duration_ts` is given in units of the `time_base` of the stream,
+        e.g. `1/14112000` for mp3, and is converted to samples. If it is
+        not available, the number of samples is derived from `duration`.
+        """
+        stream = self.audio_streams[idx]
+        if 'duration_ts' in stream:
+            duration = int(stream['duration_ts'])
+            if 'time_base' not in stream:
+                return duration
+            duration = Fraction(stream['time_base']) * duration
+        else:
+            duration = Fraction(stream['duration'])
+        return int(round(duration * self.sample_rate(idx)))
 
     def duration(self, idx):
         """Returns the duration (in seconds) for a stream index"""
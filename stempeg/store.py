@@ -0,0 +1,366 @@
+"""
+Chunked stem store for fast random access reading.
+
+A stem store holds the decoded stems of a single track in one file:
+
+- an 8 byte magic `b"STEMPEG\\x01"`,
+- the length of the header as little endian uint32,
+- the JSON header with the stem titles, sample rate, number of channels,
+  lengths, dtype and the byte offset of each chunk (the index),
+- fixed-size PCM chunks, aligned to `ALIGNMENT` bytes.
+
+Each chunk holds `chunk_size` samples of all stems with the shape
+`(stems, chunk_size, channels)`, the last chunk is zero-padded. Thereby an
+excerpt is located in O(1) and read as a contiguous region of the
+memory-mapped file.
+
+"""
+import copy
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from . import read
+from .read import read_stems
+from .write import write_stems, StreamsWriter, ChannelsWriter
+
+MAGIC = b"STEMPEG\x01"
+VERSION = 1
+ALIGNMENT = 4096
+
+
+def write_store(
+    path,
+    data,
+    sample_rate,
+    titles=None,
+    chunk_size=44100,
+    dtype=np.float32
+):
+    """Writes a stems tensor to a chunked stem store
+
+    The file is written to a temporary file first and renamed,
+    so that readers never see a partially written store.
+
+    Args:
+        path (str): filename of the store, e.g. `track.stems`.
+        data (array_like): stems tensor of `shape=(stems, samples, channels)`
+        sample_rate (int): sample rate of `data`.
+        titles (list, optional): list of stem titles.
+            Defaults to `None`.
+        chunk_size (int): number of samples per chunk.
+            Defaults to `44100`.
+        dtype (np.dtype): data type of the stored samples.
+            Defaults to `np.float32`.
+    """
+    if data.ndim != 3:
+        raise RuntimeError("Input tensor dimension should be 3d")
+    nb_stems, nb_samples, nb_channels = data.shape
+    dtype = np.dtype(dtype).newbyteorder('<')
+    chunk_bytes = nb_stems * chunk_size * nb_channels * dtype.itemsize
+    nb_chunks = -(-nb_samples // chunk_size)
+
+    def _header(data_offset):
+        return json.dumps({
+            'version': VERSION,
+            'sample_rate': sample_rate,
+            'nb_stems': nb_stems,
+            'nb_samples': nb_samples,
+            'nb_channels': nb_channels,
+            'dtype': dtype.str,
+            'chunk_size': chunk_size,
+            'titles': titles,
+            'index': [
+                data_offset + k * chunk_bytes for k in range(nb_chunks)
+            ]
+        }).encode()
+
+    # the header size depends on the offsets of the chunks
+    data_offset = 0
+    while True:
+        header = _header(data_offset)
+        size = len(MAGIC) + 4 + len(header)
+        aligned = -(-size // ALIGNMENT) * ALIGNMENT
+        if aligned == data_offset:
+            break
+        data_offset = aligned
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(b'\0' * (data_offset - size))
+            chunk = np.zeros((nb_stems, chunk_size, nb_channels), dtype=dtype)
+            for k in range(nb_chunks):
+                samples = data[:, k * chunk_size:(k + 1) * chunk_size]
+                chunk[:, :samples.shape[1]] = samples
+                chunk[:, samples.shape[1]:] = 0
+                f.write(chunk.tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class StemStore(object):
+    """Reader of a chunked stem store
+
+    The store is memory-mapped, so that reading an excerpt only
+    touches the chunks that overlap with it.
+
+    Args:
+        path (str): filename of the store.
+
+    >>> with stempeg.StemStore("track.stems") as store:
+    >>>     S, rate = store.read(start=60.0, duration=5.0)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a stem store" % path)
+            header_size, = struct.unpack('<I', f.read(4))
+            self.header = json.loads(f.read(header_size).decode())
+
+        if self.header['version'] != VERSION:
+            raise ValueError(
+                "Unsupported stem store version %d" % self.header['version']
+            )
+        index = self.header['index']
+        shape = (
+            len(index),
+            self.nb_stems,
+            self.header['chunk_size'],
+            self.nb_channels
+        )
+        if index:
+            self._chunks = np.memmap(
+                path,
+                dtype=self.dtype,
+                mode='r',
+                offset=index[0],
+                shape=shape
+            )
+        else:
+            self._chunks = np.zeros(shape, dtype=self.dtype)
+
+    @property
+    def sample_rate(self):
+        return self.header['sample_rate']
+
+    @property
+    def nb_stems(self):
+        return self.header['nb_stems']
+
+    @property
+    def nb_samples(self):
+        return self.header['nb_samples']
+
+    @property
+    def nb_channels(self):
+        return self.header['nb_channels']
+
+    @property
+    def dtype(self):
+        return np.dtype(self.header['dtype'])
+
+    @property
+    def titles(self):
+        return self.header['titles']
+
+    def read(
+        self,
+        start=None,
+        duration=None,
+        stem_id=None,
+        always_3d=False,
+        dtype=None,
+        time_unit="seconds",
+        out=None
+    ):
+        """Reads stems from the store
+
+        Takes the same arguments as `stempeg.read_stems`.
+        Note that `stem_id` refers to the position of the stem in the store.
+
+        Args:
+            start (float): Start offset to load from in seconds.
+                Alternatively, in samples if `time_unit="samples"`.
+            duration (float): Duration to load in seconds.
+                Alternatively, in samples if `time_unit="samples"`.
+            stem_id (int or list, optional): stem id(s),
+                defauls to `None` (all stems are loaded).
+            always_3d (bool, optional): Always return a 3d tensor.
+            dtype (np.dtype, optional): Numpy data type to use,
+                defaults to the dtype of the store.
+            time_unit (str): Unit of `start` and `duration`. Either
+                `"seconds"` (default) or `"samples"`.
+            out (array_like, optional): Preallocated output tensor of
+                `shape=(stems, samples, channels)`.
+
+        Returns:
+            stems (array_like):
+                stems tensor of `shape=(stem x samples x channels)`
+            rate (float):
+                sample rate
+        """
+        chunk_size = self.header['chunk_size']
+        start = read._to_samples(start or 0, self.sample_rate, time_unit)
+        start = min(max(start, 0), self.nb_samples)
+        if duration is None:
+            stop = self.nb_samples
+        else:
+            stop = start + read._to_samples(
+                duration, self.sample_rate, time_unit
+            )
+            stop = min(max(stop, start), self.nb_samples)
+
+        if stem_id is None:
+            positions = slice(None)
+            nb_stems = self.nb_stems
+        else:
+            positions = stem_id if isinstance(stem_id, list) else [stem_id]
+            nb_stems = len(positions)
+
+        if out is None:
+            out = np.empty(
+                (nb_stems, stop - start, self.nb_channels),
+                dtype=self.dtype if dtype is None else dtype
+            )
+        elif out.ndim != 3 or out.shape[0] != nb_stems or (
+            out.shape[2] != self.nb_channels
+        ):
+            raise ValueError(
+                "`out` should have shape (%d, samples, %d)" % (
+                    nb_stems, self.nb_channels
+                )
+            )
+        stop = min(stop, start + out.shape[1])
+
+        # copy the overlapping part of each chunk
+        position = start
+        while position < stop:
+            k, offset = divmod(position, chunk_size)
+            nb_frames = min(chunk_size - offset, stop - position)
+            out[:, position - start:position - start + nb_frames] = (
+                self._chunks[k, positions, offset:offset + nb_frames]
+            )
+            position += nb_frames
+
+        stems = out[:, :stop - start]
+        if not always_3d:
+            stems = np.squeeze(stems)
+        return stems, self.sample_rate
+
+    def close(self):
+        """Releases the memory map"""
+        self._chunks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "StemStore(%r, stems=%d, samples=%d, channels=%d, rate=%s)" % (
+            self.path,
+            self.nb_stems,
+            self.nb_samples,
+            self.nb_channels,
+            self.sample_rate
+        )
+
+
+def read_store(path, **kwargs):
+    """Reads stems from a chunked stem store
+
+    Args:
+        path (str): filename of the store.
+        **kwargs: arguments of `StemStore.read`.
+
+    Returns:
+        stems (array_like):
+            stems tensor of `shape=(stem x samples x channels)`
+        rate (float):
+            sample rate
+    """
+    with StemStore(path) as store:
+        return store.read(**kwargs)
+
+
+def convert_to_store(
+    filename,
+    path,
+    chunk_size=44100,
+    dtype=np.float32,
+    info=None,
+    **kwargs
+):
+    """Converts a stems file to a chunked stem store
+
+    The stems are decoded with `stempeg.read_stems`.
+
+    Args:
+        filename (str): filename of the stems file, e.g. `track.stem.mp4`.
+        path (str): filename of the store, e.g. `track.stems`.
+        chunk_size (int): number of samples per chunk.
+            Defaults to `44100`.
+        dtype (np.dtype): data type of the stored samples.
+            Defaults to `np.float32`.
+        info (Info, optional): info object of `filename`.
+        **kwargs: additional arguments of `stempeg.read_stems`,
+            e.g. `sample_rate` or `stem_id`.
+    """
+    info = read._get_info(filename, info)
+    stems, rate = read_stems(
+        filename, always_3d=True, dtype=dtype, info=info, **kwargs
+    )
+    titles = None
+    if not isinstance(kwargs.get('reader'), read.ChannelsReader):
+        stem_id = kwargs.get('stem_id')
+        if stem_id is None:
+            stem_id = info.audio_stream_idx()
+        elif not isinstance(stem_id, list):
+            stem_id = [stem_id]
+        titles = [
+            info.audio_streams[
+                info.audio_stream_idx().index(idx)
+            ].get('tags', {}).get('handler_name')
+            for idx in stem_id
+        ]
+    write_store(
+        path, stems, rate, titles=titles, chunk_size=chunk_size, dtype=dtype
+    )
+
+
+def export_store(path, filename, writer=StreamsWriter()):
+    """Exports a chunked stem store with `stempeg.write_stems`
+
+    Args:
+        path (str): filename of the store.
+        filename (str): output filename, e.g. `track.stem.mp4`.
+        writer (Writer): writer of `stempeg.write_stems`.
+            If the store has unique stem titles, they are used as
+            stem names. Defaults to `StreamsWriter()`.
+    """
+    with StemStore(path) as store:
+        stems, rate = store.read(always_3d=True)
+        titles = store.titles
+
+    if (
+        titles and None not in titles and len(set(titles)) == len(titles) and
+        not isinstance(writer, ChannelsWriter)
+    ):
+        stems = dict(zip(titles, stems))
+    # `write_stems` sets the stem names on the writer, which must not
+    # leak into other calls, e.g. through the default argument
+    writer = copy.copy(writer)
+    return write_stems(filename, stems, sample_rate=rate, writer=writer)
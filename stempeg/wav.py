@@ -0,0 +1,171 @@
+"""
+Memory-mapped reading of uncompressed WAV files.
+
+PCM and IEEE float WAV files, e.g. written by `stempeg.ChannelsWriter`,
+store the interleaved samples as a single contiguous `data` chunk. The
+header is parsed in Python, so that the samples can be accessed as a
+memory-mapped array of `shape=(samples, channels)` without running
+ffmpeg or ffprobe.
+
+"""
+import os
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# sample formats that map to a little endian numpy dtype
+DTYPES = {
+    (WAVE_FORMAT_PCM, 16): '<i2',
+    (WAVE_FORMAT_PCM, 32): '<i4',
+    (WAVE_FORMAT_IEEE_FLOAT, 32): '<f4',
+    (WAVE_FORMAT_IEEE_FLOAT, 64): '<f8',
+}
+
+# ffmpeg codec names of the sample formats
+CODECS = {
+    '<i2': 'pcm_s16le',
+    '<i4': 'pcm_s32le',
+    '<f4': 'pcm_f32le',
+    '<f8': 'pcm_f64le',
+}
+
+
+class Header(object):
+    """Layout of the samples of a WAV file
+
+    Attributes:
+        sample_rate (int): sample rate
+        nb_channels (int): number of interleaved channels
+        nb_samples (int): number of samples per channel
+        dtype (np.dtype): data type of the samples
+        offset (int): byte offset of the samples in the file
+    """
+
+    def __init__(self, sample_rate, nb_channels, nb_samples, dtype, offset):
+        self.sample_rate = sample_rate
+        self.nb_channels = nb_channels
+        self.nb_samples = nb_samples
+        self.dtype = np.dtype(dtype)
+        self.offset = offset
+
+    def __repr__(self):
+        return "Header(rate=%d, channels=%d, samples=%d, dtype=%s)" % (
+            self.sample_rate, self.nb_channels, self.nb_samples, self.dtype
+        )
+
+
+def read_header(filename):
+    """Parses the header of a WAV file
+
+    Args:
+        filename (str): filename of the audio file.
+
+    Returns:
+        header (Header): layout of the samples or `None` if the file is
+            not a WAV file with one of the sample formats of `DTYPES`.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                return None
+            size = f.seek(0, os.SEEK_END)
+            position = 12
+            fmt = None
+            while position + 8 <= size:
+                f.seek(position)
+                chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                elif chunk_id == b'data':
+                    break
+                # chunks are padded to an even size
+                position += 8 + chunk_size + chunk_size % 2
+            else:
+                return None
+    except (OSError, struct.error):
+        return None
+
+    if fmt is None or len(fmt) < 16:
+        return None
+    format_tag, nb_channels, sample_rate, _, block_align, bits = (
+        struct.unpack('<HHIIHH', fmt[:16])
+    )
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        if len(fmt) < 26:
+            return None
+        # the sub format GUID starts with the format tag
+        format_tag, = struct.unpack('<H', fmt[24:26])
+    dtype = DTYPES.get((format_tag, bits))
+    if dtype is None or nb_channels == 0 or (
+        block_align != nb_channels * bits // 8
+    ):
+        return None
+
+    offset = position + 8
+    # the size of the data chunk is not set for streamed files
+    data_size = min(chunk_size, size - offset)
+    return Header(
+        sample_rate, nb_channels, data_size // block_align, dtype, offset
+    )
+
+
+def memmap(filename, header=None):
+    """Memory-maps the samples of a WAV file
+
+    Args:
+        filename (str): filename of the audio file.
+        header (Header, optional): header of `filename`.
+
+    Returns:
+        samples (np.memmap): read-only array of
+            `shape=(samples, channels)`
+    """
+    if header is None:
+        header = read_header(filename)
+        if header is None:
+            raise ValueError("%s is not a PCM WAV file" % filename)
+    if header.nb_samples == 0:
+        return np.zeros((0, header.nb_channels), dtype=header.dtype)
+    return np.memmap(
+        filename,
+        dtype=header.dtype,
+        mode='r',
+        offset=header.offset,
+        shape=(header.nb_samples, header.nb_channels)
+    )
+
+
+def probe(filename, header):
+    """Returns the subset of the ffprobe output used by `stempeg.Info`
+
+    Args:
+        filename (str): filename of the audio file.
+        header (Header): header of `filename`.
+
+    Returns:
+        dict: ffprobe-like description of the file
+    """
+    duration = "%f" % (header.nb_samples / header.sample_rate)
+    return {
+        'streams': [{
+            'index': 0,
+            'codec_name': CODECS[header.dtype.str],
+            'codec_type': 'audio',
+            'sample_rate': str(header.sample_rate),
+            'channels': header.nb_channels,
+            'duration_ts': header.nb_samples,
+            'duration': duration,
+            'tags': {}
+        }],
+        'format': {
+            'filename': filename,
+            'nb_streams': 1,
+            'format_name': 'wav',
+            'duration': duration
+        }
+    }
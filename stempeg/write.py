@@ -5,22 +5,28 @@ Writing module to save stems to disk.
 """
 
 import base64
+import copy
 import json
 import logging
+import os
 import tempfile as tmp
 import warnings
 from itertools import chain
-from multiprocessing import Pool
 from pathlib import Path
 import subprocess as sp
 import atexit
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
-import ffmpeg
 import numpy as np
 
 import stempeg
 
-from .cmds import FFMPEG_PATH, mp4box_exists, get_aac_codec, find_cmd
+from . import backends
+from . import cmds
+from . import mp4
+from .cmds import get_aac_codec
 
 
 def _build_channel_map(nb_stems, nb_channels, stem_names=None):
@@ -124,6 +130,52 @@ def _build_channel_map(nb_stems, nb_channels, stem_names=None):
         raise NotImplementedError("Stempeg only support mono or stereo stems")
 
 
+def _stream_map(stem_ids, stem_names):
+    """Returns the ffmpeg arguments that map the substreams `stem_ids` of
+    the first input to the output streams, titled like `_build_channel_map`
+    """
+    if len(stem_names) != len(stem_ids):
+        raise RuntimeError("Please provide a stem names for each stream")
+    return list(
+        chain.from_iterable(
+            [
+                [
+                    '-map',
+                    "0:%d" % stem_id,
+                    # add title tag (e.g. displayed by VLC)
+                    "-metadata:s:a:%d" % idx,
+                    "title=%s" % stem_name,
+                    # add handler tag (e.g. read by ffmpeg < 4.1)
+                    "-metadata:s:a:%d" % idx,
+                    "handler=%s" % stem_name,
+                    # add handler tag for ffmpeg >= 4.1
+                    "-metadata:s:a:%d" % idx,
+                    "handler_name=%s" % stem_name
+                ]
+                for idx, (stem_id, stem_name)
+                in enumerate(zip(stem_ids, stem_names))
+            ]
+        )
+    )
+
+
+def _encoder_args(codec, bitrate, sample_rate):
+    """Returns the ffmpeg output arguments of the encoder"""
+    return (
+        (['-c:a', codec] if codec is not None else []) +
+        (['-ar', "%d" % sample_rate] if sample_rate is not None else []) +
+        ['-strict', '-2'] +
+        (['-ab', str(bitrate)] if bitrate is not None else [])
+    )
+
+
+def _check_call(cmd):
+    try:
+        cmds.check_call(cmd)
+    except sp.CalledProcessError as err:
+        raise RuntimeError(err) from None
+
+
 class Writer(object):
     """Base template class for writer
 
@@ -143,6 +195,41 @@ class Writer(object):
         """
         pass
 
+    async def write_async(self, data, path, sample_rate):
+        """Coroutine version of the forward path
+
+        Writers that do not implement it natively are run in a thread
+        of the default executor of the event loop.
+
+        Args:
+            data (array): stems tensor of shape `(stems, samples, channel)`
+            path (str): path with extension
+            sample_rate (float): audio sample rate
+        """
+        import asyncio
+
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(self, data=data, path=path, sample_rate=sample_rate)
+        )
+
+    def _transcode(self, src, path, info, stem_ids, stem_names, sample_rate):
+        """Writes the substreams `stem_ids` of `src` with a single ffmpeg
+        process, see `transcode`
+
+        Args:
+            src (str): filename of the source file
+            path (str): path with extension
+            info (Info): info object of `src`
+            stem_ids (list(int)): stream ids of the stems in `src`
+            stem_names (list(str)): titles of the streams of `src` or
+                `None`, if they are missing or not unique
+            sample_rate (float): output sample rate or `None`, which
+                leaves the choice to the encoder
+        """
+        raise NotImplementedError(
+            "%s does not support transcoding" % self.__class__.__name__
+        )
+
 
 class FilesWriter(Writer):
     r"""Save Stems as multiple files
@@ -166,6 +253,9 @@ class FilesWriter(Writer):
             Can speed up writing of large files. Defaults to `False`.
         synchronous bool:
             Write multiprocessed synchronous. Defaults to `True`.
+        backend (str or Backend, optional): Backend that encodes the
+            stems, see `stempeg.backends`. Defaults to `None`, which
+            uses the global backend.
     """
     def __init__(
         self,
@@ -174,14 +264,18 @@ class FilesWriter(Writer):
         output_sample_rate=44100,
         stem_names=None,
         multiprocess=False,
-        synchronous=True
+        synchronous=True,
+        backend=None
     ):
         self.codec = codec
+        self.backend = backend
         self.bitrate = bitrate
         self.output_sample_rate = output_sample_rate
         self.stem_names = stem_names
         self.synchronous = synchronous
         if multiprocess:
+            from multiprocessing import Pool
+
             self._pool = Pool()
             atexit.register(self._pool.close)
         else:
@@ -220,24 +314,9 @@ class FilesWriter(Writer):
             sample_rate: float
                 audio sample rate
         """
-        nb_stems = data.shape[0]
-
-        if self.output_sample_rate is None:
-            self.output_sample_rate = sample_rate
-
-        if self.stem_names is None:
-            self.stem_names = ["Stem_" + str(k) for k in range(nb_stems)]
-
-        for idx in range(nb_stems):
-            if type(path) is tuple:
-                stem_filepath = str(Path(
-                    path[0], self.stem_names[idx] + path[1]
-                ))
-            else:
-                p = Path(path)
-                stem_filepath = str(Path(
-                    p.parent, self.stem_names[idx] + p.suffix
-                ))
+        for idx, stem_filepath in enumerate(
+            self._stem_paths(path, data.shape[0], sample_rate)
+        ):
             if self._pool:
                 task = self._pool.apply_async(
                     write_audio,
@@ -247,7 +326,9 @@ class FilesWriter(Writer):
                         sample_rate,
                         self.output_sample_rate,
                         self.codec,
-                        self.bitrate
+                        self.bitrate,
+                        None,
+                        self.backend
                     )
                 )
                 self._tasks.append(task)
@@ -258,11 +339,74 @@ class FilesWriter(Writer):
                     sample_rate=sample_rate,
                     output_sample_rate=self.output_sample_rate,
                     codec=self.codec,
-                    bitrate=self.bitrate
+                    bitrate=self.bitrate,
+                    backend=self.backend
                 )
         if self.synchronous and self._pool:
             self.join()
 
+    def _stem_paths(self, path, nb_stems, sample_rate):
+        """Returns the output filename of each stem"""
+        if self.output_sample_rate is None:
+            self.output_sample_rate = sample_rate
+
+        if self.stem_names is None:
+            self.stem_names = ["Stem_" + str(k) for k in range(nb_stems)]
+
+        paths = []
+        for idx in range(nb_stems):
+            if type(path) is tuple:
+                stem_filepath = str(Path(
+                    path[0], self.stem_names[idx] + path[1]
+                ))
+            else:
+                p = Path(path)
+                stem_filepath = str(Path(
+                    p.parent, self.stem_names[idx] + p.suffix
+                ))
+            paths.append(stem_filepath)
+        return paths
+
+    def _transcode(self, src, path, info, stem_ids, stem_names, sample_rate):
+        """Encodes each stem to its file, all by one ffmpeg process"""
+        writer = copy.copy(self)
+        if self.stem_names is None:
+            writer.stem_names = stem_names
+        elif len(self.stem_names) != len(stem_ids):
+            raise RuntimeError("Please provide a stem names for each stream")
+        paths = writer._stem_paths(path, len(stem_ids), sample_rate)
+        cmd = [cmds.ffmpeg_path(), '-y', '-i', src, '-loglevel', 'error']
+        for stem_id, stem_path in zip(stem_ids, paths):
+            Path(stem_path).parent.mkdir(parents=True, exist_ok=True)
+            cmd += ['-map', "0:%d" % stem_id] + _encoder_args(
+                self.codec, self.bitrate, sample_rate
+            ) + [stem_path]
+        _check_call(cmd)
+
+    async def write_async(self, data, path, sample_rate):
+        """Encodes all stems concurrently, see `__call__`"""
+        import asyncio
+
+        if not isinstance(
+            backends.get_backend(self.backend), backends.CLIBackend
+        ):
+            return await super(FilesWriter, self).write_async(
+                data, path, sample_rate
+            )
+        await asyncio.gather(*[
+            write_audio_async(
+                path=stem_filepath,
+                data=data[idx],
+                sample_rate=sample_rate,
+                output_sample_rate=self.output_sample_rate,
+                codec=self.codec,
+                bitrate=self.bitrate
+            )
+            for idx, stem_filepath in enumerate(
+                self._stem_paths(path, data.shape[0], sample_rate)
+            )
+        ])
+
 
 class ChannelsWriter(Writer):
     """Write stems using multichannel audio
@@ -279,16 +423,21 @@ class ChannelsWriter(Writer):
         output_sample_rate (float, optional): Optionally, applies
             resampling, if different to `sample_rate`.
             Defaults to `None` which `sample_rate`.
+        backend (str or Backend, optional): Backend that encodes the
+            audio, see `stempeg.backends`. Defaults to `None`, which
+            uses the global backend.
     """
     def __init__(
         self,
         codec=None,
         bitrate=None,
-        output_sample_rate=None
+        output_sample_rate=None,
+        backend=None
     ):
         self.codec = codec
         self.bitrate = bitrate
         self.output_sample_rate = output_sample_rate
+        self.backend = backend
 
     def __call__(
         self,
@@ -309,6 +458,33 @@ class ChannelsWriter(Writer):
             path (str): path with extension.
             sample_rate (float): audio sample rate.
         """
+        write_audio(
+            backend=self.backend,
+            **self._write_audio_kwargs(data, path, sample_rate)
+        )
+
+    def _transcode(self, src, path, info, stem_ids, stem_names, sample_rate):
+        """Merges the channels of the stems by the `amerge` filter"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        if len(stem_ids) > 1:
+            graph = [
+                '-filter_complex',
+                "%samerge=inputs=%d[a]" % (
+                    "".join("[0:%d]" % stem_id for stem_id in stem_ids),
+                    len(stem_ids)
+                ),
+                '-map', '[a]'
+            ]
+        else:
+            graph = ['-map', "0:%d" % stem_ids[0]]
+        _check_call(
+            [cmds.ffmpeg_path(), '-y', '-i', src, '-loglevel', 'error'] +
+            graph +
+            _encoder_args(self.codec, self.bitrate, sample_rate) +
+            [path]
+        )
+
+    def _write_audio_kwargs(self, data, path, sample_rate):
         # check output sample rate
         if self.output_sample_rate is None:
             self.output_sample_rate = sample_rate
@@ -321,7 +497,7 @@ class ChannelsWriter(Writer):
         data = data.reshape(nb_samples, -1)
 
         data = np.squeeze(data)
-        write_audio(
+        return dict(
             path=path,
             data=data,
             sample_rate=sample_rate,
@@ -330,6 +506,18 @@ class ChannelsWriter(Writer):
             bitrate=self.bitrate
         )
 
+    async def write_async(self, data, path, sample_rate):
+        """Coroutine version of `__call__`"""
+        if not isinstance(
+            backends.get_backend(self.backend), backends.CLIBackend
+        ):
+            return await super(ChannelsWriter, self).write_async(
+                data, path, sample_rate
+            )
+        await write_audio_async(
+            **self._write_audio_kwargs(data, path, sample_rate)
+        )
+
 
 class StreamsWriter(Writer):
     """Write stems using multi-stream audio.
@@ -339,8 +527,8 @@ class StreamsWriter(Writer):
     E.g. supported formats are mp4, ogg.
 
     The `stem_names` are inserted into the metadata.
-    Note that this writer converts to substreams using a
-    temporary wav file written to disk. Therefore, writing can be slow.
+    By default, the float samples are piped into a single ffmpeg process
+    that splits the channels into substreams and encodes them.
 
     Args:
         codec (str): Specifies ffmpeg codec being used.
@@ -352,18 +540,30 @@ class StreamsWriter(Writer):
             Defaults to `None` which `sample_rate`.
         stem_names (str): list of stem names that
             match the number of stems.
+        direct (bool): Pipe the samples directly into ffmpeg. If `False`,
+            the samples are written to a temporary 16 bit wav file first,
+            which is then converted to substreams by a second ffmpeg
+            process. Defaults to `True`.
+        backend (str or Backend, optional): Backend that encodes the
+            stems, see `stempeg.backends`. Defaults to `None`, which
+            uses the global backend. `direct` only applies to the
+            `"cli"` backend.
     """
     def __init__(
         self,
         codec=None,
         bitrate=None,
         output_sample_rate=None,
-        stem_names=None
+        stem_names=None,
+        direct=True,
+        backend=None
     ):
         self.codec = codec
         self.bitrate = bitrate
         self.output_sample_rate = output_sample_rate
         self.stem_names = stem_names
+        self.direct = direct
+        self.backend = backend
 
     def __call__(
         self,
@@ -377,18 +577,43 @@ class StreamsWriter(Writer):
             path (str): path with extension
             sample_rate (float): audio sample rate
         """
-        nb_stems, nb_samples, nb_channels = data.shape
-
-        if self.output_sample_rate is None:
-            self.output_sample_rate = sample_rate
-
-        if self.stem_names is None:
-            self.stem_names = ["Stem " + str(k) for k in range(nb_stems)]
+        backend = backends.get_backend(self.backend)
+        if not isinstance(backend, backends.CLIBackend):
+            if self.stem_names is None:
+                self.stem_names = [
+                    "Stem " + str(k) for k in range(data.shape[0])
+                ]
+            backend.write_streams(
+                path,
+                data,
+                sample_rate,
+                output_sample_rate=self.output_sample_rate,
+                codec=self.codec,
+                bitrate=self.bitrate,
+                stem_names=self.stem_names
+            )
+            return
 
-        # (stems, samples, channels) -> (samples, stems, channels)
-        data = data.transpose(1, 0, 2)
-        # aggregate stem and channels
-        data = data.reshape(nb_samples, -1)
+        nb_stems, nb_samples, nb_channels = data.shape
+        data = self._multiplex(data, sample_rate)
+
+        if self.direct:
+            pipe = _FFmpegPipe(
+                self._command(
+                    _pipe_input_args(sample_rate, data.shape[1]),
+                    path,
+                    nb_stems,
+                    nb_channels,
+                    sample_rate
+                )
+            )
+            try:
+                pipe.write(data)
+            except BaseException:
+                pipe.kill()
+                raise
+            pipe.close()
+            return
 
         # stems as multistream file (real stems)
         # create temporary file and merge afterwards
@@ -401,51 +626,175 @@ class StreamsWriter(Writer):
                 output_sample_rate=self.output_sample_rate,
                 codec='pcm_s16le'
             )
-
-            # check if path is available and creat it
-            Path(path).parent.mkdir(parents=True, exist_ok=True)
-
-            channel_map = _build_channel_map(
-                nb_stems=nb_stems,
-                nb_channels=nb_channels,
-                stem_names=self.stem_names
-            )
-
-            # convert tempfile to multistem file assuming
-            # each stem occupies a pair of channels
-            cmd = (
-                [
-                    FFMPEG_PATH,
-                    '-y',
-                    '-acodec', 'pcm_s%dle' % (16),
-                    '-i', tempfile.name
-                ] + channel_map +
-                [
-                    '-vn'
-                ] +
-                (
-                    ['-c:a', self.codec]
-                    if (self.codec is not None) else []
-                ) +
-                [
-                    '-ar', "%d" % self.output_sample_rate,
-                    '-strict', '-2',
-                    '-loglevel', 'error'
-                ] +
-                (
-                    [
-                        '-ab', str(self.bitrate)
-                    ] if (self.bitrate is not None) else []
-                ) +
-                [path]
+            cmd = self._command(
+                ['-acodec', 'pcm_s16le', '-i', tempfile.name],
+                path,
+                nb_stems,
+                nb_channels,
+                sample_rate
             )
             try:
-                sp.check_call(cmd)
+                cmds.check_call(cmd)
             except sp.CalledProcessError as err:
                 raise RuntimeError(err) from None
             finally:
                 tempfile.close()
 
+    async def write_async(self, data, path, sample_rate):
+        """Coroutine version of `__call__`"""
+        if not isinstance(
+            backends.get_backend(self.backend), backends.CLIBackend
+        ):
+            return await super(StreamsWriter, self).write_async(
+                data, path, sample_rate
+            )
+        nb_stems, nb_samples, nb_channels = data.shape
+        data = self._multiplex(data, sample_rate)
+
+        if self.direct:
+            cmd = self._command(
+                _pipe_input_args(sample_rate, data.shape[1]),
+                path,
+                nb_stems,
+                nb_channels,
+                sample_rate
+            )
+            returncode, err = await _pipe_async(cmd, data)
+            if returncode:
+                raise RuntimeError(
+                    sp.CalledProcessError(returncode, cmd, stderr=err)
+                )
+            return
+
+        with tmp.NamedTemporaryFile(suffix='.wav') as tempfile:
+            await write_audio_async(
+                path=tempfile.name,
+                data=data,
+                sample_rate=sample_rate,
+                output_sample_rate=self.output_sample_rate,
+                codec='pcm_s16le'
+            )
+            cmd = self._command(
+                ['-acodec', 'pcm_s16le', '-i', tempfile.name],
+                path,
+                nb_stems,
+                nb_channels,
+                sample_rate
+            )
+            returncode, _, err = await cmds.communicate_async(cmd)
+            if returncode:
+                raise RuntimeError(
+                    sp.CalledProcessError(returncode, cmd, stderr=err)
+                )
+
+    def _multiplex(self, data, sample_rate):
+        """Sets the defaults and aggregates the stems into channels"""
+        nb_stems, nb_samples, nb_channels = data.shape
+
+        if self.output_sample_rate is None:
+            self.output_sample_rate = sample_rate
+
+        if self.stem_names is None:
+            self.stem_names = ["Stem " + str(k) for k in range(nb_stems)]
+
+        # (stems, samples, channels) -> (samples, stems, channels)
+        data = data.transpose(1, 0, 2)
+        # aggregate stem and channels
+        return data.reshape(nb_samples, -1)
+
+    def _transcode(
+        self,
+        src,
+        path,
+        info,
+        stem_ids,
+        stem_names,
+        sample_rate,
+        output_args=None
+    ):
+        """Maps the substreams of `src` to the substreams of `path`
+
+        Args:
+            output_args (list, optional): additional output arguments
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        if self.stem_names is not None:
+            stem_names = self.stem_names
+        if stem_names is None:
+            stem_names = ["Stem " + str(k) for k in range(len(stem_ids))]
+        _check_call(
+            [cmds.ffmpeg_path(), '-y', '-i', src, '-loglevel', 'error'] +
+            _stream_map(stem_ids, stem_names) +
+            ['-vn'] +
+            _encoder_args(self.codec, self.bitrate, sample_rate) +
+            (output_args or []) +
+            [path]
+        )
+
+    def _command(
+        self,
+        input_args,
+        path,
+        nb_stems,
+        nb_channels,
+        sample_rate,
+        output_args=None
+    ):
+        """Returns the ffmpeg command that maps the channels of
+        the input to substreams
+
+        Args:
+            input_args (list): ffmpeg arguments of the multichannel input
+            path (str): path with extension
+            nb_stems (int): number of stems
+            nb_channels (int): number of channels per stem
+            sample_rate (float): audio sample rate
+            output_args (list, optional): additional output arguments
+        """
+        # check if path is available and creat it
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        output_sample_rate = self.output_sample_rate
+        if output_sample_rate is None:
+            output_sample_rate = sample_rate
+        stem_names = self.stem_names
+        if stem_names is None:
+            stem_names = ["Stem " + str(k) for k in range(nb_stems)]
+
+        channel_map = _build_channel_map(
+            nb_stems=nb_stems,
+            nb_channels=nb_channels,
+            stem_names=stem_names
+        )
+
+        # convert input to multistem file assuming
+        # each stem occupies a pair of channels
+        return (
+            [
+                cmds.ffmpeg_path(),
+                '-y'
+            ] + input_args + channel_map +
+            [
+                '-vn'
+            ] +
+            (
+                ['-c:a', self.codec]
+                if (self.codec is not None) else []
+            ) +
+            [
+                '-ar', "%d" % output_sample_rate,
+                '-strict', '-2',
+                '-loglevel', 'error'
+            ] +
+            (
+                [
+                    '-ab', str(self.bitrate)
+                ] if (self.bitrate is not None) else []
+            ) +
+            (output_args or []) +
+            [path]
+        )
+
 
 class NIStemsWriter(Writer):
     """Write stems using native instruments stems format
@@ -458,8 +807,11 @@ class NIStemsWriter(Writer):
     By definition, this format only supports _five_ audio streams where
     stream index 0 is the mixture.
 
-    This writer creates intermediate temporary files, which can result in slow
-    writing. Therefore, `StemsWriter` should be used in all cases where Traktor
+    If MP4Box is installed, the stems are encoded to intermediate
+    temporary files in parallel, which are then muxed by MP4Box. With
+    `single_pass=True`, the stems are encoded into a single multistream
+    file by one ffmpeg process and the NI metadata is added by
+    `stempeg.mp4`, without MP4Box and without remuxing. Still, `StreamsWriter` should be used in all cases where Traktor
     compatibility is not necessary.
 
     Process is originally created by Native Instrument as shown here:
@@ -482,6 +834,15 @@ class NIStemsWriter(Writer):
         output_sample_rate Optional: float
             Optionally, applies resampling, if different to `sample_rate`.
             Defaults to `None` which `sample_rate`.
+        max_workers Optional: int
+            Maximum number of stems that are encoded in parallel.
+            Defaults to `None` which uses the number of CPUs, at most
+            one encoder per stem.
+        single_pass: bool
+            Encode all stems into the output file with a single ffmpeg
+            process and add the NI metadata afterwards, instead of
+            muxing intermediate files with MP4Box. Defaults to `None`,
+            which uses MP4Box if it is installed.
     """
     def __init__(
         self,
@@ -489,19 +850,25 @@ class NIStemsWriter(Writer):
         stems_metadata=None,
         codec='aac',
         bitrate=256000,
-        output_sample_rate=44100
+        output_sample_rate=44100,
+        max_workers=None,
+        single_pass=None
     ):
-        if not mp4box_exists():
+        if single_pass is None:
+            single_pass = cmds.capabilities().mp4box_path is None
+        if not single_pass and cmds.capabilities().mp4box_path is None:
             raise RuntimeError(
                 'MP4Box could not be found! '
                 'Please install them before using NIStemsWriter().'
                 'See: https://github.com/faroit/stempeg'
             )
-        self.mp4boxcli = find_cmd("MP4Box")
+        self.mp4boxcli = cmds.capabilities().mp4box_path
         self.bitrate = bitrate
         self.default_metadata = default_metadata
         self.stems_metadata = stems_metadata
         self.output_sample_rate = output_sample_rate
+        self.max_workers = max_workers
+        self.single_pass = single_pass
         self._suffix = '.m4a'  # internal suffix for temporarly file
         if codec == 'aac':
             self.codec = get_aac_codec()
@@ -540,56 +907,194 @@ class NIStemsWriter(Writer):
                 "the AAC encoder add silence to the input signal"
             )
 
+        metadata = self._metadata()
+
+        if self.single_pass:
+            self._encode_streams(data, path, sample_rate, metadata)
+            mp4.write_stem_metadata(path, metadata)
+            return
+
         # write m4a files to temporary folder
         with tmp.TemporaryDirectory() as tempdir:
-            write_stems(
-                Path(tempdir, 'tmp' + self._suffix),
-                data,
-                sample_rate=sample_rate,
-                writer=FilesWriter(
-                    codec=self.codec,
-                    bitrate=self.bitrate,
+            paths = self._encode_files(data, tempdir, sample_rate)
+
+            callArgs = ["-add", paths[0] + "#ID=Z", path]
+            for stem_path in paths[1:]:
+                callArgs.extend(["-add", stem_path + "#ID=Z:disable"])
+            self._mp4box(callArgs + self._metadata_args(metadata))
+
+    def _metadata(self):
+        """Returns the NI metadata that is stored in the `stem` atom"""
+        if self.default_metadata is None:
+            with open(stempeg.default_metadata()) as f:
+                metadata = json.load(f)
+        else:
+            metadata = self.default_metadata
+
+        # replace stems metadata from dict
+        if self.stems_metadata is not None:
+            metadata['stems'] = self.stems_metadata
+        return metadata
+
+    def _metadata_args(self, metadata):
+        """Returns the MP4Box arguments that add the metadata for NI
+        compatibility"""
+        return [
+            '-brand', 'M4A:0', '-rb', 'isom', '-rb', 'iso2',
+            "-udta",
+            "0:type=stem:src=base64," + base64.b64encode(
+                json.dumps(metadata).encode()
+            ).decode(),
+            "-quiet"
+        ]
+
+    def _mp4box(self, args):
+        try:
+            cmds.check_call([self.mp4boxcli] + args)
+        except sp.CalledProcessError as err:
+            raise RuntimeError(err) from None
+
+    def _encode_files(self, data, directory, sample_rate):
+        """Encodes each stem to an m4a file, running up to `max_workers`
+        ffmpeg processes in parallel
+
+        Returns:
+            paths (list): filenames of the encoded stems
+        """
+        paths = [
+            str(Path(directory, str(k) + self._suffix))
+            for k in range(data.shape[0])
+        ]
+        max_workers = self.max_workers
+        if max_workers is None:
+            max_workers = min(len(paths), os.cpu_count() or 1)
+
+        # the encoding runs in the ffmpeg processes, threads only feed them
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(
+                    write_audio,
+                    path=stem_path,
+                    data=data[k],
+                    sample_rate=sample_rate,
                     output_sample_rate=self.output_sample_rate,
-                    stem_names=[str(k) for k in range(data.shape[0])]
+                    codec=self.codec,
+                    bitrate=self.bitrate
                 )
+                for k, stem_path in enumerate(paths)
+            ]
+            for future in futures:
+                future.result()
+        return paths
+
+    def _streams_writer(self, nb_stems, metadata):
+        """Returns the `StreamsWriter` that encodes the substreams"""
+        stem_names = ['mixture'] + [
+            stem.get('name', '') for stem in metadata.get('stems', [])
+        ]
+        if len(stem_names) != nb_stems:
+            stem_names = None
+        return StreamsWriter(
+            codec=self.codec,
+            bitrate=self.bitrate,
+            output_sample_rate=self.output_sample_rate,
+            stem_names=stem_names
+        )
+
+    def _stream_args(self, nb_stems):
+        """Returns the output arguments of the multistream mp4 file"""
+        # like MP4Box `:disable`, only the mixture track is enabled
+        dispositions = ['-disposition:a:0', 'default']
+        for k in range(1, nb_stems):
+            dispositions.extend(['-disposition:a:%d' % k, '0'])
+        return dispositions + ['-f', 'mp4']
+
+    def _transcode(self, src, path, info, stem_ids, stem_names, sample_rate):
+        """Maps the substreams of `src` to a NI stem file in a single pass,
+        the NI metadata is added by `stempeg.mp4`"""
+        if len(stem_ids) != 5:
+            raise RuntimeError(
+                "NI Stems requires 5 streams, where stream 0 is the mixture."
             )
-            # add metadata for NI compabtibility
-            if self.default_metadata is None:
-                with open(stempeg.default_metadata()) as f:
-                    metadata = json.load(f)
-            else:
-                metadata = self.default_metadata
+        audio_idx = info.audio_stream_idx()
+        if any(info.channels(audio_idx.index(k)) != 2 for k in stem_ids):
+            raise RuntimeError("Only stereo stems are supported")
 
-            # replace stems metadata from dict
-            if self.stems_metadata is not None:
-                metadata['stems'] = self.stems_metadata
+        metadata = self._metadata()
+        writer = self._streams_writer(len(stem_ids), metadata)
+        writer._transcode(
+            src,
+            path,
+            info,
+            stem_ids,
+            stem_names,
+            sample_rate,
+            output_args=self._stream_args(len(stem_ids))
+        )
+        mp4.write_stem_metadata(path, metadata)
 
-            callArgs = [self.mp4boxcli]
-            callArgs.extend(["-add", str(Path(tempdir, '0.m4a#ID=Z')), path])
-            for s in range(1, data.shape[0]):
-                callArgs.extend(
-                    [
-                        "-add",
-                        str(Path(
-                            tempdir,
-                            str(s) + self._suffix + "#ID=Z:disable"
-                        ))
-                    ]
-                )
-            callArgs.extend(
-                [
-                    '-brand', 'M4A:0', '-rb', 'isom', '-rb', 'iso2',
-                    "-udta",
-                    "0:type=stem:src=base64," + base64.b64encode(
-                        json.dumps(metadata).encode()
-                    ).decode(),
-                    "-quiet"
-                ]
-            )
-            try:
-                sp.check_call(callArgs)
-            except sp.CalledProcessError as err:
-                raise RuntimeError(err) from None
+    def _encode_streams(self, data, path, sample_rate, metadata):
+        """Encodes all stems into the substreams of `path`, where only
+        the mixture is enabled for playback"""
+        nb_stems, nb_samples, nb_channels = data.shape
+        writer = self._streams_writer(nb_stems, metadata)
+        data = writer._multiplex(data, sample_rate)
+        cmd = writer._command(
+            _pipe_input_args(sample_rate, data.shape[1]),
+            path,
+            nb_stems,
+            nb_channels,
+            sample_rate,
+            output_args=self._stream_args(nb_stems)
+        )
+        pipe = _FFmpegPipe(cmd)
+        try:
+            pipe.write(data)
+        except BaseException:
+            pipe.kill()
+            raise
+        pipe.close()
+
+def _nb_channels(data):
+    """Returns the number of channels of a `(samples, channels)` tensor"""
+    if data.ndim == 1:
+        return 1
+    elif data.ndim == 2:
+        return data.shape[-1]
+    else:
+        raise RuntimeError("Number of channels not supported")
+
+
+def _write_audio_cmd(
+    path,
+    nb_channels,
+    sample_rate,
+    output_sample_rate,
+    codec,
+    bitrate
+):
+    """Returns the ffmpeg command that encodes f32le samples from stdin"""
+    import ffmpeg
+
+    # check if path is available and creat it
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    if output_sample_rate is None:
+        output_sample_rate = sample_rate
+
+    input_kwargs = {'ar': sample_rate, 'ac': nb_channels}
+    output_kwargs = {'ar': output_sample_rate, 'strict': '-2'}
+    if bitrate:
+        output_kwargs['audio_bitrate'] = bitrate
+    if codec is not None:
+        output_kwargs['codec'] = codec
+    return (
+        ffmpeg
+        .input('pipe:', format='f32le', **input_kwargs)
+        .output(path, **output_kwargs)
+        .overwrite_output()
+        .compile(cmd=cmds.ffmpeg_path())
+    )
 
 
 def write_audio(
@@ -598,13 +1103,18 @@ def write_audio(
     sample_rate=44100.0,
     output_sample_rate=None,
     codec=None,
-    bitrate=None
+    bitrate=None,
+    timeout=None,
+    backend=None
 ):
     """Write multichannel audio from numpy tensor
 
     Audio writer for multi-channel but not multi-stream audio.
     Can be used directly, when stems are not required.
 
+    The samples are fed to ffmpeg in blocks. If `data` is C-contiguous
+    little-endian float32, no copy of `data` is made.
+
     Args:
         path (str): Output file name. 
             Extension sets container (and default codec).
@@ -617,39 +1127,129 @@ def write_audio(
             Defaults to `None` which automatically selects default
             codec for each container
         bitrate (int): Bitrate in Bits per second. Defaults to None
+        timeout (float, optional): Seconds after which ffmpeg is killed
+            and `subprocess.TimeoutExpired` is raised.
+            Defaults to `None` (no timeout).
+        backend (str or Backend, optional): Backend that encodes the
+            audio, see `stempeg.backends`. Defaults to `None`, which uses
+            the global backend. `timeout` is only supported by the
+            `"cli"` backend.
     """
+    backend = backends.get_backend(backend)
+    if not isinstance(backend, backends.CLIBackend):
+        if timeout is not None:
+            raise ValueError("timeout is only supported by the cli backend")
+        backend.write_audio(
+            path,
+            data,
+            sample_rate,
+            output_sample_rate=output_sample_rate,
+            codec=codec,
+            bitrate=bitrate
+        )
+        return
+
+    pipe = _FFmpegPipe(
+        _write_audio_cmd(
+            path,
+            _nb_channels(data),
+            sample_rate,
+            output_sample_rate,
+            codec,
+            bitrate
+        ),
+        timeout=timeout
+    )
+    try:
+        pipe.write(data)
+        pipe.close()
+    except (IOError, RuntimeError):
+        pipe.kill()
+        raise Warning(f'FFMPEG error: {pipe.stderr}')
 
-    # check if path is available and creat it
-    Path(path).parent.mkdir(parents=True, exist_ok=True)
 
-    if output_sample_rate is None:
-        output_sample_rate = sample_rate
+async def _pipe_async(cmd, samples, block_size=65536):
+    """Writes samples to the stdin of ffmpeg within an asyncio event loop
 
-    if data.ndim == 1:
-        nb_channels = 1
-    elif data.ndim == 2:
-        nb_channels = data.shape[-1]
-    else:
-        raise RuntimeError("Number of channels not supported")
+    Like `_FFmpegPipe.write`, the samples are converted to float32 block
+    by block, so that at most one block is copied. The process is killed
+    if the calling task is cancelled.
 
-    input_kwargs = {'ar': sample_rate, 'ac': nb_channels}
-    output_kwargs = {'ar': output_sample_rate, 'strict': '-2'}
-    if bitrate:
-        output_kwargs['audio_bitrate'] = bitrate
-    if codec is not None:
-        output_kwargs['codec'] = codec
-    process = (
-        ffmpeg
-        .input('pipe:', format='f32le', **input_kwargs)
-        .output(path, **output_kwargs)
-        .overwrite_output()
-        .run_async(pipe_stdin=True, pipe_stderr=True, quiet=True))
-    try:
-        process.stdin.write(data.astype('<f4').tobytes())
-        process.stdin.close()
-        process.wait()
-    except IOError:
-        raise Warning(f'FFMPEG error: {process.stderr.read()}')
+    Args:
+        cmd (list): ffmpeg command that reads f32le samples from stdin
+        samples (array_like): samples of shape `(samples, channels)`
+            or `(samples,)`
+        block_size (int): number of samples per block
+
+    Returns:
+        returncode (int): exit code of ffmpeg
+        stderr (bytes): error output of ffmpeg
+    """
+    import asyncio
+
+    process = await cmds.create_subprocess_exec(
+        cmd, stdin=sp.PIPE, stdout=sp.DEVNULL, stderr=sp.PIPE
+    )
+
+    async def _communicate():
+        # drain stderr concurrently, so that ffmpeg does not block
+        stderr = asyncio.ensure_future(process.stderr.read())
+        try:
+            for pos in range(0, samples.shape[0], block_size):
+                block = np.ascontiguousarray(
+                    samples[pos:pos + block_size], dtype='<f4'
+                )
+                process.stdin.write(memoryview(block).cast('B'))
+                await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg exited early, the error is reported by its exit code
+            pass
+        err = await stderr
+        await process.wait()
+        return process.returncode, err
+
+    return await cmds.kill_on_cancel(process, _communicate())
+
+
+async def write_audio_async(
+    path,
+    data,
+    sample_rate=44100.0,
+    output_sample_rate=None,
+    codec=None,
+    bitrate=None
+):
+    """Write multichannel audio from numpy tensor within an asyncio event loop
+
+    Coroutine version of `write_audio`. The samples are written to ffmpeg
+    without blocking the event loop. If the task is cancelled, the ffmpeg
+    process is killed.
+
+    Args:
+        path (str): Output file name.
+            Extension sets container (and default codec).
+        data (array_like): Audio tensor. The data shape is formatted as
+            `shape=(samples, channels)` or `(samples,)`.
+        sample_rate (float): Samplerate. Defaults to 44100.0 Hz.
+        output_sample_rate (float): Applies resampling, if different
+            to `sample_rate`. Defaults to `None` which uses `sample_rate`.
+        codec (str): Specifies ffmpeg codec being used.
+            Defaults to `None` which automatically selects default
+            codec for each container
+        bitrate (int): Bitrate in Bits per second. Defaults to None
+    """
+    cmd = _write_audio_cmd(
+        path,
+        _nb_channels(data),
+        sample_rate,
+        output_sample_rate,
+        codec,
+        bitrate
+    )
+    returncode, err = await _pipe_async(cmd, data)
+    if returncode != 0:
+        raise Warning(f'FFMPEG error: {err}')
 
 
 def write_stems(
@@ -690,8 +1290,8 @@ def write_stems(
             `stempeg.NIStemsWriter`
                 Stem will be saved into a single multistream audio.
                 Additionally Native Instruments Stems compabible
-                Metadata is added. This requires the installation of
-                `MP4Box`. See [Readme](../README.md) for more info.
+                Metadata is added. If installed, `MP4Box` is used for
+                muxing. See [Readme](../README.md) for more info.
     Notes:
         Note that file ending of `path` sets the container but not the codec!
         The support for different stem writers depends on the specified output 
@@ -757,12 +1357,381 @@ def write_stems(
 
     """
     # check if ffmpeg installed
-    if int(stempeg.ffmpeg_version()[0]) < 3:
-        warnings.warning(
+    version = stempeg.ffmpeg_version()
+    if version is not None and int(version.split('.')[0]) < 3:
+        warnings.warn(
             "Writing stems with FFMPEG version < 3 is unsupported",
             UserWarning
         )
 
+    data = _stems_tensor(data, writer)
+    return writer(
+        path=path,
+        data=data,
+        sample_rate=sample_rate
+    )
+
+
+async def write_stems_async(
+    path,
+    data,
+    sample_rate=44100,
+    writer=StreamsWriter(stem_names=None)
+):
+    """Write a stems numpy tensor to audio file(s) within an asyncio event loop
+
+    Coroutine version of `write_stems`. ffmpeg is run with
+    `asyncio.create_subprocess_exec`, so that a single event loop can drive
+    many concurrent encodes. The stems of a `FilesWriter` are encoded
+    concurrently. Writers without a native coroutine, e.g. `NIStemsWriter`,
+    are run in a thread of the default executor.
+
+    Args:
+        path (str): Output file_name of the stems file.
+        data (array_like or dict): The tensor of stems of
+            `shape=(stems, samples, channels)` or a `dict` of stems.
+        sample_rate (int): Output samplerate. Defaults to 44100 Hz.
+        writer (Writer): See `write_stems`.
+
+    >>> await stempeg.write_stems_async("test.stem.m4a", stems, 44100)
+    """
+    data = _stems_tensor(data, writer)
+    await writer.write_async(data=data, path=path, sample_rate=sample_rate)
+
+
+def transcode(
+    src,
+    dst,
+    writer=StreamsWriter(),
+    stem_ids=None,
+    sample_rate=None,
+    info=None
+):
+    """Converts a stem file without decoding it into numpy arrays
+
+    The substreams of `src` are mapped to the output layout of `writer`
+    by a single ffmpeg process, e.g. to convert a NI stem file to opus
+    streams in a matroska file. The samples never pass through python,
+    so the memory use does not depend on the duration. The stream
+    titles are kept, unless `writer` sets its own `stem_names`.
+
+    Args:
+        src (str): filename of the source stem file.
+        dst (str or tuple(str, str)): output path, see `write_stems`.
+        writer (Writer): sets the output layout, codec and bitrate.
+            `StreamsWriter`, `ChannelsWriter`, `FilesWriter` and
+            `NIStemsWriter` are supported, always encoding with ffmpeg.
+            Defaults to `StreamsWriter()`.
+        stem_ids (list(int), optional): stream ids of the stems in `src`,
+            see `read_stems`. Defaults to `None`, which converts all
+            audio streams.
+        sample_rate (float, optional): output sample rate. Defaults to
+            `None`, which uses the `output_sample_rate` of the writer. If
+            neither is set, ffmpeg keeps the sample rate of `src` if the
+            encoder supports it, e.g. opus is resampled to 48 kHz.
+        info (Info or InfoCache, optional): metadata of `src`.
+
+    >>> stempeg.transcode(
+    >>>     "track.stem.mp4",
+    >>>     "track.mka",
+    >>>     writer=stempeg.StreamsWriter(codec="libopus", bitrate=128000)
+    >>> )
+    """
+    from . import read
+
+    info = read._get_info(src, info)
+    audio_idx = info.audio_stream_idx()
+    if stem_ids is None:
+        stem_ids = audio_idx
+    elif not isinstance(stem_ids, (list, tuple)):
+        stem_ids = [stem_ids]
+    stem_ids = list(stem_ids)
+    if not stem_ids:
+        raise ValueError("No audio streams to transcode")
+    for stem_id in stem_ids:
+        if stem_id not in audio_idx:
+            raise ValueError(
+                "Stream %d of %s is not an audio stream" % (stem_id, src)
+            )
+
+    if sample_rate is None:
+        sample_rate = getattr(writer, 'output_sample_rate', None)
+
+    titles = [info.title_streams[audio_idx.index(k)] for k in stem_ids]
+    if None in titles or len(set(titles)) != len(titles):
+        # use the default names of the writer
+        titles = None
+
+    writer._transcode(src, dst, info, stem_ids, titles, sample_rate)
+
+
+def _pipe_input_args(sample_rate, nb_channels):
+    """Returns the ffmpeg arguments to read f32le samples from stdin"""
+    return [
+        '-f', 'f32le',
+        '-ar', str(sample_rate),
+        '-ac', str(nb_channels),
+        '-i', 'pipe:'
+    ]
+
+
+class _FFmpegPipe(object):
+    """ffmpeg process that encodes f32le samples written to its stdin
+
+    Samples are written in blocks through memoryviews, so that at most one
+    block is copied when the samples are not contiguous little-endian
+    float32. stderr is drained by a thread, so that ffmpeg does not block
+    when it writes a lot of log messages.
+
+    Args:
+        cmd (list): ffmpeg command reading from `pipe:`
+        timeout (float, optional): Seconds after which ffmpeg is killed.
+            Defaults to `None` (no timeout).
+    """
+
+    def __init__(self, cmd, timeout=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.timed_out = False
+        self.process = cmds.popen(
+            cmd, stdin=sp.PIPE, stdout=sp.DEVNULL, stderr=sp.PIPE
+        )
+        self._stderr = b''
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._kill_on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+        else:
+            self._timer = None
+
+    def _drain(self):
+        self._stderr = self.process.stderr.read()
+
+    def _kill_on_timeout(self):
+        self.timed_out = True
+        self.process.kill()
+
+    @property
+    def stderr(self):
+        """Error output of ffmpeg, available after `close`"""
+        return self._stderr.decode(errors='replace')
+
+    def write(self, samples, block_size=65536):
+        """Writes samples of `shape=(samples, channels)` or `(samples,)`"""
+        for pos in range(0, samples.shape[0], block_size):
+            # casts only if the samples are not contiguous '<f4'
+            block = np.ascontiguousarray(
+                samples[pos:pos + block_size], dtype='<f4'
+            )
+            try:
+                self.process.stdin.write(memoryview(block).cast('B'))
+            except BrokenPipeError:
+                # ffmpeg terminated, report its error
+                self.close()
+                raise
+
+    def close(self):
+        """Finalizes the output file
+
+        Raises:
+            subprocess.TimeoutExpired: if ffmpeg was killed after `timeout`
+            RuntimeError: if ffmpeg fails
+        """
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+        self._thread.join()
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.timed_out:
+            raise sp.TimeoutExpired(
+                self.cmd, self.timeout, stderr=self._stderr
+            )
+        if self.process.returncode:
+            raise RuntimeError('FFMPEG error: {}'.format(self.stderr))
+
+    def kill(self):
+        """Aborts encoding"""
+        self.process.kill()
+        self.process.wait()
+        self._thread.join()
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class StemsStreamWriter(object):
+    """Incrementally write stems that are produced block by block
+
+    `write_stems` requires the full stems tensor in memory. The streaming
+    writer instead pipes each chunk directly into the stdin of ffmpeg,
+    e.g. while a separation model processes a song block by block.
+    The output is finalized when the writer is closed.
+
+    The layouts of `StreamsWriter`, `ChannelsWriter` and `FilesWriter`
+    are supported, using their codec, bitrate, output sample rate and
+    stem names. `StreamsWriter` and `ChannelsWriter` run a single ffmpeg
+    process, `FilesWriter` runs one ffmpeg process per stem. The processes
+    are started with the first chunk.
+
+    Args:
+        path (str): Output path, see `write_stems`.
+        nb_stems (int): Number of stems.
+        sample_rate (float): Samplerate of the chunks. Defaults to 44100.
+        writer (Writer): Layout of the output, one of `StreamsWriter`
+            (default), `ChannelsWriter` or `FilesWriter`.
+        nb_channels (int, optional): Number of channels per stem.
+            Defaults to `None`, which uses the channels of the first chunk.
+
+    >>> with stempeg.StemsStreamWriter("out.stem.m4a", nb_stems=4) as f:
+    >>>     for block in blocks:
+    >>>         f.write(model(block))
+    """
+
+    def __init__(
+        self,
+        path,
+        nb_stems,
+        sample_rate=44100,
+        writer=StreamsWriter(stem_names=None),
+        nb_channels=None
+    ):
+        if not isinstance(
+            writer, (StreamsWriter, ChannelsWriter, FilesWriter)
+        ):
+            raise ValueError(
+                "Streaming is only supported for StreamsWriter, "
+                "ChannelsWriter and FilesWriter"
+            )
+        self.path = path
+        self.nb_stems = nb_stems
+        self.sample_rate = sample_rate
+        self.writer = writer
+        self.nb_channels = nb_channels
+        self.nb_samples = 0
+        self.closed = False
+        self._pipes = None
+
+    def _open(self):
+        writer = self.writer
+        nb_stems, nb_channels = self.nb_stems, self.nb_channels
+        if isinstance(writer, FilesWriter):
+            self._pipes = [
+                _FFmpegPipe(
+                    _write_audio_cmd(
+                        stem_filepath,
+                        nb_channels,
+                        self.sample_rate,
+                        writer.output_sample_rate,
+                        writer.codec,
+                        writer.bitrate
+                    )
+                )
+                for stem_filepath in writer._stem_paths(
+                    self.path, nb_stems, self.sample_rate
+                )
+            ]
+        elif isinstance(writer, ChannelsWriter):
+            self._pipes = [
+                _FFmpegPipe(
+                    _write_audio_cmd(
+                        self.path,
+                        nb_stems * nb_channels,
+                        self.sample_rate,
+                        writer.output_sample_rate,
+                        writer.codec,
+                        writer.bitrate
+                    )
+                )
+            ]
+        else:
+            self._pipes = [
+                _FFmpegPipe(
+                    writer._command(
+                        _pipe_input_args(
+                            self.sample_rate, nb_stems * nb_channels
+                        ),
+                        self.path,
+                        nb_stems,
+                        nb_channels,
+                        self.sample_rate
+                    )
+                )
+            ]
+
+    def write(self, chunk):
+        """Writes a chunk of stems
+
+        Args:
+            chunk (array_like): stems tensor of
+                `shape=(stems, samples, channels)`
+        """
+        if self.closed:
+            raise ValueError("write to a closed StemsStreamWriter")
+        if chunk.ndim != 3:
+            raise RuntimeError("Input tensor dimension should be 3d")
+        if self.nb_channels is None:
+            self.nb_channels = chunk.shape[2]
+        if chunk.shape[0] != self.nb_stems or (
+            chunk.shape[2] != self.nb_channels
+        ):
+            raise ValueError(
+                "chunk should have shape (%d, samples, %d)" % (
+                    self.nb_stems, self.nb_channels
+                )
+            )
+        if self._pipes is None:
+            self._open()
+
+        if len(self._pipes) == 1:
+            # (stems, samples, channels) -> (samples, stems * channels)
+            self._pipes[0].write(
+                chunk.transpose(1, 0, 2).reshape(chunk.shape[1], -1)
+            )
+        else:
+            for pipe, stem in zip(self._pipes, chunk):
+                pipe.write(stem)
+        self.nb_samples += chunk.shape[1]
+
+    def close(self):
+        """Finalizes the output file(s)"""
+        self.closed = True
+        if self._pipes is None:
+            return
+        pipes, self._pipes = self._pipes, None
+        errors = []
+        for pipe in pipes:
+            try:
+                pipe.close()
+            except RuntimeError as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def abort(self):
+        """Stops ffmpeg without finalizing the output file(s)"""
+        self.closed = True
+        if self._pipes is None:
+            return
+        pipes, self._pipes = self._pipes, None
+        for pipe in pipes:
+            pipe.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _stems_tensor(data, writer):
+    """Converts a `dict` of stems to a tensor and sets the stem names"""
     if isinstance(data, dict):
         keys = data.keys()
         values = data.values()
@@ -773,9 +1742,4 @@ def write_stems(
 
     if data.ndim != 3:
         raise RuntimeError("Input tensor dimension should be 3d")
-
-    return writer(
-        path=path,
-        data=data,
-        sample_rate=sample_rate
-    )
+    return data
@@ -0,0 +1,254 @@
+import numpy as np
+import pytest
+
+import stempeg
+from stempeg import backends
+
+
+@pytest.fixture(params=["cli", "pyav"])
+def backend(request):
+    if request.param not in backends.available_backends():
+        pytest.skip("backend %s is not installed" % request.param)
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def flac_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("backends") / "stems.flac")
+    S, rate = stempeg.read_stems(
+        stempeg.example_stem_path(), stem_id=[0, 1, 2], duration=2
+    )
+    stempeg.write_stems(
+        path, S, sample_rate=rate, writer=stempeg.ChannelsWriter()
+    )
+    return path
+
+
+class RecordingBackend(backends.Backend):
+    """Delegates to the command line tools and records the calls"""
+    name = "recording"
+    in_process = True
+
+    def __init__(self):
+        self.calls = []
+        self.cli = backends.CLIBackend()
+
+    def probe(self, filename):
+        self.calls.append('probe')
+        return self.cli.probe(filename)
+
+    def read_into(self, *args, **kwargs):
+        self.calls.append('read_into')
+        return self.cli.read_into(*args, **kwargs)
+
+    def write_audio(self, *args, **kwargs):
+        self.calls.append('write_audio')
+        return self.cli.write_audio(*args, **kwargs)
+
+    def write_streams(self, *args, **kwargs):
+        self.calls.append('write_streams')
+        return self.cli.write_streams(*args, **kwargs)
+
+
+@pytest.fixture
+def recording():
+    backends.register_backend(RecordingBackend.name, RecordingBackend)
+    yield backends.get_backend(RecordingBackend.name)
+    backends.set_backend(None)
+    del backends._registry[RecordingBackend.name]
+    del backends._instances[RecordingBackend.name]
+
+
+def test_info(backend):
+    path = stempeg.example_stem_path()
+    reference = stempeg.Info(path, backend="cli")
+    info = stempeg.Info(path, backend=backend)
+    assert info.nb_audio_streams == reference.nb_audio_streams
+    assert info.sample_rate(0) == reference.sample_rate(0)
+    assert info.channels(0) == reference.channels(0)
+    assert info.title_streams == reference.title_streams
+    assert np.allclose(
+        info.duration_streams, reference.duration_streams, atol=0.05
+    )
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {'start': 0.5, 'duration': 1},
+    {'stem_id': 1},
+    {'stem_id': [0, 2], 'sample_rate': 22050},
+])
+def test_read_streams(backend, kwargs):
+    path = stempeg.example_stem_path()
+    reference, rate = stempeg.read_stems(
+        path, duration=kwargs.pop('duration', 2), backend="cli", **kwargs
+    )
+    S, S_rate = stempeg.read_stems(
+        path, duration=reference.shape[-2] / rate, backend=backend, **kwargs
+    )
+    assert S_rate == rate
+    assert S.shape == reference.shape
+    assert np.allclose(S, reference, atol=1e-4)
+
+
+def test_read_channels(backend, flac_path):
+    reader = stempeg.ChannelsReader()
+    reference, rate = stempeg.read_stems(
+        flac_path, reader=reader, backend="cli"
+    )
+    S, _ = stempeg.read_stems(flac_path, reader=reader, backend=backend)
+    assert S.shape == reference.shape
+    assert np.allclose(S, reference, atol=1e-4)
+
+
+def test_write_roundtrip(backend, tmp_path):
+    S = (np.random.random((3, 8192, 2)) - 0.5).astype(np.float32)
+
+    path = str(tmp_path / "channels.wav")
+    stempeg.write_audio(
+        path, S[0], sample_rate=44100, codec='pcm_f32le', backend=backend
+    )
+    S_read, _ = stempeg.read_stems(path, backend="cli")
+    assert np.allclose(S_read, S[0], atol=1e-4)
+
+    path = str(tmp_path / "streams.m4a")
+    writer = stempeg.StreamsWriter(
+        codec='aac', stem_names=['a', 'b', 'c'], backend=backend
+    )
+    stempeg.write_stems(path, S, sample_rate=44100, writer=writer)
+    info = stempeg.Info(path, backend="cli")
+    assert info.nb_audio_streams == 3
+    assert info.title_streams == ['a', 'b', 'c']
+
+
+def test_get_backend(monkeypatch):
+    assert backends.get_backend().name == "cli"
+    assert isinstance(backends.get_backend("cli"), backends.CLIBackend)
+    assert backends.get_backend("cli") is backends.get_backend("cli")
+    with pytest.raises(ValueError):
+        backends.get_backend("does_not_exist")
+    with pytest.raises(ValueError):
+        backends.set_backend("does_not_exist")
+    assert "cli" in backends.available_backends()
+
+    monkeypatch.setenv("STEMPEG_BACKEND", "does_not_exist")
+    with pytest.raises(ValueError):
+        backends.get_backend()
+
+
+def test_backend_selection(recording, monkeypatch, flac_path, tmp_path):
+    reader = stempeg.ChannelsReader()
+
+    stempeg.read_stems(flac_path, reader=reader, backend=recording)
+    calls = recording.calls
+    assert calls[0] == 'probe' and 'read_into' in calls
+
+    recording.calls = []
+    monkeypatch.setenv("STEMPEG_BACKEND", RecordingBackend.name)
+    # in-process backends are not run by process executors
+    stempeg.read_stems(flac_path, reader=reader, multiprocess=True)
+    assert recording.calls == calls
+
+    # the per call argument overrides the global backend
+    recording.calls = []
+    backends.set_backend(RecordingBackend.name)
+    monkeypatch.delenv("STEMPEG_BACKEND")
+    stempeg.read_stems(flac_path, reader=reader, backend="cli")
+    assert recording.calls == []
+
+    S = np.zeros((2, 1024, 2), dtype=np.float32)
+    stempeg.write_stems(
+        str(tmp_path / "stems.wav"), S, sample_rate=44100,
+        writer=stempeg.FilesWriter()
+    )
+    stempeg.write_stems(
+        str(tmp_path / "stems.m4a"), S, sample_rate=44100,
+        writer=stempeg.StreamsWriter()
+    )
+    assert recording.calls == ['write_audio'] * 2 + ['write_streams']
+
+    with pytest.raises(ValueError):
+        stempeg.write_audio(
+            str(tmp_path / "mix.wav"), S[0], sample_rate=44100, timeout=1
+        )
+
+
+def test_cli_subprocesses(flac_path):
+    reader = stempeg.ChannelsReader()
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.read_stems(flac_path, reader=reader, backend="cli")
+    assert counter.count >= 2
+
+
+def _blocks(x, sizes):
+    pos = 0
+    for size in sizes:
+        yield x[pos:pos + size]
+        pos += size
+
+
+@pytest.mark.parametrize("begin,end", [(0, None), (700, 2500), (0, 100)])
+def test_frame_sink(begin, end):
+    x = np.random.random((3000, 2, 2)).astype(np.float32)
+    reference = x[begin:end]
+    out = np.zeros((2, 1000, 2), dtype=np.float64)
+    sink = backends._FrameSink(out.transpose(1, 0, 2), 1, begin, end)
+    for block in _blocks(x.reshape(3000, 4), [1024, 1024, 952]):
+        sink.add(0, block)
+        if sink.finished():
+            break
+    nb_frames, rest = sink.result(np.dtype('<f4'))
+    assert nb_frames == min(len(reference), 1000)
+    # a single substream fills all stems, e.g. for `ChannelsReader`
+    assert np.array_equal(
+        out.transpose(1, 0, 2)[:nb_frames], reference[:nb_frames]
+    )
+    assert rest.dtype == out.dtype
+    assert np.array_equal(rest, reference[nb_frames:])
+
+
+def test_frame_sink_streams():
+    x = (np.random.random((2, 3000, 2)) * 1000).astype('<i2')
+    out = np.zeros((4000, 2, 2), dtype=np.float32)
+    sink = backends._FrameSink(out, 2, 500)
+    # the decoding starts at a keyframe in front of `begin`
+    sink.add(0, x[0, 300:1324], position=300)
+    sink.add(1, x[1, 400:2000], position=400)
+    sink.add(0, x[0, 1324:3000])
+    # the substreams differ in length
+    sink.add(1, x[1, 2000:2900])
+    assert not sink.finished()
+    nb_frames, rest = sink.result(np.dtype('<i2'))
+    assert nb_frames == 2400 and len(rest) == 0
+    expected = x[:, 500:2900] / 32768.0
+    assert np.array_equal(out[:nb_frames], expected.transpose(1, 0, 2))
+
+
+def test_frame_sink_preroll():
+    x = np.random.random((44100, 2)).astype(np.float32)
+    out = np.zeros((1000, 1, 2), dtype=np.float32)
+    begin = 30000
+    sink = backends._FrameSink(out, 1, begin, begin + 1000)
+    # decoding starts `SEEK_PREROLL` seconds in front of `begin`
+    position = begin - int(stempeg.read.SEEK_PREROLL * 44100)
+    sink.add(0, x[position:position + 4096], position=position)
+    assert sink.counts == [0]
+    for pos in range(position + 4096, len(x), 4096):
+        sink.add(0, x[pos:pos + 4096])
+        if sink.finished():
+            break
+    nb_frames, rest = sink.result(np.dtype('<f4'))
+    assert nb_frames == 1000 and len(rest) == 0
+    assert np.array_equal(out[:, 0], x[begin:begin + 1000])
+
+
+def test_frame_sink_full():
+    x = np.random.random((3000, 2)).astype(np.float32)
+    out = np.zeros((1000, 1, 2), dtype=np.float32)
+    sink = backends._FrameSink(out, 1, grow=False)
+    sink.add(0, x[:1024])
+    # `out` cannot be grown, so the rest of the file is not needed
+    assert sink.finished()
+    nb_frames, rest = sink.result(np.dtype('<f4'))
+    assert nb_frames == 1000 and len(rest) == 0
+    assert np.array_equal(out[:, 0], x[:1000])
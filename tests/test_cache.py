@@ -0,0 +1,183 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import stempeg
+
+
+@pytest.fixture
+def stem_file(tmp_path):
+    path = str(tmp_path / "test.stem.mp4")
+    shutil.copy(stempeg.example_stem_path(), path)
+    return path
+
+
+def test_info_cache(stem_file, tmp_path):
+    db = str(tmp_path / "info.sqlite")
+    with stempeg.InfoCache(db) as cache:
+        assert stem_file not in cache
+        info = cache.get(stem_file)
+        assert stem_file in cache
+        assert len(cache) == 1
+
+    # warm start without ffprobe
+    with stempeg.InfoCache(db) as cache:
+        with stempeg.cmds.count_subprocesses() as counter:
+            cached_info = cache.get(stem_file)
+            S, _ = stempeg.read_stems(stem_file, info=cache)
+        assert cached_info.info == info.info
+        assert cached_info.nb_samples_streams == info.nb_samples_streams
+        assert S.shape[0] == info.nb_audio_streams
+        assert all(
+            stempeg.cmds.ffprobe_path() not in cmd for cmd in counter.commands
+        )
+
+
+def test_info_cache_invalidation(stem_file, tmp_path):
+    with stempeg.InfoCache(str(tmp_path / "info.sqlite")) as cache:
+        info = cache.get(stem_file)
+        assert info.nb_audio_streams == 5
+
+        stempeg.write_stems(
+            stem_file,
+            np.random.random((2, 4096, 2)),
+            writer=stempeg.StreamsWriter(codec="aac")
+        )
+        os.utime(stem_file, ns=(0, 0))
+        assert stem_file not in cache
+        assert cache.get(stem_file).nb_audio_streams == 2
+
+
+@pytest.mark.parametrize("start,duration,stem_id", [
+    (None, None, None),
+    (1.3, 0.77, [1, 3]),
+    (0.43, 0.2375736960895036, 2),
+])
+def test_pcm_cache(tmp_path, stem_file, start, duration, stem_id):
+    cache_dir = str(tmp_path / "cache")
+    ref, rate = stempeg.read_stems(
+        stem_file, start=start, duration=duration, stem_id=stem_id
+    )
+
+    for _ in range(2):
+        with stempeg.cmds.count_subprocesses() as counter:
+            S, S_rate = stempeg.read_stems(
+                stem_file,
+                start=start,
+                duration=duration,
+                stem_id=stem_id,
+                cache_dir=cache_dir
+            )
+        assert S_rate == rate
+        assert np.array_equal(S, ref)
+
+    # the second read is served from the cache
+    assert counter.count == 0
+
+    S, _ = stempeg.read_stems(stem_file, cache_dir=cache_dir)
+    assert not S.flags.writeable
+
+    out = np.zeros((5, 44100, 2))
+    S, _ = stempeg.read_stems(stem_file, out=out, cache_dir=cache_dir)
+    assert np.shares_memory(S, out)
+    assert S.shape == out.shape
+
+
+def test_pcm_cache_eviction(tmp_path, stem_file):
+    cache = stempeg.PCMCache(str(tmp_path / "cache"), max_bytes=1)
+    stempeg.read_stems(stem_file, cache_dir=cache)
+    stempeg.read_stems(stem_file, cache_dir=cache, dtype=np.float32)
+    # only the most recent entry is kept
+    assert len([
+        name for name in os.listdir(cache.cache_dir) if name.endswith('.npy')
+    ]) == 1
+    cache.clear()
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_pcm_cache_concurrent_eviction(tmp_path, stem_file, monkeypatch):
+    cache = stempeg.PCMCache(str(tmp_path / "cache"))
+    ref, _ = stempeg.read_stems(stem_file, cache_dir=cache)
+
+    utime = os.utime
+    calls = []
+
+    def _utime(path, *args, **kwargs):
+        calls.append(path)
+        if len(calls) == 1:
+            # another process evicts the entry after it was opened
+            raise FileNotFoundError(path)
+        return utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(stempeg.cache.os, "utime", _utime)
+    with stempeg.cmds.count_subprocesses() as counter:
+        S, _ = stempeg.read_stems(stem_file, cache_dir=cache)
+    # the entry is treated as a cache miss
+    assert counter.count > 0
+    assert np.array_equal(S, ref)
+
+
+def test_track_cache(stem_file):
+    cache = stempeg.TrackCache(max_bytes=2**30)
+    ref, rate = stempeg.read_stems(stem_file, dtype=np.float32)
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        S, S_rate = stempeg.read_stems(
+            stem_file, dtype=np.float32, memory_cache=cache
+        )
+    assert counter.count > 0
+    assert S_rate == rate
+    assert np.array_equal(S, ref)
+    assert not S.flags.writeable
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        S, _ = stempeg.read_stems(
+            stem_file,
+            start=1.3,
+            duration=0.77,
+            dtype=np.float32,
+            memory_cache=cache
+        )
+        S_stem, _ = stempeg.read_stems(
+            stem_file, stem_id=2, dtype=np.float32, memory_cache=cache
+        )
+    assert counter.count == 0
+    assert np.shares_memory(S, cache._entries[next(iter(cache._entries))][0])
+    assert np.array_equal(S_stem, ref[2])
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.nbytes == ref.nbytes
+
+    # other dtypes are separate entries
+    stempeg.read_stems(stem_file, dtype=np.float64, memory_cache=cache)
+    assert (len(cache), cache.misses) == (2, 2)
+
+
+def test_track_cache_eviction(stem_file):
+    S, _ = stempeg.read_stems(stem_file, dtype=np.float32)
+    cache = stempeg.TrackCache(max_bytes=S.nbytes + 1)
+    stempeg.read_stems(stem_file, dtype=np.float32, memory_cache=cache)
+    stempeg.read_stems(stem_file, dtype=np.float64, memory_cache=cache)
+    # the float64 track exceeds the budget
+    assert len(cache) == 1
+    stempeg.read_stems(stem_file, dtype=np.int16, memory_cache=cache)
+    assert len(cache) == 1
+    assert cache.nbytes <= cache.max_bytes
+    stempeg.read_stems(stem_file, dtype=np.float32, memory_cache=cache)
+    assert cache.misses == 4
+    cache.clear()
+    assert (len(cache), cache.nbytes, cache.hits, cache.misses) == (0, 0, 0, 0)
+
+
+def test_track_cache_batch(stem_file):
+    cache = stempeg.TrackCache(max_bytes=2**30)
+    requests = [(stem_file, 1.0, 1.0), (stem_file, 2.0, 1.0)]
+    ref, rate = stempeg.read_stems_batch(requests)
+    with stempeg.StemReader(memory_cache=cache) as reader:
+        S, _ = reader.read_batch(requests)
+        S, _ = reader.read_batch(requests)
+    assert np.array_equal(S, ref)
+    assert cache.misses == 1
+
+    with pytest.raises(ValueError):
+        stempeg.StemReader(executor="process", memory_cache=cache)
@@ -0,0 +1,197 @@
+import os
+import shutil
+import subprocess as sp
+
+import numpy as np
+import pytest
+
+import stempeg
+import stempeg.cli
+
+
+def test_stem2files_probes_once(tmp_path):
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.cli.stem2files(
+            stempeg.example_stem_path(),
+            outdir=str(tmp_path),
+            extension=".wav",
+            duration=1.0
+        )
+    probes = [
+        cmd for cmd in counter.commands
+        if cmd[0] == stempeg.cmds.ffprobe_path()
+    ]
+    assert len(probes) == 1
+    assert len(list(tmp_path.glob("**/*.wav"))) == 5
+
+
+def test_expand_inputs(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    for name in ["a/x.stem.mp4", "a/b/y.stem.m4a", "a/z.wav"]:
+        (tmp_path / name).touch()
+    files = stempeg.cli.expand_inputs([
+        str(tmp_path / "a"),
+        str(tmp_path / "a" / "*.wav"),
+        str(tmp_path / "a" / "x.stem.mp4"),
+        "missing.stem.mp4"
+    ])
+    assert files == [
+        str(tmp_path / "a" / "b" / "y.stem.m4a"),
+        str(tmp_path / "a" / "x.stem.mp4"),
+        str(tmp_path / "a" / "z.wav"),
+        "missing.stem.mp4"
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_cli_batch(tmp_path, capsys, jobs):
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    for name in ["a.stem.mp4", "b.stem.mp4"]:
+        shutil.copy(stempeg.example_stem_path(), str(inputs / name))
+    (inputs / "broken.stem.mp4").write_bytes(b"not a stem file")
+    outdir = tmp_path / "out"
+    args = [
+        str(inputs), "-o", str(outdir), "-t", "0.5", "-j", str(jobs),
+        "--id", "0", "2"
+    ]
+
+    assert stempeg.cli.cli(args) == 1
+    assert "2 converted, 0 up to date, 1 failed" in capsys.readouterr().out
+    for name in ["a", "b"]:
+        outputs = sorted(path.name for path in (outdir / name).iterdir())
+        assert outputs == ["Stem_0.wav", "Stem_2.wav"]
+
+    # outputs are up to date
+    with stempeg.cmds.count_subprocesses() as counter:
+        assert stempeg.cli.stem2files_batch(
+            [str(inputs / "a.stem.mp4"), str(inputs / "b.stem.mp4")],
+            outdir=str(outdir), extension=".wav", idx=[0, 2], duration=0.5
+        )['skipped'] == sorted(str(path) for path in inputs.glob("?.*"))
+    assert all(
+        cmd[0] == stempeg.cmds.ffprobe_path() for cmd in counter.commands
+    )
+
+    os.utime(str(inputs / "b.stem.mp4"))
+    results = stempeg.cli.stem2files_batch(
+        [str(inputs / "a.stem.mp4"), str(inputs / "b.stem.mp4")],
+        outdir=str(outdir), extension=".wav", idx=[0, 2], duration=0.5,
+        jobs=jobs
+    )
+    assert results['skipped'] == [str(inputs / "a.stem.mp4")]
+    assert results['converted'] == [str(inputs / "b.stem.mp4")]
+
+
+def test_cli_legacy_outdir(tmp_path):
+    with pytest.warns(FutureWarning):
+        assert stempeg.cli.cli([
+            stempeg.example_stem_path(), str(tmp_path / "out"), "-t", "0.1"
+        ]) == 0
+    assert len(list((tmp_path / "out").glob("*/*.wav"))) == 5
+
+
+def test_cli_directory_input(tmp_path, recwarn):
+    # a directory of stem files is an input, not the output folder
+    stem_file = str(tmp_path / "track.stem.mp4")
+    shutil.copy(stempeg.example_stem_path(), stem_file)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    shutil.copy(stempeg.example_stem_path(), str(inputs / "other.stem.mp4"))
+    assert stempeg.cli.cli([stem_file, str(inputs), "-t", "0.1"]) == 0
+    assert len(list(tmp_path.glob("track/*.wav"))) == 5
+    assert len(list(inputs.glob("other/*.wav"))) == 5
+    assert not any(
+        issubclass(warning.category, FutureWarning) for warning in recwarn
+    )
+
+
+def test_stem2files_copy(tmp_path):
+    S, _ = stempeg.read_stems(stempeg.example_stem_path())
+    with stempeg.cmds.count_subprocesses() as counter:
+        paths = stempeg.cli.stem2files(
+            stempeg.example_stem_path(),
+            outdir=str(tmp_path),
+            extension=".m4a",
+            idx=[1, 3],
+            copy=True
+        )
+    # a single ffprobe and ffmpeg process
+    assert counter.count == 2
+    for k, path in zip([1, 3], paths):
+        info = stempeg.Info(path)
+        assert info.audio_streams[0]['codec_name'] == 'aac'
+        assert info.title_streams == ["Stem_%d" % k]
+        # the packets are copied
+        S_copy, _ = stempeg.read_stems(path)
+        assert np.array_equal(S_copy, S[k])
+
+
+def test_stem2files_copy_fallback(tmp_path):
+    S, _ = stempeg.read_stems(stempeg.example_stem_path(), stem_id=0)
+    paths = stempeg.cli.stem2files(
+        stempeg.example_stem_path(),
+        outdir=str(tmp_path),
+        extension=".flac",
+        idx=0,
+        copy=True
+    )
+    assert stempeg.Info(paths[0]).audio_streams[0]['codec_name'] == 'flac'
+    S_flac, _ = stempeg.read_stems(paths[0])
+    assert S_flac.shape == S.shape
+    assert np.allclose(S_flac, np.clip(S, -1, 1), atol=1e-4)
+
+
+def test_stem2files_closes_pools(tmp_path):
+    import multiprocessing
+
+    inputs = []
+    for name in ["a", "b", "c"]:
+        path = str(tmp_path / (name + ".stem.mp4"))
+        shutil.copy(stempeg.example_stem_path(), path)
+        inputs.append(path)
+    results = stempeg.cli.stem2files_batch(
+        inputs, outdir=str(tmp_path / "out"), extension=".wav",
+        duration=0.1
+    )
+    assert len(results['converted']) == 3
+    assert not multiprocessing.active_children()
+
+    stempeg.cli.stem2files(
+        inputs[0], outdir=str(tmp_path / "single"), duration=0.1
+    )
+    assert not multiprocessing.active_children()
+
+
+@pytest.mark.parametrize("copy", [True, False])
+def test_stem2files_cover_art(tmp_path, copy):
+    # the first stream of the file is a cover image, muxed as a video
+    # track, as ffmpeg moves attached pictures behind the audio streams
+    cover = str(tmp_path / "cover.png")
+    path = str(tmp_path / "track.stem.mp4")
+    sp.check_call([
+        stempeg.cmds.ffmpeg_path(), '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', 'color=c=red:s=16x16', '-frames:v', '1', cover
+    ])
+    sp.check_call([
+        stempeg.cmds.ffmpeg_path(), '-loglevel', 'error', '-y',
+        '-i', cover, '-i', stempeg.example_stem_path(),
+        '-map', '0', '-map', '1:1', '-map', '1:2', '-c', 'copy',
+        '-metadata:s:a:0', 'handler_name=drums',
+        '-metadata:s:a:1', 'handler_name=bass', path
+    ])
+    info = stempeg.Info(path)
+    assert info.audio_stream_idx() == [1, 2]
+
+    paths = stempeg.cli.stem2files(
+        path, outdir=str(tmp_path / "out"), extension=".m4a", copy=copy
+    )
+    assert [os.path.basename(p) for p in paths] == ["drums.m4a", "bass.m4a"]
+    assert all(os.path.exists(p) for p in paths)
+
+    paths = stempeg.cli.stem2files(
+        path, outdir=str(tmp_path / "out"), extension=".m4a", copy=copy,
+        idx=[2]
+    )
+    assert [os.path.basename(p) for p in paths] == ["bass.m4a"]
+    with pytest.raises(ValueError):
+        stempeg.cli.stem2files(path, idx=[0], copy=copy)
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import stempeg
+
+
+def test_capabilities():
+    caps = stempeg.cmds.Capabilities()
+    with stempeg.cmds.count_subprocesses() as counter:
+        assert caps.ffmpeg_version
+        caps.aac_encoders
+        assert 'aac' in caps.encoders
+        assert 'mp4' in caps.muxers and 'webm' in caps.muxers
+        caps.mp4box_path
+    assert counter.count == 4
+    assert caps.ffmpeg_version == stempeg.ffmpeg_version()
+
+    # detected only once
+    with stempeg.cmds.count_subprocesses() as counter:
+        caps.ffmpeg_version
+        caps.aac_encoders
+        caps.encoders
+        caps.muxers
+    assert counter.count == 0
+
+
+def test_capabilities_cache_file(tmp_path):
+    cache_file = str(tmp_path / "capabilities.json")
+    version = stempeg.cmds.Capabilities(cache_file).ffmpeg_version
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        assert stempeg.cmds.Capabilities(cache_file).ffmpeg_version == version
+    assert counter.count == 0
+
+    # entries of other binaries are not used
+    with open(cache_file) as f:
+        entries = json.load(f)
+    with open(cache_file, 'w') as f:
+        json.dump({"other": list(entries.values())[0]}, f)
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.cmds.Capabilities(cache_file).ffmpeg_version
+    assert counter.count == 1
+
+
+def test_write_stems_probes_once(tmp_path):
+    audio = np.random.random((2, 4096, 2)) - 0.5
+    stempeg.ffmpeg_version()
+    with stempeg.cmds.count_subprocesses() as counter:
+        for k in range(3):
+            stempeg.write_stems(
+                str(tmp_path / ("%d.stem.m4a" % k)), audio, 44100
+            )
+    # a single encoder process per file
+    assert counter.count == 3
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+# upper bounds of `import stempeg`, the import takes about 20 ms and
+# loads about 25 modules that are not imported by the interpreter itself
+MAX_IMPORT_TIME = 0.25
+MAX_IMPORTED_MODULES = 60
+
+HEAVY_MODULES = ['numpy', 'ffmpeg', 'multiprocessing', 'asyncio', 'sqlite3']
+
+
+def _run(code, env=None):
+    output = sp.check_output([sys.executable, '-c', code], env=env)
+    return json.loads(output.decode())
+
+
+def test_import_is_lazy():
+    result = _run(
+        "import json, sys, time\n"
+        "before = set(sys.modules)\n"
+        "start = time.perf_counter()\n"
+        "import stempeg\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(json.dumps({\n"
+        "    'time': elapsed,\n"
+        "    'modules': sorted(set(sys.modules) - before),\n"
+        "}))\n"
+    )
+    imported = result['modules']
+    for module in HEAVY_MODULES:
+        assert module not in imported
+    assert len(imported) <= MAX_IMPORTED_MODULES, imported
+    assert result['time'] < MAX_IMPORT_TIME
+
+
+def test_lazy_attributes():
+    result = _run(
+        "import json, sys\n"
+        "import stempeg\n"
+        "names = [stempeg.read_stems.__module__, stempeg.Info.__module__]\n"
+        "names.append('stempeg.write' in sys.modules)\n"
+        "print(json.dumps(names))\n"
+    )
+    assert result == ['stempeg.read', 'stempeg.read', False]
+
+    import stempeg
+    assert set(stempeg.__all__) <= set(dir(stempeg))
+    for name in stempeg.__all__:
+        assert getattr(stempeg, name) is not None
+    with pytest.raises(AttributeError):
+        stempeg.does_not_exist
+
+
+def test_import_without_ffmpeg():
+    env = dict(os.environ, PATH='')
+    result = _run(
+        "import json\n"
+        "import stempeg\n"
+        "try:\n"
+        "    stempeg.cmds.ffmpeg_path()\n"
+        "    error = None\n"
+        "except RuntimeError as e:\n"
+        "    error = str(e)\n"
+        "print(json.dumps(error))\n",
+        env=env
+    )
+    assert 'could not be found' in result
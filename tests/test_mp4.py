@@ -0,0 +1,80 @@
+import json
+import shutil
+
+import numpy as np
+import pytest
+import stempeg
+from stempeg import mp4
+
+
+@pytest.fixture
+def metadata():
+    with open(stempeg.default_metadata()) as f:
+        return json.load(f)
+
+
+def _boxes(path):
+    with open(path, 'rb') as f:
+        end = f.seek(0, 2)
+        return [box[0] for box in mp4._boxes(f, 0, end)]
+
+
+def test_read_stem_metadata():
+    info = stempeg.Info(stempeg.example_stem_path())
+    metadata = info.stem_metadata
+    assert [stem['name'] for stem in metadata['stems']] == [
+        'Drums', 'Bass', 'Other', 'Vox'
+    ]
+    assert mp4.read_stem_metadata(stempeg.default_metadata()) is None
+
+
+def test_write_stem_metadata_in_place(tmp_path, metadata):
+    path = str(tmp_path / "track.stem.mp4")
+    stems, rate = stempeg.read_stems(stempeg.example_stem_path())
+    stempeg.write_stems(
+        path, stems, sample_rate=rate, writer=stempeg.StreamsWriter()
+    )
+    reference, _ = stempeg.read_stems(path)
+    assert stempeg.Info(path).stem_metadata is None
+    # ffmpeg writes the moov box behind the media data
+    assert _boxes(path) == [b'ftyp', b'free', b'mdat', b'moov']
+
+    mp4.write_stem_metadata(path, metadata)
+    assert _boxes(path) == [b'ftyp', b'free', b'mdat', b'moov']
+
+    info = stempeg.Info(path)
+    assert info.stem_metadata == metadata
+    assert info.info['format']['tags']['major_brand'].strip() == 'M4A'
+    assert 'isom' not in info.info['format']['tags']['compatible_brands']
+    assert info.title_streams == [
+        'Stem 0', 'Stem 1', 'Stem 2', 'Stem 3', 'Stem 4'
+    ]
+    S, _ = stempeg.read_stems(path)
+    assert np.array_equal(S, reference)
+
+    # replaces the existing box
+    metadata['stems'][0]['name'] = 'Percussion'
+    mp4.write_stem_metadata(path, metadata)
+    assert stempeg.Info(path).stem_metadata == metadata
+
+
+def test_write_stem_metadata_rewrite(tmp_path, metadata):
+    # the moov box precedes the media data, so that chunk offsets move
+    path = str(tmp_path / "track.stem.mp4")
+    shutil.copy(stempeg.example_stem_path(), path)
+    assert _boxes(path)[:3] == [b'ftyp', b'moov', b'mdat']
+    reference, _ = stempeg.read_stems(path)
+
+    metadata['comment'] = 'x' * 1000
+    mp4.write_stem_metadata(path, metadata)
+
+    assert stempeg.Info(path).stem_metadata == metadata
+    S, _ = stempeg.read_stems(path)
+    assert np.array_equal(S, reference)
+
+
+def test_write_stem_metadata_errors(tmp_path, metadata):
+    path = str(tmp_path / "track.wav")
+    stempeg.write_audio(path, np.zeros((1024, 2)), 44100)
+    with pytest.raises(ValueError):
+        mp4.write_stem_metadata(path, metadata)
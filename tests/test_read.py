@@ -1,3 +1,6 @@
+import asyncio
+import os
+import subprocess as sp
 import stempeg
 import numpy as np
 import pytest
@@ -104,3 +107,371 @@ def test_info():
     fp = stempeg.example_stem_path()
     info = stempeg.Info(fp)
     S, rate = stempeg.read_stems(fp, info=info)
+
+
+def test_merge_streams(start, duration):
+    fp = stempeg.example_stem_path()
+    S, _ = stempeg.read_stems(fp, start=start, duration=duration)
+    S_merged, _ = stempeg.read_stems(
+        fp,
+        start=start,
+        duration=duration,
+        merge_streams=True
+    )
+    assert np.array_equal(S, S_merged)
+
+
+@pytest.mark.parametrize("block_size", [1024, 100000])
+def test_stream_stems(block_size, start, duration):
+    fp = stempeg.example_stem_path()
+    S, _ = stempeg.read_stems(fp, start=start, duration=duration)
+    blocks = list(
+        stempeg.stream_stems(
+            fp,
+            block_size=block_size,
+            start=start,
+            duration=duration
+        )
+    )
+    if blocks:
+        assert all(block.shape[1] <= block_size for block in blocks)
+        assert np.array_equal(S, np.concatenate(blocks, axis=1))
+    else:
+        assert S.size == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs a shell script")
+def test_stream_stems_stderr(tmp_path, monkeypatch):
+    # ffmpeg writing more than the pipe buffer to stderr must not block
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(
+        "#!/bin/sh\nhead -c 1000000 /dev/zero >&2\nexec %s \"$@\"\n"
+        % stempeg.cmds.ffmpeg_path()
+    )
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(stempeg.cmds, "ffmpeg_path", lambda: str(ffmpeg))
+    blocks = list(
+        stempeg.stream_stems(stempeg.example_stem_path(), duration=0.1)
+    )
+    assert sum(block.shape[1] for block in blocks) == 4410
+
+
+def test_fast_seek(start, duration):
+    fp = stempeg.example_stem_path()
+    S, _ = stempeg.read_stems(fp, start=start, duration=duration)
+    S_fast, _ = stempeg.read_stems(
+        fp,
+        start=start,
+        duration=duration,
+        fast_seek=True
+    )
+    assert np.array_equal(S, S_fast)
+
+
+@pytest.mark.parametrize("fast_seek", [False, True])
+@pytest.mark.parametrize(
+    ("start", "duration"),
+    [(0, 1024), (1, 44100), (123456, 1000), (200000, None)]
+)
+def test_time_unit_samples(fast_seek, start, duration):
+    fp = stempeg.example_stem_path()
+    S, _ = stempeg.read_stems(fp)
+    S_excerpt, _ = stempeg.read_stems(
+        fp,
+        start=start,
+        duration=duration,
+        time_unit="samples",
+        fast_seek=fast_seek
+    )
+    stop = None if duration is None else start + duration
+    assert np.array_equal(S[:, start:stop], S_excerpt)
+
+
+def test_nb_subprocesses():
+    fp = stempeg.example_stem_path()
+    with stempeg.cmds.count_subprocesses() as counter:
+        info = stempeg.Info(fp)
+    assert counter.count == 1
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.read_stems(fp, info=info)
+    assert counter.count == info.nb_audio_streams
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.read_stems(fp)
+    assert counter.count == info.nb_audio_streams + 1
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.read_stems(fp, merge_streams=True)
+    assert counter.count == 2
+
+
+@pytest.mark.parametrize("merge_streams", [False, True])
+def test_out(dtype, merge_streams):
+    fp = stempeg.example_stem_path()
+    info = stempeg.Info(fp)
+    S, _ = stempeg.read_stems(fp, info=info, dtype=dtype)
+
+    out = np.empty(
+        (info.nb_audio_streams, max(info.nb_samples_streams), 2),
+        dtype=dtype
+    )
+    S_out, _ = stempeg.read_stems(
+        fp,
+        info=info,
+        out=out,
+        merge_streams=merge_streams
+    )
+    assert np.shares_memory(S_out, out)
+    assert np.array_equal(S, S_out)
+
+    # audio that does not fit into `out` is discarded
+    out = np.empty((info.nb_audio_streams, 1000, 2), dtype=dtype)
+    S_out, _ = stempeg.read_stems(fp, info=info, out=out)
+    assert np.array_equal(S[:, :1000], S_out)
+
+
+@pytest.mark.parametrize("grow", [True, False])
+def test_read_into_full(monkeypatch, grow):
+    processes = []
+    popen = stempeg.cmds.popen
+
+    def _popen(*args, **kwargs):
+        processes.append(popen(*args, **kwargs))
+        return processes[-1]
+
+    monkeypatch.setattr(stempeg.cmds, "popen", _popen)
+    out = np.empty((1000, 1, 2), dtype=np.float32)
+    nb_frames, rest = stempeg.read._read_ffmpeg_into(
+        out, stempeg.example_stem_path(), 44100, 2, None, None, 'f32le', 0,
+        grow=grow
+    )
+    assert nb_frames == 1000
+    if grow:
+        assert len(rest) > 0 and processes[0].returncode == 0
+    else:
+        # ffmpeg is stopped instead of decoding the rest of the file
+        assert len(rest) == 0 and processes[0].returncode != 0
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_stem_reader(executor):
+    fp = stempeg.example_stem_path()
+    S, rate = stempeg.read_stems(fp, dtype=np.float32)
+    with stempeg.StemReader(
+        executor=executor,
+        max_workers=2,
+        dtype=np.float32
+    ) as reader:
+        S_reader, rate_reader = reader.read(fp)
+        assert rate == rate_reader
+        assert np.array_equal(S, S_reader)
+
+        results = reader.read_many([fp, fp], duration=1.0)
+        assert len(results) == 2
+        for S_many, _ in results:
+            assert np.array_equal(S[:, :S_many.shape[1]], S_many)
+
+
+def test_multithread(dtype):
+    fp = stempeg.example_stem_path()
+    S, _ = stempeg.read_stems(fp, dtype=dtype)
+    S_threads, _ = stempeg.read_stems(fp, dtype=dtype, multithread=True)
+    assert np.array_equal(S, S_threads)
+
+
+def test_multithread_error(monkeypatch):
+    pools = []
+
+    class ThreadPoolExecutor(stempeg.read.ThreadPoolExecutor):
+        def shutdown(self, *args, **kwargs):
+            pools.append(self)
+            super().shutdown(*args, **kwargs)
+
+    def _read_ffmpeg_into(*args, **kwargs):
+        raise RuntimeError("decoding failed")
+
+    monkeypatch.setattr(stempeg.read, "ThreadPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(stempeg.read, "_read_ffmpeg_into", _read_ffmpeg_into)
+    with pytest.raises(RuntimeError):
+        stempeg.read_stems(stempeg.example_stem_path(), multithread=True)
+    # the temporary thread pool is shut down
+    assert len(pools) == 1
+
+
+@pytest.mark.parametrize("pad", [True, False])
+def test_read_stems_batch(pad):
+    fp = stempeg.example_stem_path()
+    requests = [(fp, 1.0, 2.0), (fp, 5.0, 2.0), (fp, 0, 0.5, [0, 1])]
+    with pytest.raises(ValueError):
+        # different number of stems
+        stempeg.read_stems_batch(requests)
+
+    requests = requests[:2] + [(fp, 0.5, 1.0)]
+    S, rate, mask = stempeg.read_stems_batch(
+        requests, pad=pad, return_mask=True
+    )
+    assert S.shape[:2] == (3, 5)
+    assert S.dtype == np.float32
+    for k, (filename, start, duration) in enumerate(requests):
+        S_k, _ = stempeg.read_stems(
+            filename, start=start, duration=duration, dtype=np.float32
+        )
+        nb_samples = min(S_k.shape[1], S.shape[2])
+        assert mask[k].sum() == nb_samples
+        assert np.array_equal(S[k][:, :nb_samples], S_k[:, :nb_samples])
+        assert not S[k][:, nb_samples:].any()
+
+
+def test_read_stems_batch_estimate(tmp_path, monkeypatch):
+    # matroska streams have no `duration_ts`
+    path = str(tmp_path / "stems.mka")
+    S = (np.random.random((2, 3 * 44100, 2)) - 0.5).astype(np.float32)
+    stempeg.write_stems(
+        path, S, sample_rate=44100,
+        writer=stempeg.StreamsWriter(codec='flac', stem_names=['a', 'b'])
+    )
+    reference, _ = stempeg.read_stems(path, dtype=np.float32)
+    excerpt, _ = stempeg.read_stems(
+        path, start=1.0, duration=0.5, dtype=np.float32
+    )
+
+    # the estimated length is too short
+    monkeypatch.setattr(
+        stempeg.read, "_nb_samples", lambda *args: 44100
+    )
+    S_batch, _ = stempeg.read_stems_batch([(path,), (path, 1.0, 0.5)])
+    assert S_batch.shape[2] == reference.shape[1]
+    assert np.array_equal(S_batch[0], reference)
+    assert np.array_equal(S_batch[1][:, :excerpt.shape[1]], excerpt)
+
+    # an explicit length truncates
+    S_batch, _ = stempeg.read_stems_batch([(path,)], nb_samples=1000)
+    assert S_batch.shape[2] == 1000
+
+
+@pytest.mark.parametrize(
+    "start,duration,merge_streams",
+    [(None, None, False), (1.3, 0.77, False), (1.3, 0.77, True)]
+)
+def test_read_stems_async(start, duration, merge_streams):
+    S, rate = stempeg.read_stems(
+        stempeg.example_stem_path(), start=start, duration=duration
+    )
+
+    async def main():
+        info = await stempeg.Info.probe_async(stempeg.example_stem_path())
+        return await asyncio.gather(*[
+            stempeg.read_stems_async(
+                stempeg.example_stem_path(),
+                start=start,
+                duration=duration,
+                info=info,
+                merge_streams=merge_streams
+            )
+            for _ in range(4)
+        ])
+
+    for S_async, rate_async in asyncio.run(main()):
+        assert rate_async == rate
+        assert np.array_equal(S_async, S)
+
+
+def test_kill_on_cancel():
+    async def main():
+        # decodes silence until killed
+        process = await stempeg.cmds.create_subprocess_exec(
+            [
+                stempeg.cmds.ffmpeg_path(), '-f', 'lavfi', '-i', 'anullsrc',
+                '-f', 'null', '-'
+            ],
+            stdin=sp.DEVNULL,
+            stdout=sp.DEVNULL,
+            stderr=sp.DEVNULL
+        )
+        task = asyncio.ensure_future(
+            stempeg.cmds.kill_on_cancel(process, process.wait())
+        )
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return process.returncode
+
+    assert asyncio.run(main()) is not None
+
+
+@pytest.mark.parametrize(
+    "codec", ["pcm_s16le", "pcm_s32le", "pcm_f32le", "pcm_f64le"]
+)
+@pytest.mark.parametrize(
+    "reader", [stempeg.StreamsReader(), stempeg.ChannelsReader()]
+)
+def test_read_wav_memmap(tmp_path, monkeypatch, codec, reader):
+    path = str(tmp_path / "stems.wav")
+    S = np.random.random((3, 44100, 2)) - 0.5
+    stempeg.write_stems(
+        path, S, sample_rate=44100, writer=stempeg.ChannelsWriter(codec=codec)
+    )
+    kwargs = dict(reader=reader, start=0.1234567, duration=0.5, always_3d=True)
+
+    with stempeg.cmds.count_subprocesses() as counter:
+        S_wav, rate = stempeg.read_stems(path, **kwargs)
+    assert counter.count == 0
+
+    # decode with ffmpeg
+    monkeypatch.setattr(stempeg.wav, "read_header", lambda filename: None)
+    S_ffmpeg, _ = stempeg.read_stems(path, **kwargs)
+    assert rate == 44100
+    assert S_wav.dtype == S_ffmpeg.dtype
+    assert np.array_equal(S_wav, S_ffmpeg)
+
+
+def test_read_wav_views(tmp_path):
+    path = str(tmp_path / "stems.wav")
+    S = (np.random.random((3, 4096, 2)) - 0.5).astype(np.float32)
+    stempeg.write_stems(
+        path, S, sample_rate=44100,
+        writer=stempeg.ChannelsWriter(codec='pcm_f32le')
+    )
+    reader = stempeg.ChannelsReader()
+
+    S_view, _ = stempeg.read_stems(
+        path, reader=reader, dtype=np.float32, mmap=True
+    )
+    assert isinstance(S_view, np.memmap)
+    assert not S_view.flags.writeable
+    assert np.array_equal(S_view, S)
+
+    # copies by default
+    S_copy, _ = stempeg.read_stems(path, reader=reader, dtype=np.float32)
+    assert S_copy.flags.writeable
+    assert np.array_equal(S_copy, S)
+
+    out = np.zeros((3, 1024, 2))
+    S_out, _ = stempeg.read_stems(path, reader=reader, out=out)
+    assert np.shares_memory(S_out, out)
+    assert np.array_equal(S_out, S[:, :1024])
+
+    # resampling requires ffmpeg
+    with stempeg.cmds.count_subprocesses() as counter:
+        S_resampled, rate = stempeg.read_stems(
+            path, reader=reader, sample_rate=22050
+        )
+    assert counter.count == 1
+    assert rate == 22050
+
+
+def test_read_mp3_length(tmp_path):
+    # the `duration_ts` of mp3 streams is in units of 1/14112000 s
+    path = str(tmp_path / "sine.mp3")
+    x = np.sin(np.arange(5 * 44100) / 10.0)[:, None].repeat(2, axis=1)
+    stempeg.write_audio(path, x * 0.5, sample_rate=44100)
+    info = stempeg.Info(path)
+    assert info.audio_streams[0]['time_base'] == '1/14112000'
+    assert abs(info.samples(0) - 5 * 44100) < 4096
+
+    S, rate = stempeg.read_stems(path, info=info)
+    assert abs(S.shape[0] - 5 * 44100) < 4096
+    # the output is not a view into an oversized buffer
+    assert S.base is None or S.base.size < 2 * S.size
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import stempeg
+
+
+@pytest.fixture(scope="module")
+def stems():
+    return stempeg.read_stems(stempeg.example_stem_path(), dtype=np.float32)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = str(tmp_path / "track.stems")
+    stempeg.convert_to_store(
+        stempeg.example_stem_path(), path, chunk_size=10000
+    )
+    return path
+
+
+def test_convert(store_path, stems):
+    S, rate = stems
+    with stempeg.StemStore(store_path) as store:
+        assert store.sample_rate == rate
+        assert store.nb_stems == S.shape[0]
+        assert store.nb_samples == S.shape[1]
+        assert store.nb_channels == S.shape[2]
+        assert len(store.titles) == S.shape[0]
+        S_store, rate_store = store.read()
+
+    assert rate_store == rate
+    assert np.array_equal(S_store, S)
+
+
+@pytest.mark.parametrize("start,duration,stem_id", [
+    (1.3, 0.77, [1, 3]),
+    (0.43, 0.2375736960895036, 2),
+    (5.9, 3.0, None),
+    (0.0, 0.1, 0),
+])
+def test_excerpts(store_path, start, duration, stem_id):
+    S, _ = stempeg.read_stems(
+        stempeg.example_stem_path(),
+        start=start,
+        duration=duration,
+        stem_id=stem_id,
+        dtype=np.float32
+    )
+    S_store, _ = stempeg.read_store(
+        store_path, start=start, duration=duration, stem_id=stem_id
+    )
+    assert np.array_equal(S_store, S)
+
+
+def test_samples_out(store_path, stems):
+    S, _ = stems
+    out = np.zeros((5, 20000, 2), dtype=np.float64)
+    S_store, _ = stempeg.read_store(
+        store_path, start=9000, duration=30000, time_unit="samples", out=out
+    )
+    assert np.shares_memory(S_store, out)
+    assert np.array_equal(S_store, S[:, 9000:29000])
+
+
+def test_write_store(tmp_path):
+    path = str(tmp_path / "random.stems")
+    S = np.random.random((2, 1001, 1)).astype(np.float32)
+    stempeg.write_store(path, S, 8000, titles=["a", "b"], chunk_size=100)
+    with stempeg.StemStore(path) as store:
+        assert store.titles == ["a", "b"]
+        S_store, rate = store.read(always_3d=True)
+    assert rate == 8000
+    assert np.array_equal(S_store, S)
+
+    with pytest.raises(ValueError):
+        stempeg.StemStore(stempeg.example_stem_path())
+
+
+def test_export(tmp_path, store_path):
+    path = str(tmp_path / "export.stem.m4a")
+    stempeg.export_store(store_path, path)
+    info = stempeg.Info(path)
+    assert info.nb_audio_streams == 5
+
+    # the titles of the store do not leak into the writer
+    writer = stempeg.StreamsWriter()
+    stempeg.export_store(store_path, path, writer=writer)
+    assert writer.stem_names is None
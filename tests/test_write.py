@@ -1,3 +1,4 @@
+import asyncio
 from stempeg.write import ChannelsWriter
 import stempeg
 import numpy as np
@@ -7,6 +8,7 @@ import subprocess as sp
 import json
 import os
 import codecs
+import tracemalloc
 
 
 @pytest.fixture(params=[1, 4])
@@ -160,7 +162,10 @@ def ordered(obj):
         return obj
 
 @pytest.mark.optional
-def test_nistems():
+@pytest.mark.parametrize(
+    "kwargs", [{}, {'max_workers': 2}, {'single_pass': True}]
+)
+def test_nistems(kwargs):
     mp4exc = stempeg.cmds.find_cmd("MP4Box")
 
     stems, rate = stempeg.read_stems(stempeg.example_stem_path())
@@ -173,16 +178,27 @@ def test_nistems():
             tempfile.name,
             stems,
             sample_rate=rate,
-            writer=stempeg.NIStemsWriter()
+            writer=stempeg.NIStemsWriter(**kwargs)
         )
+        # only the mixture is enabled for playback
+        info = stempeg.Info(tempfile.name)
+        assert [
+            stream['disposition']['default'] for stream in info.audio_streams
+        ] == [1, 0, 0, 0, 0]
+
+        with open(stempeg.default_metadata()) as f:
+            d_metadata = json.load(f)
+        assert ordered(info.stem_metadata) == ordered(d_metadata)
+
+        if mp4exc is None:
+            return
+
         callArgs = [mp4exc]
         callArgs.extend(["-dump-udta", "0:stem", tempfile.name])
         sp.check_call(callArgs)
 
         root, ext = os.path.splitext(tempfile.name)
         udtaFile = root + "_stem.udta"
-        with open(stempeg.default_metadata()) as f:
-            d_metadata = json.load(f)
 
         try:
             fileObj = codecs.open(udtaFile, encoding="utf-8")
@@ -193,3 +209,260 @@ def test_nistems():
                 l_metadata = json.load(json_file)
 
         assert ordered(l_metadata) == ordered(d_metadata)
+
+
+def test_stream_channels(audio, nb_channels):
+    with tmp.NamedTemporaryFile(
+        delete=False,
+        suffix='.wav'
+    ) as tempfile:
+        stempeg.write_stems(
+            tempfile.name,
+            audio,
+            sample_rate=44100,
+            writer=ChannelsWriter()
+        )
+        loaded_audio, rate = stempeg.read_stems(
+            tempfile.name,
+            always_3d=True,
+            reader=stempeg.ChannelsReader(nb_channels=nb_channels)
+        )
+        blocks = list(
+            stempeg.stream_stems(
+                tempfile.name,
+                block_size=1000,
+                always_3d=True,
+                reader=stempeg.ChannelsReader(nb_channels=nb_channels)
+            )
+        )
+        assert np.array_equal(loaded_audio, np.concatenate(blocks, axis=1))
+
+
+@pytest.mark.parametrize("writer", [
+    stempeg.StreamsWriter(), stempeg.ChannelsWriter(), stempeg.FilesWriter()
+])
+def test_write_stems_async(writer):
+    audio = np.random.random((3, 4096, 2)) - 0.5
+    with tmp.TemporaryDirectory() as tempdir:
+        if isinstance(writer, stempeg.StreamsWriter):
+            path = os.path.join(tempdir, "test.stem.m4a")
+        else:
+            path = os.path.join(tempdir, "test.wav")
+
+        asyncio.run(stempeg.write_stems_async(path, audio, 44100, writer))
+
+        if isinstance(writer, stempeg.FilesWriter):
+            assert sorted(os.listdir(tempdir)) == [
+                "Stem_0.wav", "Stem_1.wav", "Stem_2.wav"
+            ]
+        elif isinstance(writer, stempeg.ChannelsWriter):
+            loaded_audio, _ = stempeg.read_stems(
+                path, always_3d=True, reader=stempeg.ChannelsReader()
+            )
+            assert np.allclose(loaded_audio, audio, atol=1e-4)
+        else:
+            assert stempeg.Info(path).nb_audio_streams == 3
+
+
+@pytest.mark.parametrize("writer,filename", [
+    (lambda: stempeg.StreamsWriter(codec="flac"), "test.stem.mka"),
+    (stempeg.ChannelsWriter, "test.wav"),
+    (stempeg.FilesWriter, "test.wav"),
+])
+def test_stems_stream_writer(audio, writer, filename):
+    audio = audio - 0.5
+    writer = writer()
+    with tmp.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, filename)
+        with stempeg.StemsStreamWriter(
+            path, audio.shape[0], 44100, writer=writer
+        ) as f:
+            for chunk in np.array_split(audio, 3, axis=1):
+                f.write(chunk)
+        assert f.nb_samples == audio.shape[1]
+
+        if isinstance(writer, stempeg.FilesWriter):
+            loaded_audio = np.stack([
+                stempeg.read_stems(
+                    os.path.join(tempdir, "Stem_%d.wav" % k), always_3d=True
+                )[0][0]
+                for k in range(audio.shape[0])
+            ])
+        elif isinstance(writer, stempeg.ChannelsWriter):
+            loaded_audio, _ = stempeg.read_stems(
+                path,
+                always_3d=True,
+                reader=stempeg.ChannelsReader(nb_channels=audio.shape[2])
+            )
+        else:
+            loaded_audio, _ = stempeg.read_stems(path, always_3d=True)
+        assert np.allclose(loaded_audio, audio, atol=1e-4)
+
+        with pytest.raises(ValueError):
+            f.write(audio)
+
+
+def test_stems_stream_writer_errors(audio):
+    with tmp.TemporaryDirectory() as tempdir:
+        with pytest.raises(RuntimeError):
+            with stempeg.StemsStreamWriter(
+                os.path.join(tempdir, "test.unknown"), audio.shape[0]
+            ) as f:
+                f.write(audio)
+
+        with stempeg.StemsStreamWriter(
+            os.path.join(tempdir, "test.wav"),
+            audio.shape[0],
+            writer=stempeg.ChannelsWriter()
+        ) as f:
+            f.write(audio)
+            with pytest.raises(ValueError):
+                f.write(audio[:, :, :1].repeat(3, axis=2))
+
+
+@pytest.mark.parametrize("direct", [True, False])
+def test_streams_writer_direct(audio, direct):
+    audio = audio - 0.5
+    with tmp.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "test.stem.mka")
+        with stempeg.cmds.count_subprocesses() as counter:
+            stempeg.write_stems(
+                path,
+                audio,
+                sample_rate=44100,
+                writer=stempeg.StreamsWriter(codec="flac", direct=direct)
+            )
+        encodes = [
+            args for args in counter.commands if '-version' not in args
+        ]
+        # the temporary wav file requires a second ffmpeg process
+        assert len(encodes) == (1 if direct else 2)
+
+        loaded_audio, _ = stempeg.read_stems(path, always_3d=True)
+        assert loaded_audio.shape == audio.shape
+        # without the temporary wav file, samples are not quantized
+        atol = 1e-6 if direct else 1e-4
+        assert np.allclose(loaded_audio, audio, atol=atol)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_write_audio_memory(dtype):
+    audio = (np.random.random((44100 * 30, 2)) - 0.5).astype(dtype)
+    with tmp.TemporaryDirectory() as tempdir:
+        tracemalloc.start()
+        stempeg.write_audio(os.path.join(tempdir, "test.wav"), audio)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # no full copy of the input is made
+        assert peak < audio.nbytes / 4
+
+        loaded_audio, _ = stempeg.read_stems(os.path.join(tempdir, "test.wav"))
+        assert np.allclose(loaded_audio, audio, atol=1e-4)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_write_audio_async_memory(dtype):
+    audio = (np.random.random((44100 * 30, 2)) - 0.5).astype(dtype)
+    with tmp.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "test.wav")
+        tracemalloc.start()
+        asyncio.run(stempeg.write_audio_async(path, audio))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # no full copy of the input is made
+        assert peak < audio.nbytes / 4
+
+        loaded_audio, _ = stempeg.read_stems(path)
+        assert np.allclose(loaded_audio, audio, atol=1e-4)
+
+
+def test_write_audio_timeout():
+    audio = np.random.random((44100 * 600, 2)).astype(np.float32)
+    with tmp.TemporaryDirectory() as tempdir:
+        with pytest.raises(sp.TimeoutExpired):
+            stempeg.write_audio(
+                os.path.join(tempdir, "test.flac"), audio, timeout=0.1
+            )
+
+
+def test_transcode(tmp_path):
+    src = stempeg.example_stem_path()
+    S, rate = stempeg.read_stems(src)
+
+    # lossless layouts keep the samples
+    path = str(tmp_path / "channels.wav")
+    with stempeg.cmds.count_subprocesses() as counter:
+        stempeg.transcode(
+            src, path, writer=stempeg.ChannelsWriter(codec='pcm_f32le')
+        )
+    assert counter.count == 2
+    S_wav, _ = stempeg.read_stems(
+        path, reader=stempeg.ChannelsReader(nb_channels=2)
+    )
+    assert np.array_equal(S_wav, S)
+
+    stempeg.transcode(
+        src,
+        (str(tmp_path / "files"), ".flac"),
+        writer=stempeg.FilesWriter(stem_names=["mix", "bass"]),
+        stem_ids=[0, 2]
+    )
+    for k, name in zip([0, 2], ["mix", "bass"]):
+        S_flac, _ = stempeg.read_stems(
+            str(tmp_path / "files" / (name + ".flac"))
+        )
+        assert np.allclose(S_flac, np.clip(S[k], -1, 1), atol=1e-4)
+
+    # the titles of the streams are kept
+    src = str(tmp_path / "named.m4a")
+    stempeg.write_stems(
+        src, S[:3], sample_rate=rate,
+        writer=stempeg.StreamsWriter(stem_names=["mix", "drums", "bass"])
+    )
+    path = str(tmp_path / "streams.m4a")
+    stempeg.transcode(src, path, stem_ids=[2, 0], sample_rate=22050)
+    info = stempeg.Info(path)
+    assert info.title_streams == ["bass", "mix"]
+    assert info.sample_rate(0) == 22050
+
+    with pytest.raises(ValueError):
+        stempeg.transcode(src, path, stem_ids=[3])
+    for writer in [
+        stempeg.StreamsWriter(codec='flac', stem_names=['a', 'b']),
+        stempeg.FilesWriter(stem_names=['a', 'b'])
+    ]:
+        with pytest.raises(RuntimeError):
+            stempeg.transcode(src, path, writer=writer)
+    with pytest.raises(NotImplementedError):
+        stempeg.transcode(src, path, writer=stempeg.write.Writer())
+
+
+def test_transcode_opus(tmp_path):
+    # opus does not support 44.1 kHz, ffmpeg chooses the sample rate
+    path = str(tmp_path / "track.mka")
+    stempeg.transcode(
+        stempeg.example_stem_path(),
+        path,
+        writer=stempeg.StreamsWriter(codec="libopus", bitrate=128000)
+    )
+    info = stempeg.Info(path)
+    assert info.nb_audio_streams == 5
+    assert info.audio_streams[0]['codec_name'] == 'opus'
+    assert info.sample_rate(0) == 48000
+
+
+def test_transcode_nistems(tmp_path):
+    path = str(tmp_path / "track.stem.mp4")
+    stempeg.transcode(
+        stempeg.example_stem_path(),
+        path,
+        writer=stempeg.NIStemsWriter(single_pass=True)
+    )
+    info = stempeg.Info(path)
+    assert info.title_streams == [
+        'mixture', 'drums', 'bass', 'other', 'vocals'
+    ]
+    assert info.stem_metadata['stems'][0]['name'] == 'drums'
+    assert [
+        stream['disposition']['default'] for stream in info.audio_streams
+    ] == [1, 0, 0, 0, 0]